@@ -0,0 +1,42 @@
+"""
+Configuração do gunicorn em produção (gunicorn -c gunicorn.conf.py scpi.wsgi:application).
+
+Cada valor pode ser trocado por variável de ambiente, para comparar
+configurações com o comando medir_tabela sem editar este arquivo.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+# Workers com threads (gthread): as views passam a maior parte do tempo
+# esperando o banco, então as threads de um worker atendem outras
+# requisições nesse meio tempo sem o custo de memória de mais processos.
+# Cada thread usa a sua conexão, tirada do pool do worker (ver settings.py).
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 4)))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Carrega o Django uma vez no processo mestre: os workers nascem prontos e
+# compartilham a memória do código importado
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# Recicla cada worker depois de algumas centenas de requisições; o jitter
+# evita que todos reiniciem ao mesmo tempo
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+# Exportações grandes sem tarefa em segundo plano podem levar mais que o padrão de 30s
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-') or None
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    # Com preload_app, nenhuma conexão aberta no mestre pode ser
+    # herdada pelos workers: cada um abre as suas
+    from django.db import connections
+    connections.close_all()
@@ -51,6 +51,7 @@ MIDDLEWARE = [
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'scpiapp.replica.FixarPrimarioMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -98,13 +99,57 @@ DATABASES = {
     }
 }
 
-db_from_env = dj_database_url.config(conn_max_age=600)
+db_from_env = dj_database_url.config()
 DATABASES['default'].update(db_from_env)
 
-# 
-if 'postgresql' in DATABASES['default']['ENGINE']:
+# O init_command acima só existe no MySQL (DATABASE_URL pode apontar para PostgreSQL ou SQLite)
+if 'mysql' not in DATABASES['default']['ENGINE']:
     DATABASES['default']['OPTIONS'] = {}
 
+# Réplica de leitura opcional (DATABASE_REPLICA_URL): a lista de tabelas, as
+# páginas das tabelas, as exportações, o painel e a auditoria leem dela; as
+# gravações vão sempre para o principal (ver scpiapp/replica.py). Nos testes
+# ela aponta para o mesmo banco de testes do principal.
+SCPI_REPLICA = None
+if os.environ.get('DATABASE_REPLICA_URL'):
+    SCPI_REPLICA = 'replica'
+    DATABASES[SCPI_REPLICA] = dj_database_url.parse(os.environ['DATABASE_REPLICA_URL'])
+    DATABASES[SCPI_REPLICA]['TEST'] = {'MIRROR': 'default'}
+
+# Por quantos segundos depois de uma gravação o navegador lê só do principal:
+# deve cobrir o atraso normal da réplica
+SCPI_REPLICA_FIXAR_SEGUNDOS = int(os.environ.get('SCPI_REPLICA_FIXAR_SEGUNDOS', 10))
+
+DATABASE_ROUTERS = ['scpiapp.replica.RoteadorReplica']
+
+# Conexões: no PostgreSQL, um pool do próprio driver (psycopg 3) em cada
+# worker, do tamanho das threads do gunicorn, com a conexão verificada antes
+# de ser entregue; nos outros bancos, que não têm pool no Django, conexões
+# persistentes por thread. Em ambos os casos o Django testa a conexão antes
+# de reusá-la (CONN_HEALTH_CHECKS), em vez de falhar na primeira consulta
+# depois de o banco ter fechado uma conexão ociosa.
+SCPI_DB_POOL = os.environ.get('SCPI_DB_POOL', '1') == '1'
+SCPI_DB_POOL_MAXIMO = int(os.environ.get('SCPI_DB_POOL_MAXIMO', os.environ.get('GUNICORN_THREADS', 4)))
+
+for banco in DATABASES.values():
+    banco['CONN_HEALTH_CHECKS'] = True
+    if 'postgresql' in banco['ENGINE'] and SCPI_DB_POOL:
+        from psycopg_pool import ConnectionPool
+
+        # O pool substitui as conexões persistentes: o Django exige CONN_MAX_AGE 0
+        banco['CONN_MAX_AGE'] = 0
+        banco['OPTIONS'] = {
+            **banco.get('OPTIONS', {}),
+            'pool': {
+                'min_size': 1,
+                'max_size': SCPI_DB_POOL_MAXIMO,
+                'timeout': 10,
+                'check': ConnectionPool.check_connection,
+            },
+        }
+    else:
+        banco['CONN_MAX_AGE'] = int(os.environ.get('SCPI_DB_CONN_MAX_AGE', 600))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -147,6 +192,51 @@ if not DEBUG:
     STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
     STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# Arquivos enviados e gerados pelas tarefas em segundo plano
+
+MEDIA_ROOT = os.environ.get('SCPI_MEDIA_ROOT', os.path.join(BASE_DIR, 'media'))
+
+
+# Tarefas em segundo plano (comando processar_tarefas)
+# Exportações com mais linhas que o limite e planilhas maiores que o limite
+# de upload (em bytes) são enfileiradas em vez de processadas na requisição.
+
+SCPI_TAREFAS_LIMITE_LINHAS = int(os.environ.get('SCPI_TAREFAS_LIMITE_LINHAS', 5000))
+SCPI_TAREFAS_LIMITE_UPLOAD = int(os.environ.get('SCPI_TAREFAS_LIMITE_UPLOAD', 1024 * 1024))
+SCPI_TAREFAS_DIAS_RETENCAO = 7
+
+# Eventos de auditoria mais antigos que a retenção (em dias) são movidos,
+# por mês completo, para arquivos compactados pelo comando arquivar_auditoria
+
+SCPI_AUDITORIA_DIAS_RETENCAO = int(os.environ.get('SCPI_AUDITORIA_DIAS_RETENCAO', 365))
+
+# Cache de páginas (ver scpiapp/cache_paginas.py). A versão de cada tabela
+# fica no banco, então o cache pode ser local a cada worker (locmem); com
+# SCPI_CACHE_DIR, todos os workers compartilham um cache em arquivos.
+
+if os.environ.get('SCPI_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['SCPI_CACHE_DIR'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+SCPI_CACHE_SEGUNDOS = int(os.environ.get('SCPI_CACHE_SEGUNDOS', 600))
+
+# Exportações CSV e Excel já geradas ficam em disco até a próxima alteração na
+# tabela (ver scpiapp/cache_exportacoes.py); acima do limite, em bytes, as
+# usadas há mais tempo são removidas
+
+SCPI_EXPORTACOES_DIR = os.environ.get('SCPI_EXPORTACOES_DIR', os.path.join(MEDIA_ROOT, 'cache', 'exportacoes'))
+SCPI_EXPORTACOES_LIMITE_BYTES = int(os.environ.get('SCPI_EXPORTACOES_LIMITE_BYTES', 512 * 1024 * 1024))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
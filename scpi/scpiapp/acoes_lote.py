@@ -0,0 +1,69 @@
+from django.db import transaction
+
+from .auditoria import (
+    CAMPOS_AUDITADOS_PROCESSO, auditoria_em_lote, calcular_alteracoes, gerar_detalhes_processo,
+    registrar_auditoria, valores_auditados
+)
+from .models import Auditoria
+
+# Ações da barra de ações em lote da tabela de processos
+ACAO_STATUS = 'status'
+ACAO_SETOR = 'setor'
+ACAO_MOVER = 'mover'
+ACAO_EXCLUIR = 'excluir'
+ACOES_EM_LOTE = (ACAO_STATUS, ACAO_SETOR, ACAO_MOVER, ACAO_EXCLUIR)
+
+
+def aplicar_acao_em_lote(processos, acao, usuario, valor=None, destino=None):
+    """
+    Aplica a ação a todos os processos do queryset com um único UPDATE (ou
+    DELETE), numa transação. Os processos são lidos uma vez, antes, só para
+    a auditoria, cujos eventos são gravados juntos num lote. Processos que
+    já têm o valor pedido ficam de fora. Retorna quantos foram alterados.
+    """
+    # Os filtros vão direto no UPDATE/DELETE, sem "id IN (SELECT ... FROM
+    # scpiapp_processo)": o MySQL não aceita uma subconsulta na própria
+    # tabela alterada (erro 1093) e uma lista de ids esbarraria no limite de
+    # parâmetros com milhares de processos
+    if acao == ACAO_MOVER:
+        alteracao = {'tabela': destino}
+        alvo = processos.exclude(tabela=destino)
+    elif acao in (ACAO_STATUS, ACAO_SETOR):
+        alteracao = {acao: valor}
+        alvo = processos.exclude(**alteracao)
+    else:
+        alteracao = None
+        alvo = processos
+
+    with transaction.atomic(), auditoria_em_lote():
+        atuais = list(alvo.select_related('tabela'))
+        for processo in atuais:
+            if alteracao is None:
+                registrar_auditoria(
+                    usuario=usuario,
+                    acao=Auditoria.AcoesAuditoria.EXCLUIR,
+                    tabela=processo.tabela,
+                    detalhes=gerar_detalhes_processo(processo, Auditoria.AcoesAuditoria.EXCLUIR),
+                )
+                continue
+            antes = valores_auditados(processo, CAMPOS_AUDITADOS_PROCESSO)
+            for campo, novo in alteracao.items():
+                setattr(processo, campo, novo)
+            if not calcular_alteracoes(antes, valores_auditados(processo, CAMPOS_AUDITADOS_PROCESSO)):
+                continue
+            registrar_auditoria(
+                usuario=usuario,
+                acao=Auditoria.AcoesAuditoria.ATUALIZAR,
+                processo=processo,
+                tabela=processo.tabela,
+                detalhes=gerar_detalhes_processo(processo, Auditoria.AcoesAuditoria.ATUALIZAR, antes=antes),
+            )
+
+        if not atuais:
+            return 0
+        # A mesma seleção da leitura
+        if alteracao is None:
+            alvo.delete()
+        else:
+            alvo.update(**alteracao)
+    return len(atuais)
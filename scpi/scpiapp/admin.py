@@ -1,11 +1,16 @@
 from django.contrib import admin
-from .models import Usuario, TabelaProcessos, Processo, Auditoria
+from .models import Usuario, TabelaProcessos, Processo, Auditoria, ArquivoAuditoria
 
 class AuditoriaAdmin(admin.ModelAdmin):
-    list_display = ('processo', 'usuario', 'acao', 'data_evento', 'detalhes')
+    list_display = ('numero_processo', 'usuario', 'acao', 'data_evento')
     list_filter = ('acao', 'usuario', 'data_evento')
-    search_fields = ('processo__numero_processo', 'usuario__nome', 'detalhes')
-    readonly_fields = ('processo', 'usuario', 'acao', 'data_evento', 'detalhes')
+    list_select_related = ('usuario',)
+    # Busca exata pelo número, na coluna indexada, em vez de LIKE nos detalhes
+    search_fields = ('=numero_processo',)
+    readonly_fields = (
+        'processo', 'tabela', 'usuario', 'acao', 'data_evento', 'detalhes',
+        'numero_processo', 'id_processo', 'id_tabela'
+    )
 
     def has_add_permission(self, request):
         return False
@@ -13,7 +18,16 @@ class AuditoriaAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         return False
 
+class ArquivoAuditoriaAdmin(admin.ModelAdmin):
+    list_display = ('mes', 'quantidade', 'primeiro_evento', 'ultimo_evento', 'arquivo')
+    readonly_fields = ('mes', 'arquivo', 'quantidade', 'primeiro_evento', 'ultimo_evento', 'data_criacao')
+    exclude = ('acoes', 'usuarios', 'processos', 'tabelas')
+
+    def has_add_permission(self, request):
+        return False
+
 admin.site.register(Usuario)
 admin.site.register(TabelaProcessos)
 admin.site.register(Processo)
 admin.site.register(Auditoria, AuditoriaAdmin)
+admin.site.register(ArquivoAuditoria, ArquivoAuditoriaAdmin)
@@ -0,0 +1,423 @@
+import base64
+import binascii
+import json
+import logging
+from collections import defaultdict
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.contrib.auth import authenticate
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.forms.models import model_to_dict
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from .auditoria import (
+    CAMPOS_AUDITADOS_PROCESSO, CAMPOS_AUDITADOS_TABELA, auditoria_em_lote, gerar_detalhes_processo,
+    gerar_detalhes_tabela, registrar_auditoria, registrar_criacao_processos, valores_auditados
+)
+from .contadores import contadores_adiados
+from .forms import ProcessoApiForm, TabelaForm
+from .models import Auditoria, Processo, TabelaProcessos, Usuario
+from .paginacao import a_partir_do_cursor, codificar_cursor, decodificar_cursor
+
+logger = logging.getLogger(__name__)
+
+# Operações (criar + atualizar + excluir) aceitas numa requisição em lote
+LIMITE_LOTE_API = 5000
+
+# Linhas por página das listagens NDJSON
+TAMANHO_PAGINA_API = 1000
+LIMITE_PAGINA_API = 10000
+
+# Lidas do cursor do banco a cada ida, como nas exportações
+TAMANHO_LOTE_LEITURA = 2000
+
+CAMPOS_PROCESSO = tuple(ProcessoApiForm._meta.fields)
+CAMPOS_LISTAGEM_PROCESSO = ('id', 'tabela_id', *CAMPOS_PROCESSO, 'data_criacao', 'data_atualizacao')
+CAMPOS_LISTAGEM_TABELA = (
+    'id', 'nome', 'descricao', 'total_processos', 'processos_cic', 'processos_dpq',
+    'processos_em_andamento', 'processos_concluidos', 'data_criacao', 'data_atualizacao',
+)
+
+
+def _erro(mensagem, status=400, **extras):
+    return JsonResponse({'erro': mensagem, **extras}, status=status)
+
+
+def _usuario_basic(request):
+    cabecalho = request.META.get('HTTP_AUTHORIZATION', '')
+    tipo, _, credenciais = cabecalho.partition(' ')
+    if tipo.lower() != 'basic' or not credenciais:
+        return None
+    try:
+        username, _, senha = base64.b64decode(credenciais).decode('utf-8').partition(':')
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+    return authenticate(request, username=username, password=senha)
+
+
+def api_autenticada(view):
+    """
+    Aceita a sessão do site ou HTTP Basic, para integrações. Sem CSRF:
+    as escritas exigem corpo application/json, que um formulário de outro
+    site não consegue enviar.
+    """
+    @csrf_exempt
+    @wraps(view)
+    def _view(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            usuario = _usuario_basic(request)
+            if usuario is None:
+                resposta = _erro('Autenticação necessária.', status=401)
+                resposta['WWW-Authenticate'] = 'Basic realm="SCPI"'
+                return resposta
+            request.user = usuario
+        return view(request, *args, **kwargs)
+    return _view
+
+
+def _ler_lote(request):
+    """
+    Lê o corpo JSON de uma requisição em lote. Retorna ((operações, dados), None)
+    ou (None, resposta de erro).
+    """
+    if request.content_type != 'application/json':
+        return None, _erro('O corpo deve ser application/json.', status=415)
+    try:
+        dados = json.loads(request.body)
+    except ValueError:
+        return None, _erro('JSON inválido.')
+    if not isinstance(dados, dict):
+        return None, _erro('O corpo deve ser um objeto JSON.')
+
+    operacoes = {}
+    for chave in ('criar', 'atualizar', 'excluir'):
+        valor = dados.get(chave) or []
+        if not isinstance(valor, list):
+            return None, _erro(f'"{chave}" deve ser uma lista.')
+        operacoes[chave] = valor
+    if sum(len(valor) for valor in operacoes.values()) > LIMITE_LOTE_API:
+        return None, _erro(f'No máximo {LIMITE_LOTE_API} operações por requisição.', status=413)
+    if not all(isinstance(item, dict) for item in operacoes['criar'] + operacoes['atualizar']):
+        return None, _erro('Os itens de "criar" e "atualizar" devem ser objetos.')
+    if not all(isinstance(item, int) and not isinstance(item, bool) for item in operacoes['excluir']):
+        return None, _erro('"excluir" deve ser uma lista de ids.')
+    return (operacoes, dados), None
+
+
+def _erros_do_formulario(form):
+    return {campo: list(mensagens) for campo, mensagens in form.errors.items()}
+
+
+def _ids_para_atualizar(itens):
+    ids = [item.get('id') for item in itens]
+    if not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+        return None
+    return ids
+
+
+def _ndjson(linhas):
+    for linha in linhas:
+        yield json.dumps(linha, ensure_ascii=False, cls=DjangoJSONEncoder).encode('utf-8') + b'\n'
+
+
+def _listagem_ndjson(request, consulta, campos):
+    """
+    Uma página da listagem em NDJSON, um objeto por linha, em ordem de
+    data_atualizacao e id. Quando há mais linhas, o cabeçalho Link (e
+    X-Cursor-Proximo) traz o cursor da próxima página; sincronizar é pedir
+    páginas até não haver próxima e guardar o último cursor para a próxima vez.
+    """
+    try:
+        limite = min(max(int(request.GET.get('limite', TAMANHO_PAGINA_API)), 1), LIMITE_PAGINA_API)
+    except ValueError:
+        return _erro('"limite" deve ser um número.')
+    cursor = request.GET.get('depois')
+    posicao = decodificar_cursor(cursor, consulta.model._meta.get_field('data_atualizacao'))
+    if cursor and posicao is None:
+        return _erro('Cursor inválido.')
+
+    consulta = a_partir_do_cursor(consulta, 'data_atualizacao', posicao)
+    # A linha que fecha a página é lida antes, só pelo índice, para o cursor
+    # da próxima página ir nos cabeçalhos de uma resposta enviada aos poucos
+    fim = list(consulta.values_list('data_atualizacao', 'id')[limite - 1:limite + 1])
+
+    resposta = StreamingHttpResponse(
+        _ndjson(consulta.values(*campos)[:limite].iterator(chunk_size=TAMANHO_LOTE_LEITURA)),
+        content_type='application/x-ndjson'
+    )
+    if len(fim) > 1:
+        proximo = codificar_cursor(*fim[0])
+        parametros = request.GET.copy()
+        parametros['depois'] = proximo
+        resposta['Link'] = f'<{request.path}?{urlencode(list(parametros.items()))}>; rel="next"'
+        resposta['X-Cursor-Proximo'] = proximo
+    return resposta
+
+
+@api_autenticada
+@require_GET
+def listar_tabelas(request):
+    return _listagem_ndjson(request, TabelaProcessos.objects.all(), CAMPOS_LISTAGEM_TABELA)
+
+
+@api_autenticada
+@require_GET
+def listar_processos(request):
+    processos = Processo.objects.all()
+    tabela_id = request.GET.get('tabela')
+    if tabela_id:
+        if not tabela_id.isdigit():
+            return _erro('"tabela" deve ser um id.')
+        processos = processos.filter(tabela_id=int(tabela_id))
+    return _listagem_ndjson(request, processos, CAMPOS_LISTAGEM_PROCESSO)
+
+
+@api_autenticada
+@require_POST
+def lote_processos(request):
+    """
+    Cria, atualiza e exclui processos numa única transação:
+
+        {"tabela": 1, "criar": [{...}], "atualizar": [{"id": 7, ...}], "excluir": [8, 9]}
+
+    Os campos são os do ProcessoForm, validados da mesma forma; nas
+    atualizações só os campos enviados mudam, e "tabela" move o processo.
+    Se qualquer item for inválido, nada é gravado e a resposta traz os
+    erros de cada item.
+    """
+    lido, erro = _ler_lote(request)
+    if erro:
+        return erro
+    operacoes, dados = lido
+    criar, atualizar, excluir = operacoes['criar'], operacoes['atualizar'], operacoes['excluir']
+    ids_atualizar = _ids_para_atualizar(atualizar)
+    if ids_atualizar is None:
+        return _erro('Cada item de "atualizar" precisa de um "id".')
+
+    if set(ids_atualizar) & set(excluir):
+        return _erro('Um processo não pode ser atualizado e excluído no mesmo lote.')
+
+    # Tudo o que a validação precisa é lido em poucas consultas, para o lote inteiro
+    ids_tabelas = {item.get('tabela') for item in criar + atualizar} | {dados.get('tabela')}
+    tabelas = TabelaProcessos.objects.in_bulk(
+        [pk for pk in ids_tabelas if isinstance(pk, int) and not isinstance(pk, bool)]
+    )
+    existentes = Processo.objects.select_related('tabela').in_bulk(ids_atualizar + excluir)
+
+    def tabela_do_item(item, padrao):
+        valor = item.get('tabela', padrao)
+        return tabelas.get(valor) if isinstance(valor, int) else None
+
+    erros = []
+    novos = []
+    alterados = []
+    for indice, item in enumerate(criar):
+        form = ProcessoApiForm(data=item)
+        erros_item = {} if form.is_valid() else _erros_do_formulario(form)
+        tabela = tabela_do_item(item, dados.get('tabela'))
+        if tabela is None:
+            erros_item['tabela'] = ['Tabela não encontrada.']
+        if erros_item:
+            erros.append({'operacao': 'criar', 'indice': indice, 'erros': erros_item})
+            continue
+        processo = form.save(commit=False)
+        processo.tabela = tabela
+        novos.append((indice, processo))
+
+    for indice, item in enumerate(atualizar):
+        processo = existentes.get(item['id'])
+        if processo is None:
+            erros.append({'operacao': 'atualizar', 'indice': indice, 'erros': {'id': ['Processo não encontrado.']}})
+            continue
+        antes = valores_auditados(processo, CAMPOS_AUDITADOS_PROCESSO)
+        # Campos não enviados ficam como estão
+        form = ProcessoApiForm(
+            data={**model_to_dict(processo, CAMPOS_PROCESSO), **item}, instance=processo
+        )
+        erros_item = {} if form.is_valid() else _erros_do_formulario(form)
+        tabela = tabela_do_item(item, processo.tabela_id)
+        if tabela is None and 'tabela' in item:
+            erros_item['tabela'] = ['Tabela não encontrada.']
+        if erros_item:
+            erros.append({'operacao': 'atualizar', 'indice': indice, 'erros': erros_item})
+            continue
+        processo = form.save(commit=False)
+        if 'tabela' in item:
+            processo.tabela = tabela
+        alterados.append((indice, processo, antes))
+
+    for indice, pk in enumerate(excluir):
+        if pk not in existentes:
+            erros.append({'operacao': 'excluir', 'indice': indice, 'erros': {'id': ['Processo não encontrado.']}})
+
+    erros += _numeros_repetidos(novos, alterados, excluir)
+    if erros:
+        return _erro('Nenhuma alteração foi gravada.', erros=erros)
+    novos = [processo for _, processo in novos]
+    alterados = [(processo, antes) for _, processo, antes in alterados]
+
+    try:
+        with transaction.atomic(), contadores_adiados(), auditoria_em_lote():
+            # Exclusões primeiro: liberam números de processo para o restante do lote
+            for pk in excluir:
+                processo = existentes[pk]
+                registrar_auditoria(
+                    usuario=request.user,
+                    acao=Auditoria.AcoesAuditoria.EXCLUIR,
+                    tabela=processo.tabela,
+                    detalhes=gerar_detalhes_processo(processo, Auditoria.AcoesAuditoria.EXCLUIR),
+                )
+            Processo.objects.filter(pk__in=excluir).delete()
+
+            if alterados:
+                Processo.objects.bulk_update(
+                    [processo for processo, _ in alterados], [*CAMPOS_PROCESSO, 'tabela']
+                )
+            for processo, antes in alterados:
+                registrar_auditoria(
+                    usuario=request.user,
+                    acao=Auditoria.AcoesAuditoria.ATUALIZAR,
+                    processo=processo,
+                    tabela=processo.tabela,
+                    detalhes=gerar_detalhes_processo(processo, Auditoria.AcoesAuditoria.ATUALIZAR, antes=antes),
+                )
+
+            Processo.objects.bulk_create(novos)
+            por_tabela = defaultdict(list)
+            for processo in novos:
+                por_tabela[processo.tabela].append(processo)
+            for tabela, processos in por_tabela.items():
+                registrar_criacao_processos(request.user, processos, tabela)
+    except IntegrityError:
+        return _erro_de_conflito()
+
+    return JsonResponse({
+        # Na ordem de "criar"; bulk_create preenche os ids também no MySQL
+        'criados': [processo.pk for processo in novos],
+        'atualizados': len(alterados),
+        'excluidos': len(excluir),
+    })
+
+
+def _erro_de_conflito():
+    # Conflito com uma gravação concorrente: a transação inteira foi desfeita.
+    # O texto do banco (restrições e tabelas) fica só no log
+    logger.exception("Conflito ao gravar um lote da API")
+    return _erro('Conflito com outra gravação: nenhuma alteração foi gravada. Tente novamente.', status=409)
+
+
+def _numeros_repetidos(novos, alterados, excluidos):
+    """Erros de número de processo repetido, no lote ou no banco, com uma consulta só."""
+    itens = [('atualizar', indice, processo) for indice, processo, _ in alterados]
+    itens += [('criar', indice, processo) for indice, processo in novos]
+    proprios = {processo.pk for _, processo, _ in alterados} | set(excluidos)
+    numeros = [processo.numero_processo for _, _, processo in itens if processo.numero_processo]
+    no_banco = set(
+        Processo.objects.filter(numero_processo__in=numeros).exclude(pk__in=proprios)
+        .values_list('numero_processo', flat=True)
+    ) if numeros else set()
+
+    erros = []
+    vistos = set()
+    for operacao, indice, processo in itens:
+        numero = processo.numero_processo
+        if not numero:
+            continue
+        if numero in no_banco or numero in vistos:
+            erros.append({'operacao': operacao, 'indice': indice, 'erros': {
+                'numero_processo': [f"Processo com número '{numero}' já existe no sistema."]
+            }})
+        vistos.add(numero)
+    return erros
+
+
+@api_autenticada
+@require_POST
+def lote_tabelas(request):
+    """
+    Cria, atualiza e exclui tabelas numa única transação, no mesmo formato
+    de lote_processos, com os campos do TabelaForm. Excluir uma tabela
+    exclui os seus processos.
+    """
+    lido, erro = _ler_lote(request)
+    if erro:
+        return erro
+    operacoes, _ = lido
+    criar, atualizar, excluir = operacoes['criar'], operacoes['atualizar'], operacoes['excluir']
+    ids_atualizar = _ids_para_atualizar(atualizar)
+    if ids_atualizar is None:
+        return _erro('Cada item de "atualizar" precisa de um "id".')
+    existentes = TabelaProcessos.objects.in_bulk(ids_atualizar + excluir)
+
+    erros = []
+    novas = []
+    alteradas = []
+    for indice, item in enumerate(criar):
+        form = TabelaForm(data=item)
+        if not form.is_valid():
+            erros.append({'operacao': 'criar', 'indice': indice, 'erros': _erros_do_formulario(form)})
+            continue
+        novas.append(form.save(commit=False))
+    for indice, item in enumerate(atualizar):
+        tabela = existentes.get(item['id'])
+        if tabela is None:
+            erros.append({'operacao': 'atualizar', 'indice': indice, 'erros': {'id': ['Tabela não encontrada.']}})
+            continue
+        antes = valores_auditados(tabela, CAMPOS_AUDITADOS_TABELA)
+        form = TabelaForm(data={**model_to_dict(tabela, TabelaForm._meta.fields), **item}, instance=tabela)
+        if not form.is_valid():
+            erros.append({'operacao': 'atualizar', 'indice': indice, 'erros': _erros_do_formulario(form)})
+            continue
+        alteradas.append((form.save(commit=False), antes))
+    for indice, pk in enumerate(excluir):
+        if pk not in existentes:
+            erros.append({'operacao': 'excluir', 'indice': indice, 'erros': {'id': ['Tabela não encontrada.']}})
+    if erros:
+        return _erro('Nenhuma alteração foi gravada.', erros=erros)
+
+    try:
+        with transaction.atomic(), auditoria_em_lote():
+            # Tabelas são poucas: cada uma é gravada por save()/delete(), que
+            # também invalidam o cache das páginas
+            for pk in excluir:
+                tabela = existentes[pk]
+                registrar_auditoria(
+                    usuario=request.user,
+                    acao=Auditoria.AcoesAuditoria.EXCLUIR,
+                    detalhes=gerar_detalhes_tabela(tabela, Auditoria.AcoesAuditoria.EXCLUIR),
+                )
+                tabela.delete()
+            for tabela, antes in alteradas:
+                tabela.save()
+                registrar_auditoria(
+                    usuario=request.user,
+                    acao=Auditoria.AcoesAuditoria.ATUALIZAR,
+                    tabela=tabela,
+                    detalhes=gerar_detalhes_tabela(tabela, Auditoria.AcoesAuditoria.ATUALIZAR, antes=antes),
+                )
+            if novas:
+                # Mesmo dono padrão usado por adicionarTabela
+                usuario, _ = Usuario.objects.get_or_create(
+                    id=1, defaults={'nome': 'Usuário Padrão', 'email': 'padrao@example.com'}
+                )
+            for tabela in novas:
+                tabela.usuario = usuario
+                tabela.save()
+                registrar_auditoria(
+                    usuario=request.user,
+                    acao=Auditoria.AcoesAuditoria.CRIAR,
+                    tabela=tabela,
+                    detalhes=gerar_detalhes_tabela(tabela, Auditoria.AcoesAuditoria.CRIAR),
+                )
+    except IntegrityError:
+        return _erro_de_conflito()
+
+    return JsonResponse({
+        'criados': [tabela.pk for tabela in novas],
+        'atualizados': len(alteradas),
+        'excluidos': len(excluir),
+    })
@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def _garantir_indice_busca(sender, using, **kwargs):
+    # No SQLite algumas migrações recriam a tabela de processos e levam junto
+    # os gatilhos que mantêm o índice de busca; eles são recolocados aqui
+    from django.db import connections
+    from .busca import TABELA_BUSCA_SQLITE, instalar_indice_busca
+
+    connection = connections[using]
+    if connection.vendor == 'sqlite' and TABELA_BUSCA_SQLITE in connection.introspection.table_names():
+        instalar_indice_busca(connection)
 
 
 class ScpiappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'scpiapp'
+
+    def ready(self):
+        post_migrate.connect(_garantir_indice_busca, sender=self)
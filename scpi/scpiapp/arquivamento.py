@@ -0,0 +1,173 @@
+import gzip
+import json
+import logging
+import tempfile
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ArquivoAuditoria, Auditoria
+
+logger = logging.getLogger(__name__)
+
+# Eventos lidos do banco por vez ao gerar o arquivo de um mês
+TAMANHO_LOTE_ARQUIVO = 2000
+
+# Filtros da busca no histórico que podem ser resolvidos pelo índice dos arquivos
+CAMPOS_INDICE = {'acao': 'acoes', 'usuario_id': 'usuarios', 'id_processo': 'processos', 'id_tabela': 'tabelas'}
+
+_CAMPOS_EVENTO = (
+    'id', 'data_evento', 'acao', 'usuario', 'processo_id', 'tabela_id', 'detalhes',
+    'numero_processo', 'id_processo', 'id_tabela',
+)
+
+
+def inicio_do_mes(momento):
+    local = timezone.localtime(momento)
+    return timezone.make_aware(datetime(local.year, local.month, 1))
+
+
+def _proximo_mes(inicio):
+    local = timezone.localtime(inicio)
+    return inicio_do_mes(timezone.make_aware(datetime(local.year, local.month, 28)) + timedelta(days=4))
+
+
+def limite_arquivamento(dias=None, agora=None):
+    """
+    Início do mês mais antigo que ainda fica no banco: só meses completos
+    anteriores à janela de retenção são arquivados.
+    """
+    if dias is None:
+        dias = settings.SCPI_AUDITORIA_DIAS_RETENCAO
+    agora = agora or timezone.now()
+    return inicio_do_mes(agora - timedelta(days=dias))
+
+
+def meses_a_arquivar(limite):
+    """Inícios dos meses com eventos anteriores ao limite, do mais antigo ao mais recente."""
+    return [
+        inicio_do_mes(mes)
+        for mes in Auditoria.objects.filter(data_evento__lt=limite).datetimes('data_evento', 'month')
+    ]
+
+
+def arquivar_auditoria(dias=None, agora=None):
+    """
+    Move para arquivos gzip JSONL, um por mês, os eventos de auditoria
+    anteriores à janela de retenção. Cada mês é gravado no armazenamento de
+    arquivos e removido do banco na mesma transação que registra o
+    ArquivoAuditoria, então uma falha no meio não perde nem duplica eventos.
+    Retorna os arquivos criados.
+    """
+    limite = limite_arquivamento(dias, agora)
+    criados = []
+    for inicio in meses_a_arquivar(limite):
+        arquivo = arquivar_mes(inicio, min(_proximo_mes(inicio), limite))
+        if arquivo is not None:
+            criados.append(arquivo)
+    return criados
+
+
+def arquivar_mes(inicio, fim):
+    eventos = Auditoria.objects.filter(data_evento__gte=inicio, data_evento__lt=fim)
+    indice = {campo: set() for campo in CAMPOS_INDICE.values()}
+    quantidade = 0
+    primeiro = ultimo = None
+    ultimo_id = None
+
+    with tempfile.TemporaryFile() as temporario:
+        with gzip.GzipFile(fileobj=temporario, mode='wb') as compactado:
+            for evento in (
+                eventos.select_related('usuario').only('usuario__username', *_CAMPOS_EVENTO)
+                .order_by('id').iterator(chunk_size=TAMANHO_LOTE_ARQUIVO)
+            ):
+                linha = serializar_evento(evento)
+                compactado.write(json.dumps(linha, ensure_ascii=False, cls=DjangoJSONEncoder).encode('utf-8') + b'\n')
+                for filtro, campo in CAMPOS_INDICE.items():
+                    if linha[filtro] is not None:
+                        indice[campo].add(linha[filtro])
+                quantidade += 1
+                ultimo_id = evento.id
+                primeiro = evento.data_evento if primeiro is None else min(primeiro, evento.data_evento)
+                ultimo = evento.data_evento if ultimo is None else max(ultimo, evento.data_evento)
+
+        if not quantidade:
+            return None
+
+        temporario.seek(0)
+        registro = ArquivoAuditoria(
+            mes=timezone.localtime(inicio).date(),
+            quantidade=quantidade,
+            primeiro_evento=primeiro,
+            ultimo_evento=ultimo,
+            **{campo: sorted(valores) for campo, valores in indice.items()}
+        )
+        registro.arquivo.save(f'auditoria-{registro.mes:%Y-%m}.jsonl.gz', File(temporario), save=False)
+
+    try:
+        with transaction.atomic():
+            registro.save()
+            # Eventos gravados depois da leitura (id maior) ficam para a próxima execução
+            eventos.filter(id__lte=ultimo_id).delete()
+    except Exception:
+        registro.arquivo.delete(save=False)
+        raise
+    logger.info("Auditoria de %s arquivada: %s eventos em %s", registro.mes, quantidade, registro.arquivo.name)
+    return registro
+
+
+def serializar_evento(evento):
+    return {
+        'id': evento.id,
+        'data_evento': evento.data_evento.isoformat(),
+        'acao': evento.acao,
+        'usuario_id': evento.usuario_id,
+        # O nome do usuário é guardado porque o usuário pode ser removido depois
+        'usuario': evento.usuario.username if evento.usuario else None,
+        'processo_id': evento.processo_id,
+        'tabela_id': evento.tabela_id,
+        'numero_processo': evento.numero_processo,
+        'id_processo': evento.id_processo,
+        'id_tabela': evento.id_tabela,
+        'detalhes': evento.detalhes,
+    }
+
+
+def buscar_arquivados(inicio=None, fim=None, texto=None, **filtros):
+    """
+    Busca no histórico arquivado. Os filtros exatos aceitos são acao,
+    usuario_id, id_processo e id_tabela; `texto` procura nos detalhes.
+    O índice de cada arquivo descarta os meses que não podem ter resultado
+    antes de abrir qualquer arquivo. Gera os eventos (dicts) em ordem de id.
+    """
+    desconhecidos = set(filtros) - set(CAMPOS_INDICE)
+    if desconhecidos:
+        raise TypeError(f"Filtros inválidos: {', '.join(sorted(desconhecidos))}")
+    filtros = {campo: valor for campo, valor in filtros.items() if valor is not None}
+
+    arquivos = ArquivoAuditoria.objects.order_by('mes', 'id')
+    if inicio is not None:
+        arquivos = arquivos.filter(ultimo_evento__gte=inicio)
+    if fim is not None:
+        arquivos = arquivos.filter(primeiro_evento__lte=fim)
+
+    for arquivo in arquivos:
+        if any(valor not in getattr(arquivo, CAMPOS_INDICE[campo]) for campo, valor in filtros.items()):
+            continue
+        with arquivo.arquivo.open('rb') as bruto, gzip.GzipFile(fileobj=bruto) as compactado:
+            for linha in compactado:
+                evento = json.loads(linha)
+                if any(evento.get(campo) != valor for campo, valor in filtros.items()):
+                    continue
+                if texto and texto.lower() not in json.dumps(evento['detalhes'], ensure_ascii=False).lower():
+                    continue
+                if inicio is not None or fim is not None:
+                    momento = parse_datetime(evento['data_evento'])
+                    if (inicio is not None and momento < inicio) or (fim is not None and momento > fim):
+                        continue
+                yield evento
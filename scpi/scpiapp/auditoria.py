@@ -0,0 +1,268 @@
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Auditoria, Processo
+
+logger = logging.getLogger(__name__)
+
+# Registros de auditoria gravados por INSERT em lotes
+TAMANHO_LOTE_AUDITORIA = 1000
+
+# Lista de usuários do filtro da tela de auditoria
+CHAVE_CACHE_USUARIOS = 'scpi:auditoria:usuarios'
+TEMPO_CACHE_USUARIOS = 300
+
+_lote = threading.local()
+
+
+# Campos comparados nas atualizações, para registrar o antes e o depois
+CAMPOS_AUDITADOS_PROCESSO = (
+    'nome', 'matricula', 'numero_processo', 'data_abertura', 'data_retorno',
+    'setor', 'bolsa', 'status', 'assunto', 'observacoes', 'tabela_id',
+)
+CAMPOS_AUDITADOS_TABELA = ('nome', 'descricao')
+
+
+def valores_auditados(instancia, campos):
+    """Valores atuais dos campos, já no formato gravado no JSON (datas em ISO)."""
+    valores = {}
+    for campo in campos:
+        valor = getattr(instancia, campo)
+        valores[campo] = valor.isoformat() if hasattr(valor, 'isoformat') else valor
+    return valores
+
+
+def calcular_alteracoes(antes, depois):
+    alteracoes = {}
+    for campo, valor in depois.items():
+        anterior = antes.get(campo)
+        # Campo vazio salvo como '' em vez de None pelo formulário não é alteração
+        if anterior == valor or (anterior in ('', None) and valor in ('', None)):
+            continue
+        alteracoes[campo] = {'antes': anterior, 'depois': valor}
+    return alteracoes
+
+
+def gerar_detalhes_processo(processo, acao, tabela=None, antes=None):
+    """
+    Fotografia do processo no momento da ação, montada só com o que já está
+    carregado: a tabela vem do argumento ou do cache da instância, nunca de
+    uma consulta nova. Com `antes` (de valores_auditados, tirado antes da
+    edição), inclui o antes e o depois de cada campo alterado.
+    """
+    if tabela is None and Processo.tabela.is_cached(processo):
+        tabela = processo.tabela
+    detalhes = {
+        'acao': acao,
+        'processo_info': {
+            'id': processo.id,
+            'nome': processo.nome,
+            'matricula': processo.matricula,
+            'numero_processo': processo.numero_processo,
+            'setor': processo.setor,
+            'bolsa': processo.bolsa,
+            'status': processo.status,
+            'tabela_id': processo.tabela_id,
+            'tabela_nome': tabela.nome if tabela is not None else None
+        }
+    }
+    if antes is not None:
+        detalhes['alteracoes'] = calcular_alteracoes(
+            antes, valores_auditados(processo, CAMPOS_AUDITADOS_PROCESSO)
+        )
+    return detalhes
+
+
+def gerar_detalhes_tabela(tabela, acao, antes=None):
+    detalhes = {
+        'acao': acao,
+        'tabela_info': {
+            'id': tabela.id,
+            'nome': tabela.nome,
+            'descricao': tabela.descricao,
+            'data_criacao': tabela.data_criacao.isoformat() if tabela.data_criacao else None
+        }
+    }
+    if antes is not None:
+        detalhes['alteracoes'] = calcular_alteracoes(antes, valores_auditados(tabela, CAMPOS_AUDITADOS_TABELA))
+    return detalhes
+
+
+def chaves_dos_detalhes(detalhes):
+    """numero_processo, id_processo e id_tabela, as colunas indexadas da auditoria."""
+    if not isinstance(detalhes, dict):
+        return None, None, None
+    processo = detalhes.get('processo_info') or {}
+    tabela = detalhes.get('tabela_info') or {}
+    return processo.get('numero_processo'), processo.get('id'), processo.get('tabela_id') or tabela.get('id')
+
+
+def _id_usuario(usuario):
+    # Visitante anônimo (ou nenhum usuário) fica registrado sem usuário
+    if usuario is None or not getattr(usuario, 'is_authenticated', False):
+        return None
+    return usuario.pk
+
+
+def registrar_auditoria(usuario, acao, processo=None, tabela=None, detalhes=None):
+    """
+    Registra uma ação na auditoria. O registro é montado na hora, a partir das
+    instâncias já carregadas, mas só é gravado depois do commit da transação
+    corrente (ou do bloco auditoria_em_lote). Se a transação for desfeita, a
+    ação também não é registrada.
+    """
+    numero_processo, id_processo, id_tabela = chaves_dos_detalhes(detalhes)
+    registro = Auditoria(
+        usuario_id=_id_usuario(usuario),
+        acao=acao,
+        processo_id=processo.pk if processo is not None else None,
+        tabela_id=tabela.pk if tabela is not None else None,
+        detalhes=detalhes,
+        data_evento=timezone.now(),
+        numero_processo=numero_processo,
+        id_processo=id_processo,
+        id_tabela=id_tabela,
+    )
+    pendentes = getattr(_lote, 'registros', None)
+    if pendentes is not None:
+        pendentes.append(registro)
+        return
+    transaction.on_commit(lambda: _gravar([registro]))
+
+
+def registrar_criacao_processos(usuario, processos, tabela=None):
+    """Registra a criação de vários processos de uma vez, como na importação."""
+    for processo in processos:
+        registrar_auditoria(
+            usuario=usuario,
+            acao=Auditoria.AcoesAuditoria.CRIAR,
+            processo=processo if processo.pk is not None else None,
+            tabela=tabela,
+            detalhes=gerar_detalhes_processo(processo, Auditoria.AcoesAuditoria.CRIAR, tabela),
+        )
+
+
+@contextmanager
+def auditoria_em_lote():
+    """
+    Acumula os registros feitos dentro do bloco e, ao sair dele sem erro,
+    agenda uma única gravação em lote para o commit. Usado pela importação:
+    milhares de processos geram poucos INSERTs na auditoria em vez de um por
+    linha. Se o bloco falhar, os registros são descartados.
+    """
+    if getattr(_lote, 'registros', None) is not None:
+        # Já dentro de outro bloco: ele grava tudo no final
+        yield
+        return
+
+    _lote.registros = []
+    try:
+        yield
+        registros = _lote.registros
+    finally:
+        _lote.registros = None
+    if registros:
+        transaction.on_commit(lambda: _gravar(registros))
+
+
+def _gravar(registros):
+    try:
+        Auditoria.objects.bulk_create(registros, batch_size=TAMANHO_LOTE_AUDITORIA)
+    except Exception:
+        # A ação já foi confirmada; a falha da auditoria não deve desfazê-la
+        logger.exception("Erro ao registrar %s evento(s) de auditoria", len(registros))
+        return
+    # Usuário aparecendo pela primeira vez na auditoria entra no filtro da tela
+    usuarios = cache.get(CHAVE_CACHE_USUARIOS)
+    if usuarios is not None:
+        conhecidos = {usuario_id for usuario_id, _ in usuarios}
+        if any(registro.usuario_id not in conhecidos for registro in registros if registro.usuario_id):
+            cache.delete(CHAVE_CACHE_USUARIOS)
+
+
+def eventos_do_processo(processo_id=None, numero_processo=None):
+    """
+    Eventos de um processo, do mais recente para o mais antigo, pelo id ou
+    pelo número. As duas colunas são indexadas junto com a data do evento,
+    então a consulta não depende do tamanho da auditoria.
+    """
+    eventos = Auditoria.objects.select_related('usuario').only(
+        'id', 'acao', 'data_evento', 'detalhes', 'numero_processo', 'id_processo', 'id_tabela',
+        'usuario__username'
+    )
+    if processo_id is not None:
+        eventos = eventos.filter(id_processo=processo_id)
+    else:
+        eventos = eventos.filter(numero_processo=numero_processo)
+    return eventos.order_by('-data_evento', '-id')
+
+
+def intervalo_de_datas(data_inicio=None, data_fim=None):
+    """
+    Converte as datas do filtro (AAAA-MM-DD, inclusivas) num intervalo
+    semiaberto [início, fim) de datetimes, no fuso do sistema. Comparar a
+    coluna direto com os limites, em vez de usar data_evento__date, deixa o
+    banco usar o índice.
+    """
+    limites = []
+    for valor, dias in ((data_inicio, 0), (data_fim, 1)):
+        try:
+            data = parse_date(valor) if valor else None
+        except ValueError:
+            data = None
+        if data is not None:
+            data += timedelta(days=dias)
+            limites.append(timezone.make_aware(datetime.combine(data, time.min)))
+        else:
+            limites.append(None)
+    return tuple(limites)
+
+
+def filtrar_auditorias(acao=None, usuario=None, data_inicio=None, data_fim=None, numero_processo=None):
+    """
+    Eventos de auditoria com os filtros da tela. Cada filtro é uma comparação
+    direta com uma coluna indexada junto com (data_evento, id), a ordem da
+    navegação. `usuario` é o id do usuário ou um trecho do nome de usuário.
+    """
+    auditorias = Auditoria.objects.all()
+    if acao:
+        auditorias = auditorias.filter(acao=acao)
+    if usuario:
+        if str(usuario).isdigit():
+            auditorias = auditorias.filter(usuario_id=int(usuario))
+        else:
+            auditorias = auditorias.filter(
+                usuario_id__in=User.objects.filter(username__icontains=usuario).values('id')
+            )
+    if numero_processo:
+        auditorias = auditorias.filter(numero_processo=numero_processo.strip())
+    inicio, fim = intervalo_de_datas(data_inicio, data_fim)
+    if inicio is not None:
+        auditorias = auditorias.filter(data_evento__gte=inicio)
+    if fim is not None:
+        auditorias = auditorias.filter(data_evento__lt=fim)
+    return auditorias
+
+
+def usuarios_auditados():
+    """
+    Usuários com algum evento na auditoria, para o filtro da tela. A lista
+    muda pouco, então fica em cache por TEMPO_CACHE_USUARIOS segundos; cada
+    usuário é verificado por uma busca no índice (usuario, data_evento, id),
+    sem DISTINCT sobre a auditoria inteira.
+    """
+    def consultar():
+        return list(
+            User.objects.filter(Exists(Auditoria.objects.filter(usuario=OuterRef('pk'))))
+            .order_by('username').values_list('id', 'username')
+        )
+    return cache.get_or_set(CHAVE_CACHE_USUARIOS, consultar, TEMPO_CACHE_USUARIOS)
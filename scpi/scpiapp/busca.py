@@ -0,0 +1,339 @@
+import re
+
+from django.db import connections, router
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Processo, ProcessoBusca
+from .normalizacao import normalizar_numero, normalizar_texto
+
+# Colunas cobertas pelo índice textual, na ordem em que são indexadas. As
+# cópias normalizadas deixam a busca sem acentos e o número sem pontuação
+COLUNAS_BUSCA = ('nome', 'numero_processo', 'assunto', 'nome_busca', 'numero_processo_busca')
+
+# Nomes dos objetos criados no banco para a busca textual
+INDICE_BUSCA = 'processo_busca_idx'
+TABELA_BUSCA_SQLITE = ProcessoBusca._meta.db_table
+
+# Configuração de idioma da busca no PostgreSQL
+CONFIGURACAO_POSTGRES = 'portuguese'
+
+# Peso de cada coluna de COLUNAS_BUSCA na relevância calculada pelo SQLite.
+# O FTS5 já ignora acentos, então nome_busca não soma relevância ao nome
+PESOS_SQLITE = (10.0, 5.0, 1.0, 0.0, 5.0)
+
+# O InnoDB ignora palavras menores que innodb_ft_min_token_size (3 por padrão)
+TAMANHO_MINIMO_TERMO_MYSQL = 3
+
+# Anotação que marca os processos encontrados pela busca por substring, para
+# que anotar_relevancia() não procure no índice textual o que ele não achou
+MARCA_SUBSTRING = 'busca_por_substring'
+
+
+def filtrar_processos(tabela, query):
+    """Processos da tabela, filtrados pela busca do usuário quando houver."""
+    processos = Processo.objects.filter(tabela=tabela)
+    if query:
+        processos = buscar_textual(processos, query)
+    return processos
+
+
+def filtrar_processos_icontains(tabela, query):
+    """Busca antiga por LIKE '%q%', mantida como alternativa e para comparação."""
+    processos = Processo.objects.filter(tabela=tabela)
+    if query:
+        processos = processos.filter(_filtro_icontains(query))
+    return processos
+
+
+def _filtro_icontains(query):
+    return (
+        Q(nome__icontains=query) |
+        Q(numero_processo__icontains=query) |
+        Q(assunto__icontains=query)
+    )
+
+
+def _filtro_normalizado(query):
+    """
+    icontains mais as colunas normalizadas: "joao" encontra "João" e o número
+    sem pontuação. As colunas normalizadas são comparadas pelo começo (LIKE
+    'prefixo%'), que o índice delas atende; o meio do texto fica com o icontains.
+    """
+    filtro = _filtro_icontains(query) | Q(nome_busca__startswith=normalizar_texto(query))
+    numero = normalizar_numero(query)
+    if numero.isdigit():
+        filtro |= Q(numero_processo_busca__startswith=numero)
+    return filtro
+
+
+def _filtro_substring(query):
+    """
+    O texto em qualquer parte, também nas colunas normalizadas: "ilva" encontra
+    "Silva" e "oao" encontra "João". Usado só quando o índice textual, que casa
+    o começo das palavras, não encontra nada.
+    """
+    filtro = _filtro_icontains(query) | Q(nome_busca__contains=normalizar_texto(query))
+    numero = normalizar_numero(query)
+    if any(c.isdigit() for c in numero):
+        filtro |= Q(numero_processo_busca__contains=numero)
+    return filtro
+
+
+def buscar_textual(processos, query):
+    """
+    Aplica a busca textual indexada do banco em uso: tsvector com índice GIN
+    no PostgreSQL, índice FULLTEXT no MySQL e FTS5 no SQLite. Cada palavra
+    digitada é buscada como prefixo e todas precisam aparecer no processo;
+    um número de processo é encontrado também sem a pontuação. Bancos sem
+    suporte usam icontains e as colunas normalizadas.
+
+    Quando o índice não encontra nada, como em "ilva", que só aparece no meio
+    de "Silva", a busca procura o texto em qualquer parte (_filtro_substring).
+    Decidir isso custa uma consulta EXISTS a mais, resolvida pelo índice.
+    """
+    encontrados = _buscar_no_indice(processos, query)
+    if encontrados is None:
+        return processos.filter(_filtro_normalizado(query))
+    if not encontrados.exists():
+        return processos.alias(
+            **{MARCA_SUBSTRING: Value(True, output_field=BooleanField())}
+        ).filter(_filtro_substring(query))
+    return encontrados
+
+
+def _buscar_no_indice(processos, query):
+    """Os processos encontrados pelo índice textual, ou None se ele não puder ser usado."""
+    connection = _conexao()
+    motor = motor_busca(connection)
+    termos = _termos(query, motor)
+    if motor is None or not termos:
+        return None
+
+    qn = connection.ops.quote_name
+    tabela = qn(Processo._meta.db_table)
+
+    if motor == 'postgresql':
+        return processos.filter(RawSQL(
+            f'{_vetor_postgres(qn, tabela)} @@ {_tsquery_postgres()}',
+            [_consulta_postgres(termos)], output_field=BooleanField()
+        ))
+
+    if motor == 'mysql':
+        # "MATCH(...) > 0" no WHERE é o formato que o MySQL resolve pelo índice FULLTEXT
+        return processos.alias(
+            busca_textual_mysql=_match_mysql(qn, tabela, termos)
+        ).filter(busca_textual_mysql__gt=0)
+
+    # SQLite: o IN sobre a tabela FTS5 é resolvido uma única vez, qualquer
+    # que seja a ordem de junção escolhida pelo planejador
+    fts = qn(TABELA_BUSCA_SQLITE)
+    return processos.filter(RawSQL(
+        f'{tabela}.{qn("id")} IN (SELECT rowid FROM {fts} WHERE {fts} MATCH %s)',
+        [_consulta_sqlite(termos)], output_field=BooleanField()
+    ))
+
+
+def anotar_relevancia(processos, query):
+    """
+    Acrescenta aos processos já filtrados por buscar_textual() a anotação
+    `relevancia` (maior é melhor), usada pela ordenação 'relevancia'.
+
+    Fica separada do filtro porque só a página ordenada precisa dela: as
+    contagens da tela usam a consulta sem a relevância, que é mais barata.
+    """
+    connection = _conexao()
+    motor = motor_busca(connection)
+    termos = _termos(query or '', motor)
+    if motor is None or not termos or MARCA_SUBSTRING in processos.query.annotations:
+        return processos.annotate(relevancia=Value(0.0, output_field=FloatField()))
+
+    qn = connection.ops.quote_name
+    tabela = qn(Processo._meta.db_table)
+
+    if motor == 'postgresql':
+        return processos.annotate(relevancia=RawSQL(
+            f'ts_rank({_vetor_postgres(qn, tabela)}, {_tsquery_postgres()})',
+            [_consulta_postgres(termos)], output_field=FloatField()
+        ))
+
+    if motor == 'mysql':
+        return processos.annotate(relevancia=_match_mysql(qn, tabela, termos))
+
+    # SQLite: o bm25 só existe dentro de um MATCH, então a tabela FTS5 entra
+    # na consulta por JOIN; ele é menor quanto mais relevante, daí o sinal
+    fts = qn(TABELA_BUSCA_SQLITE)
+    pesos = ', '.join(str(peso) for peso in PESOS_SQLITE)
+    casa = RawSQL(f'{fts} MATCH %s', [_consulta_sqlite(termos)], output_field=BooleanField())
+    return processos.filter(Q(busca_textual__isnull=False) & Q(casa)).annotate(
+        relevancia=RawSQL(f'-bm25({fts}, {pesos})', [], output_field=FloatField())
+    )
+
+
+def motor_busca(connection):
+    """Qual implementação de busca textual o banco suporta, ou None."""
+    if connection.vendor in ('postgresql', 'mysql'):
+        return connection.vendor
+    if connection.vendor == 'sqlite' and _sqlite_tem_fts5(connection):
+        return 'sqlite'
+    return None
+
+
+_FTS5_DISPONIVEL = {}
+
+
+def _sqlite_tem_fts5(connection):
+    if connection.alias not in _FTS5_DISPONIVEL:
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA compile_options')
+            opcoes = {linha[0] for linha in cursor.fetchall()}
+        _FTS5_DISPONIVEL[connection.alias] = 'ENABLE_FTS5' in opcoes
+    return _FTS5_DISPONIVEL[connection.alias]
+
+
+def _conexao():
+    return connections[router.db_for_read(Processo)]
+
+
+def _termos(query, motor):
+    """
+    Palavras da busca, em minúsculas e sem acentos. No MySQL ficam de fora
+    as menores que TAMANHO_MINIMO_TERMO_MYSQL, que o índice FULLTEXT ignora.
+    """
+    termos = re.findall(r'\w+', normalizar_texto(query))
+    if motor == 'mysql':
+        termos = [termo for termo in termos if len(termo) >= TAMANHO_MINIMO_TERMO_MYSQL]
+    return termos
+
+
+def _numero_alternativo(termos):
+    """
+    Quando a busca tem dígitos e mais de um termo, como "23107.012345/2024",
+    o número inteiro sem pontuação, buscado como alternativa aos termos
+    para casar com numero_processo_busca.
+    """
+    if len(termos) > 1 and any(c.isdigit() for c in ''.join(termos)):
+        return ''.join(termos)
+    return None
+
+
+def _vetor_postgres(qn, tabela=None, colunas=COLUNAS_BUSCA):
+    # Precisa ser idêntica à expressão do índice GIN para que ele seja usado
+    prefixo = f'{tabela}.' if tabela else ''
+    texto = " || ' ' || ".join(f"coalesce({prefixo}{qn(coluna)}, '')" for coluna in colunas)
+    return f"to_tsvector('{CONFIGURACAO_POSTGRES}'::regconfig, {texto})"
+
+
+def _tsquery_postgres():
+    return f"to_tsquery('{CONFIGURACAO_POSTGRES}'::regconfig, %s)"
+
+
+def _consulta_postgres(termos):
+    consulta = ' & '.join(f'{termo}:*' for termo in termos)
+    numero = _numero_alternativo(termos)
+    if numero:
+        consulta = f'({consulta}) | {numero}:*'
+    return consulta
+
+
+def _match_mysql(qn, tabela, termos):
+    colunas = ', '.join(f'{tabela}.{qn(coluna)}' for coluna in COLUNAS_BUSCA)
+    consulta = ' '.join(f'+{termo}*' for termo in termos)
+    numero = _numero_alternativo(termos)
+    if numero:
+        # Sem operador, o grupo e o número são alternativas: basta casar um deles
+        consulta = f'({consulta}) {numero}*'
+    return RawSQL(
+        f'MATCH ({colunas}) AGAINST (%s IN BOOLEAN MODE)', [consulta], output_field=FloatField()
+    )
+
+
+def _consulta_sqlite(termos):
+    consulta = ' '.join(f'"{termo}"*' for termo in termos)
+    numero = _numero_alternativo(termos)
+    if numero:
+        consulta = f'({consulta}) OR "{numero}"*'
+    return consulta
+
+
+def instalar_indice_busca(connection, colunas=COLUNAS_BUSCA):
+    """
+    Cria o índice textual de Processo no banco, se ainda não existir.
+    As migrações informam as colunas que existiam na época em que rodaram.
+
+    No PostgreSQL e no MySQL o próprio banco mantém o índice a cada gravação.
+    No SQLite a tabela FTS5 é mantida por gatilhos em scpiapp_processo, que
+    cobrem save(), bulk_create(), update() e delete(). Como o SQLite recria a
+    tabela em algumas migrações (apagando os gatilhos), esta função também é
+    chamada após cada migrate e reconstrói o índice quando algo faltava.
+    """
+    motor = motor_busca(connection)
+    qn = connection.ops.quote_name
+    tabela = qn(Processo._meta.db_table)
+
+    with connection.cursor() as cursor:
+        if motor == 'postgresql':
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {qn(INDICE_BUSCA)} ON {tabela} '
+                f'USING GIN ({_vetor_postgres(qn, colunas=colunas)})'
+            )
+        elif motor == 'mysql':
+            cursor.execute(f'SHOW INDEX FROM {tabela} WHERE Key_name = %s', [INDICE_BUSCA])
+            if not cursor.fetchall():
+                lista = ', '.join(qn(coluna) for coluna in colunas)
+                cursor.execute(f'ALTER TABLE {tabela} ADD FULLTEXT INDEX {qn(INDICE_BUSCA)} ({lista})')
+        elif motor == 'sqlite':
+            _instalar_fts_sqlite(cursor, qn, tabela, colunas)
+
+
+def remover_indice_busca(connection):
+    motor = motor_busca(connection)
+    qn = connection.ops.quote_name
+    tabela = qn(Processo._meta.db_table)
+
+    with connection.cursor() as cursor:
+        if motor == 'postgresql':
+            cursor.execute(f'DROP INDEX IF EXISTS {qn(INDICE_BUSCA)}')
+        elif motor == 'mysql':
+            cursor.execute(f'SHOW INDEX FROM {tabela} WHERE Key_name = %s', [INDICE_BUSCA])
+            if cursor.fetchall():
+                cursor.execute(f'ALTER TABLE {tabela} DROP INDEX {qn(INDICE_BUSCA)}')
+        elif motor == 'sqlite':
+            for sufixo in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {qn(f"{TABELA_BUSCA_SQLITE}_{sufixo}")}')
+            cursor.execute(f'DROP TABLE IF EXISTS {qn(TABELA_BUSCA_SQLITE)}')
+
+
+def _instalar_fts_sqlite(cursor, qn, tabela, colunas):
+    fts = qn(TABELA_BUSCA_SQLITE)
+    novos = ', '.join(f'new.{qn(coluna)}' for coluna in colunas)
+    antigos = ', '.join(f'old.{qn(coluna)}' for coluna in colunas)
+    colunas = ', '.join(qn(coluna) for coluna in colunas)
+
+    gatilhos = {
+        'ai': f'AFTER INSERT ON {tabela} BEGIN '
+              f'INSERT INTO {fts}(rowid, {colunas}) VALUES (new.id, {novos}); END',
+        'ad': f'AFTER DELETE ON {tabela} BEGIN '
+              f"INSERT INTO {fts}({fts}, rowid, {colunas}) VALUES ('delete', old.id, {antigos}); END",
+        'au': f'AFTER UPDATE ON {tabela} BEGIN '
+              f"INSERT INTO {fts}({fts}, rowid, {colunas}) VALUES ('delete', old.id, {antigos}); "
+              f'INSERT INTO {fts}(rowid, {colunas}) VALUES (new.id, {novos}); END',
+    }
+
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN (%s, %s, %s)",
+        [f'{TABELA_BUSCA_SQLITE}_{sufixo}' for sufixo in gatilhos]
+    )
+    existentes = {linha[0] for linha in cursor.fetchall()}
+
+    cursor.execute(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({colunas}, '
+        f"content='{Processo._meta.db_table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')"
+    )
+    for sufixo, corpo in gatilhos.items():
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {qn(f"{TABELA_BUSCA_SQLITE}_{sufixo}")} {corpo}')
+
+    if len(existentes) < len(gatilhos):
+        # Gatilhos recém-criados: o índice pode estar desatualizado em relação à tabela
+        cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+
+# Arquivo ainda sendo gerado; ignorado pela limpeza e nunca servido
+PREFIXO_TEMPORARIO = '.gerando-'
+
+_INTERVALO = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _diretorio():
+    diretorio = settings.SCPI_EXPORTACOES_DIR
+    os.makedirs(diretorio, exist_ok=True)
+    return diretorio
+
+
+def nome_artefato(tabela_id, versao, partes, extensao):
+    resumo = hashlib.md5(json.dumps(partes, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    return f'tabela-{tabela_id}-v{versao}-{resumo}.{extensao}'
+
+
+def buscar_artefato(tabela_id, versao, partes, extensao):
+    """
+    Caminho da exportação já gerada para a tabela na versão informada, ou
+    None. `partes` são os parâmetros que mudam o arquivo (busca, ordenação).
+    Um arquivo encontrado é marcado como usado agora, para a remoção dos
+    menos usados recentemente em limitar_tamanho().
+    """
+    caminho = os.path.join(_diretorio(), nome_artefato(tabela_id, versao, partes, extensao))
+    try:
+        os.utime(caminho)
+    except FileNotFoundError:
+        return None
+    return caminho
+
+
+def gravar_artefato(tabela_id, versao, partes, extensao, gerar):
+    """
+    Gera a exportação com `gerar(arquivo)` num arquivo temporário do mesmo
+    diretório e só então a coloca no lugar, então uma requisição concorrente
+    nunca vê um arquivo pela metade. Um arquivo já publicado nunca é
+    substituído, para que um download retomado continue no mesmo conteúdo.
+    Retorna o caminho do arquivo.
+    """
+    diretorio = _diretorio()
+    descritor, temporario = tempfile.mkstemp(dir=diretorio, prefix=PREFIXO_TEMPORARIO)
+    try:
+        with os.fdopen(descritor, 'wb') as arquivo:
+            gerar(arquivo)
+    except BaseException:
+        _remover(temporario)
+        raise
+    return _publicar(diretorio, temporario, tabela_id, versao, partes, extensao)
+
+
+def gravar_artefato_ao_enviar(tabela_id, versao, partes, extensao, blocos):
+    """
+    Como gravar_artefato, para uma resposta em streaming: cada bloco de
+    `blocos` vai para o arquivo temporário e é devolvido na mesma hora para
+    ser enviado, então o download começa sem esperar o arquivo inteiro. O
+    arquivo só é publicado depois do último bloco; um download interrompido
+    descarta o temporário.
+    """
+    diretorio = _diretorio()
+    descritor, temporario = tempfile.mkstemp(dir=diretorio, prefix=PREFIXO_TEMPORARIO)
+    try:
+        with os.fdopen(descritor, 'wb') as arquivo:
+            for bloco in blocos:
+                arquivo.write(bloco)
+                yield bloco
+    except BaseException:
+        _remover(temporario)
+        raise
+    _publicar(diretorio, temporario, tabela_id, versao, partes, extensao)
+
+
+def _publicar(diretorio, temporario, tabela_id, versao, partes, extensao):
+    caminho = os.path.join(diretorio, nome_artefato(tabela_id, versao, partes, extensao))
+    if os.path.exists(caminho):
+        # Gerado ao mesmo tempo por outra requisição
+        _remover(temporario)
+    else:
+        os.replace(temporario, caminho)
+    _remover_versoes_antigas(diretorio, tabela_id, versao)
+    limitar_tamanho(manter=caminho)
+    return caminho
+
+
+def _remover(caminho):
+    try:
+        os.remove(caminho)
+    except FileNotFoundError:
+        # Já removido por outro worker
+        pass
+
+
+def _remover_versoes_antigas(diretorio, tabela_id, versao):
+    # A versão de uma tabela só aumenta: arquivos de versões anteriores não serão mais usados
+    prefixo = f'tabela-{tabela_id}-v'
+    for entrada in os.scandir(diretorio):
+        if not entrada.name.startswith(prefixo):
+            continue
+        versao_arquivo = entrada.name[len(prefixo):].split('-', 1)[0]
+        if versao_arquivo.isdigit() and int(versao_arquivo) < versao:
+            _remover(entrada.path)
+
+
+def limitar_tamanho(limite=None, manter=None):
+    """
+    Remove as exportações usadas há mais tempo até o diretório caber em
+    SCPI_EXPORTACOES_LIMITE_BYTES. O arquivo `manter`, recém-gerado, fica.
+    """
+    if limite is None:
+        limite = settings.SCPI_EXPORTACOES_LIMITE_BYTES
+    arquivos = []
+    for entrada in os.scandir(_diretorio()):
+        if entrada.name.startswith(PREFIXO_TEMPORARIO) or not entrada.is_file():
+            continue
+        try:
+            estado = entrada.stat()
+        except FileNotFoundError:
+            continue
+        arquivos.append((estado.st_mtime, estado.st_size, entrada.path))
+
+    total = sum(tamanho for _, tamanho, _ in arquivos)
+    for _, tamanho, caminho in sorted(arquivos):
+        if total <= limite:
+            break
+        if caminho == manter:
+            continue
+        _remover(caminho)
+        total -= tamanho
+
+
+class _Trecho:
+    """Lê no máximo `tamanho` bytes do arquivo, a partir da posição atual."""
+
+    def __init__(self, arquivo, tamanho):
+        self.arquivo = arquivo
+        self.restante = tamanho
+
+    def read(self, tamanho=-1):
+        if tamanho < 0 or tamanho > self.restante:
+            tamanho = self.restante
+        dados = self.arquivo.read(tamanho)
+        self.restante -= len(dados)
+        return dados
+
+    def close(self):
+        self.arquivo.close()
+
+
+def intervalo_pedido(request, tamanho, validadores=()):
+    """
+    Intervalo (início, fim), inclusivo, pedido no cabeçalho Range, ou None
+    para enviar o arquivo inteiro. Só um intervalo por pedido é atendido;
+    cabeçalho inválido, vários intervalos ou If-Range que não corresponde
+    a `validadores` (ETag ou data) fazem o arquivo ser enviado inteiro.
+    Levanta ValueError para um intervalo fora do arquivo (416).
+    """
+    cabecalho = request.META.get('HTTP_RANGE')
+    if not cabecalho or request.method != 'GET':
+        return None
+    condicao = request.META.get('HTTP_IF_RANGE')
+    if condicao and condicao not in validadores:
+        return None
+    encontrado = _INTERVALO.match(cabecalho.strip())
+    if not encontrado or encontrado.groups() == ('', ''):
+        return None
+
+    inicio, fim = encontrado.groups()
+    if not inicio:
+        # bytes=-N: os últimos N bytes
+        if int(fim) == 0:
+            raise ValueError(cabecalho)
+        return max(tamanho - int(fim), 0), tamanho - 1
+    inicio = int(inicio)
+    fim = min(int(fim), tamanho - 1) if fim else tamanho - 1
+    if inicio >= tamanho or inicio > fim:
+        raise ValueError(cabecalho)
+    return inicio, fim
+
+
+def resposta_arquivo(request, caminho, nome_arquivo, content_type, validadores=(), parcial=True):
+    """
+    FileResponse para download do arquivo, com suporte a Range: um download
+    interrompido é retomado do ponto em que parou (206 Partial Content).
+    Com parcial=False (arquivo acabou de ser gerado de novo e pode não ter
+    os mesmos bytes do download interrompido), o arquivo vai inteiro.
+    """
+    tamanho = os.path.getsize(caminho)
+    try:
+        intervalo = intervalo_pedido(request, tamanho, validadores) if parcial else None
+    except ValueError:
+        resposta = HttpResponse(status=416)
+        resposta['Content-Range'] = f'bytes */{tamanho}'
+        return resposta
+
+    arquivo = open(caminho, 'rb')
+    if intervalo is None:
+        resposta = FileResponse(arquivo, as_attachment=True, filename=nome_arquivo, content_type=content_type)
+    else:
+        inicio, fim = intervalo
+        arquivo.seek(inicio)
+        resposta = FileResponse(
+            _Trecho(arquivo, fim - inicio + 1), as_attachment=True, filename=nome_arquivo,
+            content_type=content_type, status=206
+        )
+        resposta['Content-Range'] = f'bytes {inicio}-{fim}/{tamanho}'
+        resposta['Content-Length'] = fim - inicio + 1
+    resposta['Accept-Ranges'] = 'bytes'
+    return resposta
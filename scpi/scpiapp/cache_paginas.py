@@ -0,0 +1,84 @@
+import hashlib
+import json
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+# Versão da lista de tabelas (página inicial); cada tabela tem a sua
+CHAVE_TABELAS = 'tabelas'
+
+
+def chave_tabela(tabela_id):
+    return f'tabela:{tabela_id}'
+
+
+def versoes(*chaves):
+    """
+    Versões atuais das chaves, lidas do banco em uma consulta. Ficam no banco,
+    e não no cache, para que todos os workers vejam o mesmo valor mesmo com
+    um cache local (locmem) em cada processo.
+    """
+    return {chave: versao for chave, (versao, _) in estados(*chaves).items()}
+
+
+def estados(*chaves):
+    """(versão, data da última alteração) de cada chave; (0, None) se nunca alterada."""
+    VersaoCache = apps.get_model('scpiapp', 'VersaoCache')
+    encontradas = {
+        chave: (versao, data_atualizacao)
+        for chave, versao, data_atualizacao in VersaoCache.objects.filter(chave__in=chaves)
+        .values_list('chave', 'versao', 'data_atualizacao')
+    }
+    return {chave: encontradas.get(chave, (0, None)) for chave in chaves}
+
+
+def invalidar_tabelas(ids_tabelas):
+    """
+    Agenda, para o commit da transação corrente, o incremento da versão de
+    cada tabela informada e da lista de tabelas, junto com a data de
+    atualização das tabelas. Páginas guardadas com a versão antiga deixam
+    de ser usadas e expiram sozinhas.
+    """
+    ids_tabelas = sorted(set(ids_tabelas) - {None})
+    transaction.on_commit(lambda: registrar_alteracao(ids_tabelas))
+
+
+def registrar_alteracao(ids_tabelas):
+    agora = timezone.now()
+    if ids_tabelas:
+        TabelaProcessos = apps.get_model('scpiapp', 'TabelaProcessos')
+        TabelaProcessos.objects.filter(pk__in=ids_tabelas).update(data_atualizacao=agora)
+    incrementar_versoes([chave_tabela(tabela_id) for tabela_id in ids_tabelas] + [CHAVE_TABELAS], agora)
+
+
+def incrementar_versoes(chaves, agora=None):
+    VersaoCache = apps.get_model('scpiapp', 'VersaoCache')
+    agora = agora or timezone.now()
+    for chave in chaves:
+        if VersaoCache.objects.filter(chave=chave).update(versao=F('versao') + 1, data_atualizacao=agora):
+            continue
+        try:
+            with transaction.atomic():
+                VersaoCache.objects.create(chave=chave, versao=1, data_atualizacao=agora)
+        except IntegrityError:
+            # Criada ao mesmo tempo por outro worker
+            VersaoCache.objects.filter(chave=chave).update(versao=F('versao') + 1, data_atualizacao=agora)
+
+
+def em_cache(chave_versao, versao, partes, gerar):
+    """
+    Devolve o valor guardado para (chave_versao, partes) na versão informada,
+    ou o gera com `gerar()` e guarda. `partes` são os parâmetros que mudam o
+    resultado, como a busca e a página.
+    """
+    resumo = hashlib.md5(json.dumps(partes, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    chave = f'scpi:{chave_versao}:{resumo}'
+    valor = cache.get(chave, version=versao)
+    if valor is None:
+        valor = gerar()
+        cache.set(chave, valor, settings.SCPI_CACHE_SEGUNDOS, version=versao)
+    return valor
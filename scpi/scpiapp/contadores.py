@@ -0,0 +1,215 @@
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.apps import apps as apps_globais
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncMonth
+from django.utils.dateparse import parse_date
+
+from .cache_paginas import invalidar_tabelas
+
+# Coluna de TabelaProcessos que conta cada setor e cada status de Processo
+CONTADORES_SETOR = {'CIC': 'processos_cic', 'DPQ': 'processos_dpq'}
+CONTADORES_STATUS = {'em_andamento': 'processos_em_andamento', 'concluido': 'processos_concluidos'}
+CAMPOS_CONTADORES = ('total_processos', *CONTADORES_SETOR.values(), *CONTADORES_STATUS.values())
+
+# Campos de Processo que, ao mudar, alteram os contadores ou o resumo do painel
+CAMPOS_CONTADOS = ('tabela', 'tabela_id', 'setor', 'status', 'bolsa', 'data_abertura')
+
+# Cada contagem é agrupada por (tabela, setor, status, bolsa, mês de abertura),
+# a mesma chave das linhas de ResumoProcessos
+CAMPOS_RESUMO = ('tabela_id', 'setor', 'status', 'bolsa', 'mes')
+
+_adiados = threading.local()
+
+
+def mes_de(data):
+    """Primeiro dia do mês da data (ou None), como no campo `mes` do resumo."""
+    if isinstance(data, str):
+        data = parse_date(data)
+    return data.replace(day=1) if data else None
+
+
+def chave_contagem(processo):
+    return (processo.tabela_id, processo.setor, processo.status, processo.bolsa, mes_de(processo.data_abertura))
+
+
+def agrupar_contagem(processos):
+    """Quantos processos do queryset há em cada chave de contagem, em uma consulta."""
+    contagem = Counter()
+    for tabela_id, setor, status, bolsa, mes, quantidade in (
+        processos.order_by().annotate(mes=TruncMonth('data_abertura'))
+        .values_list('tabela_id', 'setor', 'status', 'bolsa', 'mes')
+        .annotate(quantidade=Count('id'))
+    ):
+        contagem[(tabela_id, setor, status, bolsa, mes)] += quantidade
+    return contagem
+
+
+def _contadores_por_tabela(contagem, sinal=1):
+    deltas = defaultdict(Counter)
+    for (tabela_id, setor, status, _, _), quantidade in contagem.items():
+        if tabela_id is None or not quantidade:
+            continue
+        campos = deltas[tabela_id]
+        campos['total_processos'] += sinal * quantidade
+        if setor in CONTADORES_SETOR:
+            campos[CONTADORES_SETOR[setor]] += sinal * quantidade
+        if status in CONTADORES_STATUS:
+            campos[CONTADORES_STATUS[status]] += sinal * quantidade
+    return deltas
+
+
+def ajustar_contadores(contagem, sinal=1):
+    """
+    Soma (ou subtrai, com sinal=-1) uma contagem agrupada por chave de
+    contagem nos contadores das tabelas, com UPDATE ... SET campo = campo + n,
+    e nas linhas do resumo do painel. Deve rodar na mesma transação da
+    alteração dos processos.
+    """
+    deltas = _contadores_por_tabela(contagem, sinal)
+    resumo = Counter({
+        chave: sinal * quantidade for chave, quantidade in contagem.items() if chave[0] is not None and quantidade
+    })
+
+    pendentes = getattr(_adiados, 'deltas', None)
+    if pendentes is not None:
+        for tabela_id, campos in deltas.items():
+            pendentes[tabela_id].update(campos)
+        _adiados.resumo.update(resumo)
+        return
+    _aplicar(deltas, resumo)
+
+
+def _aplicar(deltas, resumo):
+    TabelaProcessos = apps_globais.get_model('scpiapp', 'TabelaProcessos')
+    travadas = set()
+    for tabela_id, campos in deltas.items():
+        alteracoes = {campo: F(campo) + delta for campo, delta in campos.items() if delta}
+        if alteracoes:
+            TabelaProcessos.objects.filter(pk=tabela_id).update(**alteracoes)
+            travadas.add(tabela_id)
+    _aplicar_resumo(resumo, travadas)
+
+
+def _aplicar_resumo(resumo, travadas=()):
+    """
+    Aplica os deltas às linhas do resumo: lê as linhas existentes das chaves
+    em uma consulta e grava com um bulk_update, um bulk_create e, para as
+    que zeraram, um DELETE. Os valores gravados são absolutos, então a linha
+    de cada tabela envolvida fica travada até o fim da transação (a maioria
+    já foi pelo UPDATE dos contadores), e duas transações nunca alteram ao
+    mesmo tempo o resumo da mesma tabela.
+    """
+    resumo = {chave: delta for chave, delta in resumo.items() if delta}
+    if not resumo:
+        return
+    TabelaProcessos = apps_globais.get_model('scpiapp', 'TabelaProcessos')
+    ResumoProcessos = apps_globais.get_model('scpiapp', 'ResumoProcessos')
+
+    tabelas = {chave[0] for chave in resumo}
+    if tabelas - set(travadas):
+        list(TabelaProcessos.objects.select_for_update().filter(pk__in=tabelas - set(travadas)).values_list('pk'))
+
+    filtro = Q()
+    for chave in resumo:
+        filtro |= Q(**dict(zip(CAMPOS_RESUMO, chave)))
+    existentes = {
+        tuple(getattr(linha, campo) for campo in CAMPOS_RESUMO): linha
+        for linha in ResumoProcessos.objects.filter(filtro)
+    }
+
+    alteradas, novas, vazias = [], [], []
+    for chave, delta in resumo.items():
+        linha = existentes.get(chave)
+        if linha is None:
+            if delta > 0:
+                novas.append(ResumoProcessos(**dict(zip(CAMPOS_RESUMO, chave)), quantidade=delta))
+            continue
+        linha.quantidade += delta
+        (alteradas if linha.quantidade > 0 else vazias).append(linha)
+    if alteradas:
+        ResumoProcessos.objects.bulk_update(alteradas, ['quantidade'], batch_size=500)
+    if novas:
+        ResumoProcessos.objects.bulk_create(novas, batch_size=500)
+    if vazias:
+        ResumoProcessos.objects.filter(pk__in=[linha.pk for linha in vazias]).delete()
+
+
+@contextmanager
+def contadores_adiados():
+    """
+    Acumula os ajustes feitos dentro do bloco e aplica tudo no final, com um
+    UPDATE por tabela. Usado pela importação, que grava muitos lotes na mesma
+    transação: assim a linha da tabela só fica bloqueada no fim, e não durante
+    toda a importação. Se o bloco falhar, os ajustes são descartados.
+    """
+    if getattr(_adiados, 'deltas', None) is not None:
+        # Já dentro de outro bloco adiado: ele aplica tudo no final
+        yield
+        return
+
+    _adiados.deltas = defaultdict(Counter)
+    _adiados.resumo = Counter()
+    try:
+        yield
+        deltas, resumo = _adiados.deltas, _adiados.resumo
+    finally:
+        _adiados.deltas = _adiados.resumo = None
+    _aplicar(deltas, resumo)
+
+
+def recalcular_contadores(ids_tabelas=None, registro=apps_globais):
+    """
+    Recalcula do zero os contadores das tabelas informadas (ou de todas) e
+    as suas linhas do resumo do painel, com uma consulta agrupada sobre os
+    processos. As linhas das tabelas são travadas antes da contagem para não
+    perder ajustes feitos ao mesmo tempo. Retorna quantas tabelas foram
+    atualizadas.
+    """
+    TabelaProcessos = registro.get_model('scpiapp', 'TabelaProcessos')
+    Processo = registro.get_model('scpiapp', 'Processo')
+    try:
+        ResumoProcessos = registro.get_model('scpiapp', 'ResumoProcessos')
+    except LookupError:
+        # Migrações anteriores à criação do resumo
+        ResumoProcessos = None
+
+    with transaction.atomic():
+        tabelas = TabelaProcessos.objects.select_for_update().only('id', *CAMPOS_CONTADORES)
+        if ids_tabelas is not None:
+            tabelas = tabelas.filter(pk__in=ids_tabelas)
+        tabelas = list(tabelas)
+        ids = [tabela.pk for tabela in tabelas]
+
+        # Os contadores saem da mesma contagem agrupada que forma o resumo
+        contagem = agrupar_contagem(Processo.objects.filter(tabela__in=ids))
+        totais = _contadores_por_tabela(contagem)
+        for tabela in tabelas:
+            for campo in CAMPOS_CONTADORES:
+                setattr(tabela, campo, totais[tabela.pk][campo])
+        TabelaProcessos.objects.bulk_update(tabelas, CAMPOS_CONTADORES, batch_size=500)
+
+        if ResumoProcessos is not None:
+            resumo = ResumoProcessos.objects.all()
+            if ids_tabelas is not None:
+                resumo = resumo.filter(tabela__in=ids)
+            resumo.delete()
+            ResumoProcessos.objects.bulk_create([
+                ResumoProcessos(**dict(zip(CAMPOS_RESUMO, chave)), quantidade=quantidade)
+                for chave, quantidade in contagem.items()
+            ], batch_size=500)
+
+        # Dentro de contadores_adiados, os ajustes pendentes dessas tabelas já
+        # estão na contagem que acabou de ser gravada
+        pendentes = getattr(_adiados, 'deltas', None)
+        if pendentes is not None:
+            for tabela_id in ids:
+                pendentes.pop(tabela_id, None)
+            for chave in [chave for chave in _adiados.resumo if chave[0] in set(ids)]:
+                del _adiados.resumo[chave]
+        if registro is apps_globais:
+            invalidar_tabelas([tabela.pk for tabela in tabelas])
+    return len(tabelas)
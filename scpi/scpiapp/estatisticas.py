@@ -0,0 +1,49 @@
+from django.db.models import Count, Q
+
+from .busca import buscar_textual
+from .models import Processo
+
+
+def estatisticas_processos(tabela, query=None, encontrados=None):
+    """
+    Totais da tabela em uma única consulta, com agregação condicional:
+    total geral, total da busca e a divisão por setor, status e bolsa.
+
+    Com busca, o filtro entra como `id IN (busca)` dentro de cada contagem,
+    em vez de no WHERE, para que o total sem filtro saia da mesma consulta;
+    o banco resolve a subconsulta da busca uma vez só, pelo índice textual.
+    `encontrados` são os processos já filtrados por filtrar_processos(), se
+    quem chama já os tem, para não repetir a escolha entre o índice e a
+    busca por substring (ver buscar_textual).
+    """
+    processos = Processo.objects.filter(tabela=tabela)
+    filtro = Q()
+    if query:
+        if encontrados is None:
+            encontrados = buscar_textual(processos, query)
+        filtro = Q(id__in=encontrados.values('id'))
+
+    grupos = {
+        'setor': Processo.SetorOpcoes.choices,
+        'status': Processo.StatusProcesso.choices,
+        'bolsa': Processo.BolsaOpcoes.choices,
+    }
+
+    agregados = {
+        'total_sem_filtro': Count('id'),
+        'total_processos': Count('id', filter=filtro or None),
+    }
+    for campo, opcoes in grupos.items():
+        for i, (valor, _) in enumerate(opcoes):
+            agregados[f'{campo}_{i}'] = Count('id', filter=filtro & Q(**{campo: valor}))
+    resultado = processos.aggregate(**agregados)
+
+    estatisticas = {
+        'total_sem_filtro': resultado['total_sem_filtro'],
+        'total_processos': resultado['total_processos'],
+    }
+    for campo, opcoes in grupos.items():
+        estatisticas[f'por_{campo}'] = [
+            (valor, rotulo, resultado[f'{campo}_{i}']) for i, (valor, rotulo) in enumerate(opcoes)
+        ]
+    return estatisticas
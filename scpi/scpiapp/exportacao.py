@@ -0,0 +1,298 @@
+import csv
+import io
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.worksheet.dimensions import RowDimension
+
+from .models import Auditoria, Processo
+
+CABECALHOS = ['Nome', 'Matrícula', 'Nº Processo', 'Data de Abertura', 'Data de Retorno', 'Setor', 'Bolsa', 'Status', 'Assunto', 'Observações']
+
+# Colunas lidas do banco, na ordem dos cabeçalhos
+COLUNAS = ('nome', 'matricula', 'numero_processo', 'data_abertura', 'data_retorno', 'setor', 'bolsa', 'status', 'assunto', 'observacoes')
+
+# Quantidade de linhas buscadas do banco por vez durante a exportação
+TAMANHO_LOTE = 2000
+
+# Tamanho aproximado de cada pedaço enviado ao cliente
+TAMANHO_BLOCO = 64 * 1024
+
+# Mapeamento de campos para exibição amigável
+CAMPO_EXIBICAO = {
+    'nome': 'Nome',
+    'data_abertura': 'Data de Abertura',
+    'data_retorno': 'Data de Retorno',
+    'relevancia': 'Relevância'
+}
+
+# Mapeamento de direção para exibição amigável
+DIRECAO_EXIBICAO = {
+    'asc': 'crescente',
+    'desc': 'decrescente'
+}
+
+# Largura das colunas da planilha
+LARGURAS_COLUNAS = {
+    'A': 25,  # Nome
+    'B': 15,  # Matrícula
+    'C': 20,  # Nº Processo
+    'D': 15,  # Data de Abertura
+    'E': 15,  # Data de Retorno
+    'F': 15,  # Setor
+    'G': 10,  # Bolsa
+    'H': 15,  # Status
+    'I': 30,  # Assunto
+    'J': 30,  # Observações
+}
+
+# Altura fixa para todas as linhas de dados
+ALTURA_LINHA_DADOS = 30
+
+SETORES = dict(Processo.SetorOpcoes.choices)
+BOLSAS = dict(Processo.BolsaOpcoes.choices)
+STATUS = dict(Processo.StatusProcesso.choices)
+
+
+def titulo_exportacao(tabela, query, sort_by, sort_direction):
+    sort_by_info = ""
+    if sort_by:
+        sort_by_info = f" - Ordenado por {CAMPO_EXIBICAO.get(sort_by, sort_by)} ({DIRECAO_EXIBICAO.get(sort_direction, sort_direction)})"
+
+    if query:
+        return f"SCPI - Processos filtrados da Tabela: {tabela.nome} (Filtro: {query}){sort_by_info}"
+    return f"SCPI - Processos da Tabela: {tabela.nome}{sort_by_info}"
+
+
+def linhas_exportacao(processos, progresso=None):
+    """
+    Percorre os processos em lotes com um cursor do banco, devolvendo cada
+    linha já formatada para exportação, sem carregar a tabela inteira.
+    Se informado, `progresso(linhas)` é chamado a cada lote lido.
+    """
+    linhas = 0
+    for (nome, matricula, numero_processo, data_abertura, data_retorno,
+         setor, bolsa, status, assunto, observacoes) in processos.values_list(*COLUNAS).iterator(chunk_size=TAMANHO_LOTE):
+        linhas += 1
+        if progresso and linhas % TAMANHO_LOTE == 0:
+            progresso(linhas)
+        yield [
+            nome or "",
+            matricula or "",
+            numero_processo or "",
+            # Formatar as datas para exibição no formato DD/MM/AAAA
+            data_abertura.strftime('%d/%m/%Y') if data_abertura else "",
+            data_retorno.strftime('%d/%m/%Y') if data_retorno else "",
+            SETORES.get(setor, setor) if setor else "",
+            BOLSAS.get(bolsa, bolsa) if bolsa else "",
+            STATUS.get(status, status) if status else "",
+            assunto or "",
+            observacoes or ""
+        ]
+    if progresso:
+        progresso(linhas)
+
+
+def gerar_csv(processos, titulo, progresso=None):
+    """
+    Gera o CSV em pedaços de bytes para uso com StreamingHttpResponse.
+    Mantém o formato da exportação original: BOM, ';' como delimitador,
+    linha de título e linha vazia antes dos cabeçalhos.
+    """
+    buffer = io.StringIO()
+    # Usar ponto-e-vírgula como delimitador para melhor compatibilidade com Excel brasileiro
+    writer = csv.writer(buffer, delimiter=';', quoting=csv.QUOTE_ALL)
+
+    # Adicionar BOM (Byte Order Mark) para garantir que o Excel interprete corretamente caracteres especiais
+    buffer.write(u'\ufeff')
+    writer.writerow([titulo])
+    writer.writerow([])  # Linha vazia
+    writer.writerow(CABECALHOS)
+
+    for linha in linhas_exportacao(processos, progresso):
+        writer.writerow(linha)
+        if buffer.tell() >= TAMANHO_BLOCO:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue().encode('utf-8')
+
+
+def compactar_gzip(blocos):
+    """Compacta em gzip, bloco a bloco, o conteúdo gerado por outro gerador."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for bloco in blocos:
+        dados = compressor.compress(bloco)
+        if dados:
+            yield dados
+    yield compressor.flush()
+
+
+# Colunas da extração da auditoria, na ordem do CSV e das chaves do JSONL
+COLUNAS_AUDITORIA = (
+    'id', 'data_evento', 'acao', 'usuario_id', 'usuario__username', 'processo_id', 'tabela_id',
+    'numero_processo', 'id_processo', 'id_tabela', 'detalhes',
+)
+CABECALHOS_AUDITORIA = [
+    'ID', 'Data/Hora', 'Ação', 'ID do Usuário', 'Usuário', 'ID do Processo', 'ID da Tabela',
+    'Nº Processo', 'ID do Processo (original)', 'ID da Tabela (original)', 'Detalhes',
+]
+
+
+def eventos_auditoria(auditorias):
+    """
+    Percorre os eventos em ordem cronológica com um cursor do banco, em lotes,
+    devolvendo um dict por evento (as mesmas chaves do arquivo da auditoria).
+    A memória usada não depende de quantos eventos a extração tem.
+    """
+    consulta = auditorias.order_by('data_evento', 'id').values_list(*COLUNAS_AUDITORIA)
+    for linha in consulta.iterator(chunk_size=TAMANHO_LOTE):
+        evento = dict(zip(COLUNAS_AUDITORIA, linha))
+        evento['usuario'] = evento.pop('usuario__username')
+        yield evento
+
+
+def gerar_csv_auditoria(auditorias):
+    """
+    Gera o CSV da auditoria em pedaços de bytes. Segue o padrão das
+    exportações de processos (BOM e ';'), mas sem a linha de título, para
+    que a extração possa ser lida direto por outras ferramentas.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';', quoting=csv.QUOTE_ALL)
+    buffer.write(u'\ufeff')
+    writer.writerow(CABECALHOS_AUDITORIA)
+
+    acoes = dict(Auditoria.AcoesAuditoria.choices)
+    for evento in eventos_auditoria(auditorias):
+        writer.writerow([
+            evento['id'],
+            timezone.localtime(evento['data_evento']).strftime('%d/%m/%Y %H:%M:%S'),
+            acoes.get(evento['acao'], evento['acao'] or ""),
+            evento['usuario_id'] or "",
+            evento['usuario'] or "",
+            evento['processo_id'] or "",
+            evento['tabela_id'] or "",
+            evento['numero_processo'] or "",
+            evento['id_processo'] or "",
+            evento['id_tabela'] or "",
+            json.dumps(evento['detalhes'], ensure_ascii=False, cls=DjangoJSONEncoder) if evento['detalhes'] else "",
+        ])
+        if buffer.tell() >= TAMANHO_BLOCO:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue().encode('utf-8')
+
+
+def gerar_jsonl_auditoria(auditorias):
+    """Gera a auditoria em JSON Lines (um evento por linha), em pedaços de bytes."""
+    bloco = []
+    tamanho = 0
+    for evento in eventos_auditoria(auditorias):
+        linha = json.dumps(evento, ensure_ascii=False, cls=DjangoJSONEncoder).encode('utf-8') + b'\n'
+        bloco.append(linha)
+        tamanho += len(linha)
+        if tamanho >= TAMANHO_BLOCO:
+            yield b''.join(bloco)
+            bloco = []
+            tamanho = 0
+    yield b''.join(bloco)
+
+
+def _estilos_planilha():
+    """
+    Estilos nomeados da planilha, criados uma única vez por arquivo e
+    compartilhados por todas as células em vez de um objeto por célula.
+    """
+    borda_fina = Border(
+        left=Side(style='thin', color='000000'),
+        right=Side(style='thin', color='000000'),
+        top=Side(style='thin', color='000000'),
+        bottom=Side(style='thin', color='000000')
+    )
+    # Estilo zebra para linhas alternadas
+    verde_claro = PatternFill(start_color='E6FFE6', end_color='E6FFE6', fill_type='solid')
+    centralizado = Alignment(horizontal='center', vertical='center')
+    meio = Alignment(vertical='center')
+    quebra_texto = Alignment(wrap_text=True, vertical='top')
+
+    return [
+        NamedStyle(
+            name='scpi_titulo',
+            font=Font(name='Arial', size=14, bold=True),
+            alignment=centralizado,
+            fill=PatternFill(start_color='DDDDDD', end_color='DDDDDD', fill_type='solid')
+        ),
+        NamedStyle(
+            name='scpi_cabecalho',
+            font=Font(name='Arial', size=12, bold=True, color='FFFFFF'),
+            fill=PatternFill(start_color='006600', end_color='006600', fill_type='solid'),
+            border=borda_fina,
+            alignment=centralizado
+        ),
+        NamedStyle(name='scpi_dado', font=DEFAULT_FONT, border=borda_fina, alignment=meio),
+        NamedStyle(name='scpi_dado_zebra', font=DEFAULT_FONT, border=borda_fina, alignment=meio, fill=verde_claro),
+        # Assunto e Observações quebram o texto
+        NamedStyle(name='scpi_texto', font=DEFAULT_FONT, border=borda_fina, alignment=quebra_texto),
+        NamedStyle(name='scpi_texto_zebra', font=DEFAULT_FONT, border=borda_fina, alignment=quebra_texto, fill=verde_claro),
+    ]
+
+
+def gerar_xlsx(processos, titulo, destino, progresso=None):
+    """
+    Escreve a planilha de processos em `destino` usando o modo write-only do
+    openpyxl: cada linha vai direto para o arquivo temporário da planilha em
+    vez de ficar em memória, e os processos são lidos do banco em lotes.
+    """
+    wb = Workbook(write_only=True)
+    for estilo in _estilos_planilha():
+        wb.add_named_style(estilo)
+
+    ws = wb.create_sheet("Processos")
+
+    # No modo write-only, larguras e painel congelado são definidos antes das linhas
+    for col_letter, width in LARGURAS_COLUNAS.items():
+        ws.column_dimensions[col_letter].width = width
+    # Congelar painel para manter cabeçalhos visíveis ao rolar
+    ws.freeze_panes = 'A3'
+
+    def celula(valor, estilo):
+        cell = WriteOnlyCell(ws, value=valor)
+        cell.style = estilo
+        return cell
+
+    # Título principal mesclado sobre todas as colunas
+    ws.append([celula(titulo, 'scpi_titulo')])
+    ws.merged_cells.add('A1:J1')
+
+    ws.append([celula(header, 'scpi_cabecalho') for header in CABECALHOS])
+
+    # Uma única dimensão de linha reaproveitada por todas as linhas de dados
+    altura_dados = RowDimension(ws, ht=ALTURA_LINHA_DADOS)
+
+    for row_num, linha in enumerate(linhas_exportacao(processos, progresso), 3):  # Começar da linha 3 (após título e cabeçalho)
+        # Aplicar cor de fundo alternada
+        if row_num % 2 == 0:
+            estilo_dado, estilo_texto = 'scpi_dado_zebra', 'scpi_texto_zebra'
+        else:
+            estilo_dado, estilo_texto = 'scpi_dado', 'scpi_texto'
+
+        cells = [celula(valor, estilo_dado) for valor in linha[:8]]
+        cells += [celula(valor, estilo_texto) for valor in linha[8:]]
+
+        # A altura só precisa existir enquanto a linha é escrita
+        ws.row_dimensions[row_num] = altura_dados
+        ws.append(cells)
+        del ws.row_dimensions[row_num]
+
+    wb.save(destino)
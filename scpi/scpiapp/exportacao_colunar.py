@@ -0,0 +1,110 @@
+import importlib.util
+
+from .models import Processo
+
+FORMATOS_COLUNARES = {
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('arrow', 'application/vnd.apache.arrow.file'),
+}
+
+# Linhas por record batch (e por row group no Parquet): lotes maiores que os
+# do CSV, porque cada lote vira um bloco comprimido e indexado do arquivo
+TAMANHO_LOTE_COLUNAR = 64 * 1024
+
+# Lidas do cursor do banco a cada ida, como nas outras exportações
+TAMANHO_LOTE_CURSOR = 2000
+
+COLUNAS_COLUNARES = (
+    'id', 'tabela_id', 'nome', 'matricula', 'numero_processo', 'data_abertura', 'data_retorno',
+    'setor', 'bolsa', 'status', 'assunto', 'observacoes', 'data_criacao', 'data_atualizacao',
+)
+
+# Os dicionários são fixos (as opções do modelo), então são os mesmos em
+# todos os lotes, como o formato de arquivo Arrow IPC exige
+CATEGORIAS = {
+    'setor': [valor for valor, _ in Processo.SetorOpcoes.choices],
+    'bolsa': [valor for valor, _ in Processo.BolsaOpcoes.choices],
+    'status': [valor for valor, _ in Processo.StatusProcesso.choices],
+}
+
+
+def exportacao_colunar_disponivel():
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def esquema(pa):
+    categoria = pa.dictionary(pa.int8(), pa.string())
+    return pa.schema([
+        ('id', pa.int64()),
+        ('tabela_id', pa.int64()),
+        ('tabela', pa.dictionary(pa.int32(), pa.string())),
+        ('nome', pa.string()),
+        ('matricula', pa.string()),
+        ('numero_processo', pa.string()),
+        ('data_abertura', pa.date32()),
+        ('data_retorno', pa.date32()),
+        ('setor', categoria),
+        ('bolsa', categoria),
+        ('status', categoria),
+        ('assunto', pa.string()),
+        ('observacoes', pa.string()),
+        ('data_criacao', pa.timestamp('us', tz='UTC')),
+        ('data_atualizacao', pa.timestamp('us', tz='UTC')),
+    ])
+
+
+def gerar_colunar(processos, tabelas, destino, formato='parquet', progresso=None):
+    """
+    Escreve os processos em `destino` no formato Parquet ou Arrow IPC
+    (arquivo), um record batch por vez, lendo o banco com um cursor.
+    Diferente do CSV, os tipos são preservados: datas como date32, criação
+    e atualização como timestamp UTC e setor, bolsa e status como colunas
+    categóricas. `tabelas` são as tabelas exportadas, cujos nomes formam o
+    dicionário da coluna `tabela`. Retorna o número de linhas.
+    """
+    # Importado só aqui: o pyarrow é pesado e só as exportações colunares o usam
+    import pyarrow as pa
+
+    schema = esquema(pa)
+    nomes_tabelas = pa.array([tabela.nome for tabela in tabelas], pa.string())
+    posicao_tabela = {tabela.id: posicao for posicao, tabela in enumerate(tabelas)}
+    dicionarios = {campo: pa.array(valores, pa.string()) for campo, valores in CATEGORIAS.items()}
+    posicoes = {campo: {valor: posicao for posicao, valor in enumerate(valores)} for campo, valores in CATEGORIAS.items()}
+
+    def record_batch(colunas):
+        arrays = []
+        for campo in schema.names:
+            if campo == 'tabela':
+                indices = pa.array([posicao_tabela.get(i) for i in colunas['tabela_id']], pa.int32())
+                arrays.append(pa.DictionaryArray.from_arrays(indices, nomes_tabelas))
+            elif campo in CATEGORIAS:
+                # Valores fora das opções do modelo (não gravados pela aplicação) ficam nulos
+                indices = pa.array([posicoes[campo].get(valor) for valor in colunas[campo]], pa.int8())
+                arrays.append(pa.DictionaryArray.from_arrays(indices, dicionarios[campo]))
+            else:
+                arrays.append(pa.array(colunas[campo], schema.field(campo).type))
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    if formato == 'arrow':
+        escritor = pa.ipc.new_file(destino, schema)
+    else:
+        import pyarrow.parquet as pq
+        escritor = pq.ParquetWriter(destino, schema, compression='zstd')
+
+    linhas = 0
+    with escritor:
+        colunas = {campo: [] for campo in COLUNAS_COLUNARES}
+        for linha in processos.order_by('id').values_list(*COLUNAS_COLUNARES).iterator(chunk_size=TAMANHO_LOTE_CURSOR):
+            for campo, valor in zip(COLUNAS_COLUNARES, linha):
+                colunas[campo].append(valor)
+            linhas += 1
+            if linhas % TAMANHO_LOTE_COLUNAR == 0:
+                escritor.write_batch(record_batch(colunas))
+                colunas = {campo: [] for campo in COLUNAS_COLUNARES}
+                if progresso:
+                    progresso(linhas)
+        if colunas['id'] or not linhas:
+            escritor.write_batch(record_batch(colunas))
+    if progresso:
+        progresso(linhas)
+    return linhas
@@ -65,6 +65,17 @@ class ProcessoForm(forms.ModelForm):
         }
 
 
+class ProcessoApiForm(ProcessoForm):
+    """
+    ProcessoForm usado pela API em lote. A unicidade do número do processo
+    é verificada pela API com uma consulta para o lote inteiro, e não com
+    uma consulta por registro.
+    """
+
+    def validate_unique(self):
+        pass
+
+
 class TabelaForm(forms.ModelForm):
     class Meta:
         model = TabelaProcessos
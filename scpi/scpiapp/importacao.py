@@ -0,0 +1,224 @@
+from datetime import datetime
+
+from django.db import transaction
+from openpyxl import load_workbook
+
+from .auditoria import auditoria_em_lote, registrar_criacao_processos
+from .contadores import contadores_adiados
+from .models import Processo
+
+# Quantidade de linhas da planilha verificadas e inseridas por vez
+TAMANHO_LOTE = 1000
+
+# Índices padrão (baseados na ordem da planilha exportada) e o cabeçalho
+# que pode substituí-los quando a planilha tiver as colunas em outra ordem
+COLUNAS_PLANILHA = [
+    ('nome', 'nome', 0),
+    ('matricula', 'matrícula', 1),
+    ('numero_processo', 'nº processo', 2),
+    ('data_abertura', 'data de abertura', 3),
+    ('data_retorno', 'data de retorno', 4),
+    ('setor', 'setor', 5),
+    ('bolsa', 'bolsa', 6),
+    ('status', 'status', 7),
+    ('assunto', 'assunto', 8),
+    ('observacoes', 'observações', 9),
+]
+
+FORMATOS_DATA = ['%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y', '%m/%d/%Y']
+
+
+def importar_planilha(arquivo, tabela, progresso=None, usuario=None):
+    """
+    Importa os processos de uma planilha .xlsx para a tabela informada.
+
+    A planilha é lida em modo somente leitura, linha a linha. A cada lote,
+    os números de processo são verificados em uma única consulta e as linhas
+    novas são gravadas com bulk_create, tudo dentro de uma transação.
+    Se informado, `progresso(linhas_lidas, total_estimado)` é chamado a cada lote.
+    A criação de cada processo entra na auditoria em nome de `usuario`, gravada
+    em lotes depois do commit.
+    Retorna (processos_importados, processos_ignorados, erros_detalhados).
+    """
+    workbook = load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        sheet = workbook.active
+
+        # Determinar cabeçalhos e suas posições
+        headers = None
+        for row in sheet.iter_rows(min_row=1, max_row=1, values_only=True):
+            headers = row
+            break
+        indices = _mapear_colunas(headers)
+        # Estimativa vinda das dimensões gravadas na planilha (pode não existir)
+        total_estimado = sheet.max_row - 1 if sheet.max_row else None
+
+        resultado = {'importados': 0, 'ignorados': 0, 'erros': []}
+        # Números de processo já vistos nesta planilha, para pegar duplicatas internas
+        numeros_vistos = set()
+
+        # Os contadores da tabela são ajustados uma vez só, no fim da importação,
+        # e a auditoria é gravada em lotes depois do commit
+        with transaction.atomic(), contadores_adiados(), auditoria_em_lote():
+            lote = []
+            for row_num, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
+                processo = _processo_da_linha(row, row_num, indices, tabela, resultado['erros'])
+                if processo is None:
+                    continue
+                lote.append((row_num, processo))
+                if len(lote) >= TAMANHO_LOTE:
+                    _gravar_lote(lote, numeros_vistos, resultado, tabela, usuario)
+                    lote = []
+                    if progresso:
+                        progresso(row_num - 1, total_estimado)
+            if lote:
+                _gravar_lote(lote, numeros_vistos, resultado, tabela, usuario)
+    finally:
+        workbook.close()
+
+    return resultado['importados'], resultado['ignorados'], resultado['erros']
+
+
+def _mapear_colunas(headers):
+    indices = {campo: padrao for campo, _, padrao in COLUNAS_PLANILHA}
+    # Se os cabeçalhos existirem, ajustar os índices
+    if headers:
+        header_map = {str(h).lower().strip() if h else "": i for i, h in enumerate(headers)}
+        for campo, cabecalho, padrao in COLUNAS_PLANILHA:
+            indices[campo] = header_map.get(cabecalho, padrao)
+    return indices
+
+
+def _valor(row, indice):
+    # Extrair valores de forma segura com valores padrão para campos faltantes
+    if len(row) > indice and row[indice]:
+        return row[indice]
+    return None
+
+
+def _converter_data(valor):
+    # Se for um objeto datetime do Excel
+    if hasattr(valor, 'date'):
+        return valor.date()
+    # Se for uma string, tenta vários formatos comuns de data
+    if isinstance(valor, str):
+        for fmt in FORMATOS_DATA:
+            try:
+                return datetime.strptime(valor, fmt).date()
+            except ValueError:
+                continue
+    return None
+
+
+def _converter_setor(setor):
+    if setor:
+        setor_upper = str(setor).upper()
+        if setor_upper == 'CIC' or setor_upper == 'COORDENAÇÃO DE INICIAÇÃO CIENTÍFICA':
+            return 'CIC'
+        elif setor_upper == 'DPQ' or setor_upper == 'DEPARTAMENTO DE PESQUISA':
+            return 'DPQ'
+    return None
+
+
+def _converter_bolsa(bolsa):
+    if bolsa:
+        bolsa_upper = str(bolsa).upper()
+        if bolsa_upper in ('SIM', 'S', 'TRUE', '1'):
+            return 'Sim'
+        elif bolsa_upper in ('NÃO', 'NAO', 'N', 'FALSE', '0'):
+            return 'Não'
+    return None
+
+
+def _converter_status(status):
+    if status:
+        status_upper = str(status).upper()
+        if 'CONCLU' in status_upper or status_upper == 'FINALIZADO':
+            return 'concluido'
+        elif 'ANDAMENTO' in status_upper or 'EM PROCESSO' in status_upper or 'ABERTO' in status_upper:
+            return 'em_andamento'
+    return None
+
+
+def _texto(valor):
+    # Valores numéricos da planilha são gravados como texto, como o Django faria ao salvar
+    return str(valor) if valor is not None else None
+
+
+def _processo_da_linha(row, row_num, indices, tabela, erros):
+    """Monta o Processo (ainda não salvo) de uma linha, ou None se ela for ignorada."""
+    # Verificar se pelo menos o nome existe; pular linhas vazias ou sem nome
+    if not row or not _valor(row, indices['nome']):
+        return None
+
+    datas = {}
+    for campo, descricao in (('data_abertura', 'data de abertura'), ('data_retorno', 'data de retorno')):
+        datas[campo] = None
+        try:
+            valor = _valor(row, indices[campo])
+            if valor:
+                datas[campo] = _converter_data(valor)
+        except Exception as date_error:
+            erros.append(f"Linha {row_num}: Erro ao processar {descricao}: {date_error}")
+
+    return Processo(
+        tabela=tabela,
+        nome=_valor(row, indices['nome']) or "",
+        matricula=_texto(_valor(row, indices['matricula'])),
+        numero_processo=_texto(_valor(row, indices['numero_processo'])),
+        data_abertura=datas['data_abertura'],
+        data_retorno=datas['data_retorno'],
+        setor=_converter_setor(_valor(row, indices['setor'])),
+        bolsa=_converter_bolsa(_valor(row, indices['bolsa'])),
+        status=_converter_status(_valor(row, indices['status'])),
+        assunto=_valor(row, indices['assunto']),
+        observacoes=_valor(row, indices['observacoes']),
+    )
+
+
+def _gravar_lote(lote, numeros_vistos, resultado, tabela, usuario):
+    erros = resultado['erros']
+
+    # Verificar, em uma única consulta, quais números do lote já existem no sistema
+    numeros = {processo.numero_processo for _, processo in lote if processo.numero_processo}
+    existentes = set(
+        Processo.objects.filter(numero_processo__in=numeros).values_list('numero_processo', flat=True)
+    ) if numeros else set()
+
+    novos = []
+    for row_num, processo in lote:
+        numero_processo = processo.numero_processo
+        if numero_processo and (numero_processo in existentes or numero_processo in numeros_vistos):
+            resultado['ignorados'] += 1
+            erros.append(f"Linha {row_num}: Processo com número '{numero_processo}' já existe no sistema.")
+            continue
+        if numero_processo:
+            numeros_vistos.add(numero_processo)
+        novos.append((row_num, processo))
+
+    if not novos:
+        return
+
+    # Só a gravação fica no try: uma falha depois dela, como na auditoria,
+    # não pode fazer o lote já gravado ser gravado de novo linha a linha
+    try:
+        with transaction.atomic():
+            Processo.objects.bulk_create([processo for _, processo in novos])
+    except Exception:
+        # Alguma linha do lote foi recusada pelo banco: grava uma a uma
+        # para aproveitar as demais e informar o erro da linha certa
+        for row_num, processo in novos:
+            try:
+                with transaction.atomic():
+                    processo.save(force_insert=True)
+            except Exception as inner_e:
+                # Log detalhado do erro específico desta linha
+                resultado['ignorados'] += 1
+                erros.append(f"Linha {row_num}: Erro ao criar processo - {str(inner_e)}")
+                continue
+            resultado['importados'] += 1
+            registrar_criacao_processos(usuario, [processo], tabela)
+        return
+
+    resultado['importados'] += len(novos)
+    registrar_criacao_processos(usuario, [processo for _, processo in novos], tabela)
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+
+from scpiapp.arquivamento import arquivar_auditoria, limite_arquivamento
+from scpiapp.models import Auditoria
+
+
+class Command(BaseCommand):
+    help = 'Move para arquivos compactados os eventos de auditoria mais antigos que a retenção.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias', type=int,
+            help='Dias de auditoria mantidos no banco (padrão: SCPI_AUDITORIA_DIAS_RETENCAO).'
+        )
+        parser.add_argument(
+            '--simular', action='store_true',
+            help='Só mostra quantos eventos de cada mês seriam arquivados.'
+        )
+
+    def handle(self, *args, **options):
+        limite = limite_arquivamento(options['dias'])
+        self.stdout.write(f'Arquivando eventos anteriores a {limite:%d/%m/%Y}.')
+
+        if options['simular']:
+            meses = (
+                Auditoria.objects.filter(data_evento__lt=limite)
+                .annotate(mes=TruncMonth('data_evento')).order_by('mes')
+                .values('mes').annotate(quantidade=Count('id'))
+            )
+            for linha in meses:
+                self.stdout.write(f'{linha["mes"]:%m/%Y}: {linha["quantidade"]} eventos')
+            return
+
+        arquivos = arquivar_auditoria(options['dias'])
+        for arquivo in arquivos:
+            self.stdout.write(f'{arquivo.mes:%m/%Y}: {arquivo.quantidade} eventos em {arquivo.arquivo.name}')
+        self.stdout.write(self.style.SUCCESS(f'{len(arquivos)} mês(es) arquivado(s).'))
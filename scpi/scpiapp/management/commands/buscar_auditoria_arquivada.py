@@ -0,0 +1,45 @@
+import json
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from scpiapp.arquivamento import buscar_arquivados
+
+
+class Command(BaseCommand):
+    help = 'Procura eventos no histórico de auditoria arquivado e os escreve em JSONL.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--acao', help='CRIAR, ATUALIZAR ou EXCLUIR.')
+        parser.add_argument('--usuario', type=int, help='Id do usuário.')
+        parser.add_argument('--processo', type=int, help='Id do processo.')
+        parser.add_argument('--tabela', type=int, help='Id da tabela.')
+        parser.add_argument('--inicio', help='Data inicial (AAAA-MM-DD).')
+        parser.add_argument('--fim', help='Data final, inclusive (AAAA-MM-DD).')
+        parser.add_argument('--texto', help='Trecho procurado nos detalhes.')
+
+    def handle(self, *args, **options):
+        inicio = self._data(options['inicio'])
+        fim = self._data(options['fim'])
+        if fim is not None:
+            fim = fim.replace(hour=23, minute=59, second=59, microsecond=999999)
+
+        encontrados = 0
+        for evento in buscar_arquivados(
+            inicio=inicio, fim=fim, texto=options['texto'],
+            acao=options['acao'], usuario_id=options['usuario'],
+            id_processo=options['processo'], id_tabela=options['tabela'],
+        ):
+            self.stdout.write(json.dumps(evento, ensure_ascii=False))
+            encontrados += 1
+        self.stderr.write(f'{encontrados} evento(s) encontrado(s).')
+
+    def _data(self, valor):
+        if not valor:
+            return None
+        data = parse_date(valor)
+        if data is None:
+            raise CommandError(f'Data inválida: {valor}')
+        return timezone.make_aware(datetime(data.year, data.month, data.day))
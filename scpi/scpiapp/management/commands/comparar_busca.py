@@ -0,0 +1,108 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+
+from scpiapp.busca import anotar_relevancia, filtrar_processos, filtrar_processos_icontains, motor_busca
+from scpiapp.models import Processo, TabelaProcessos, Usuario
+from scpiapp.paginacao import PROCESSOS_POR_PAGINA, ordenar_processos
+
+TERMOS_PADRAO = ['maria', 'silva', 'pesquisa', '2024', 'joao santos']
+
+NOMES = ['João', 'Maria', 'José', 'Ana', 'Francisco', 'Antônia', 'Carlos', 'Paula', 'Luiz', 'Fernanda']
+SOBRENOMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Lima', 'Pereira', 'Ferreira', 'Costa', 'Rodrigues', 'Almeida']
+PALAVRAS_ASSUNTO = [
+    'pesquisa', 'iniciação', 'científica', 'relatório', 'final', 'parcial', 'bolsa', 'renovação',
+    'projeto', 'cancelamento', 'substituição', 'orientador', 'edital', 'prorrogação', 'prazo',
+]
+
+
+class Command(BaseCommand):
+    help = 'Compara o tempo da busca textual indexada com a busca antiga por icontains.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('termos', nargs='*', help='Termos buscados (padrão: alguns nomes e palavras comuns).')
+        parser.add_argument('--tabela', type=int, help='Id da tabela de processos usada na comparação.')
+        parser.add_argument(
+            '--gerar', type=int, default=0,
+            help='Cria uma tabela temporária com N processos fictícios, apagada ao final.'
+        )
+        parser.add_argument('--repeticoes', type=int, default=5, help='Execuções de cada busca (padrão: 5).')
+
+    def handle(self, *args, **options):
+        termos = options['termos'] or TERMOS_PADRAO
+        connection = connections[router.db_for_read(Processo)]
+        self.stdout.write(f'Banco: {connection.vendor} (busca textual: {motor_busca(connection) or "indisponível"})')
+
+        tabela_gerada = None
+        if options['gerar']:
+            tabela_gerada = self._gerar_tabela(options['gerar'])
+            tabela = tabela_gerada
+        elif options['tabela']:
+            tabela = TabelaProcessos.objects.filter(id=options['tabela']).first()
+            if tabela is None:
+                raise CommandError(f'Tabela {options["tabela"]} não encontrada.')
+        else:
+            raise CommandError('Informe --tabela ou --gerar.')
+
+        try:
+            total = Processo.objects.filter(tabela=tabela).count()
+            self.stdout.write(f'Tabela "{tabela.nome}" com {total} processos, {options["repeticoes"]} repetições.\n')
+            self.stdout.write(f'{"termo":<20} {"resultados":>21} {"icontains":>12} {"textual":>12} {"ganho":>8}')
+            for termo in termos:
+                icontains = self._medir(
+                    filtrar_processos_icontains(tabela, termo),
+                    ordenar_processos(filtrar_processos_icontains(tabela, termo), 'nome', 'asc'),
+                    options['repeticoes']
+                )
+                textual = self._medir(
+                    filtrar_processos(tabela, termo),
+                    ordenar_processos(anotar_relevancia(filtrar_processos(tabela, termo), termo), 'relevancia', 'desc'),
+                    options['repeticoes']
+                )
+                ganho = icontains[1] / textual[1] if textual[1] else 0
+                self.stdout.write(
+                    f'{termo:<20} {icontains[0]:>10} / {textual[0]:<10} '
+                    f'{icontains[1] * 1000:>10.1f}ms {textual[1] * 1000:>10.1f}ms {ganho:>7.1f}x'
+                )
+        finally:
+            if tabela_gerada is not None:
+                tabela_gerada.delete()
+
+    def _medir(self, filtrados, pagina, repeticoes):
+        """Mediana do tempo de contar os resultados e buscar a primeira página, como a tela faz."""
+        tempos = []
+        quantidade = 0
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            quantidade = filtrados.all().count()
+            list(pagina.all()[:PROCESSOS_POR_PAGINA])
+            tempos.append(time.perf_counter() - inicio)
+        return quantidade, statistics.median(tempos)
+
+    def _gerar_tabela(self, quantidade):
+        self.stdout.write(f'Gerando {quantidade} processos fictícios...')
+        # Mesmo usuário padrão usado por adicionarTabela
+        usuario, _ = Usuario.objects.get_or_create(
+            id=1, defaults={'nome': 'Usuário Padrão', 'email': 'padrao@example.com'}
+        )
+        tabela = TabelaProcessos.objects.create(
+            nome='Comparação de busca', descricao='Tabela temporária criada pelo comando comparar_busca.',
+            usuario=usuario
+        )
+        aleatorio = random.Random(42)
+        lote = []
+        for i in range(quantidade):
+            lote.append(Processo(
+                tabela=tabela,
+                nome=f'{aleatorio.choice(NOMES)} {aleatorio.choice(SOBRENOMES)} {aleatorio.choice(SOBRENOMES)}',
+                numero_processo=f'23107.{i:06d}/{aleatorio.randint(2015, 2025)}-{aleatorio.randint(10, 99)}',
+                assunto=' '.join(aleatorio.choices(PALAVRAS_ASSUNTO, k=aleatorio.randint(5, 40))),
+            ))
+            if len(lote) >= 1000:
+                Processo.objects.bulk_create(lote)
+                lote = []
+        Processo.objects.bulk_create(lote)
+        return tabela
@@ -0,0 +1,131 @@
+import http.client
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from scpiapp.models import TabelaProcessos
+
+
+class Command(BaseCommand):
+    help = (
+        'Sobe o gunicorn (gunicorn.conf.py) em cada configuração informada e mede a vazão e a '
+        'latência (p50 e p99) da página de uma tabela. Cada configuração é uma lista de variáveis '
+        'de ambiente, por exemplo "WEB_CONCURRENCY=2,GUNICORN_THREADS=4" ou "SCPI_DB_POOL=0"; '
+        'use SCPI_CACHE_SEGUNDOS=0 para medir sem o cache de páginas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tabela', type=int, required=True, help='Id da tabela cuja página é medida.')
+        parser.add_argument(
+            '--configuracao', action='append', default=[],
+            help='Variáveis de ambiente da configuração, separadas por vírgula (pode repetir; padrão: a do arquivo).'
+        )
+        parser.add_argument('--requisicoes', type=int, default=1000, help='Requisições medidas em cada configuração (padrão: 1000).')
+        parser.add_argument('--concorrencia', type=int, default=16, help='Requisições simultâneas (padrão: 16).')
+        parser.add_argument('--porta', type=int, default=8765, help='Porta local do gunicorn (padrão: 8765).')
+
+    def handle(self, *args, **options):
+        tabela = TabelaProcessos.objects.filter(id=options['tabela']).first()
+        if tabela is None:
+            raise CommandError(f'Tabela {options["tabela"]} não encontrada.')
+        caminho = reverse('tabela_processos', args=[tabela.id])
+        configuracoes = options['configuracao'] or ['']
+        largura = max(len(configuracao or '(padrão)') for configuracao in configuracoes + ['configuração'])
+
+        self.stdout.write(
+            f'Tabela "{tabela.nome}" com {tabela.total_processos} processos: {options["requisicoes"]} requisições, '
+            f'{options["concorrencia"]} simultâneas.\n'
+        )
+        self.stdout.write(f'{"configuração":<{largura}} {"req/s":>8} {"p50":>9} {"p99":>9} {"erros":>6}')
+        for configuracao in configuracoes:
+            variaveis = self._variaveis(configuracao)
+            with self._servidor(variaveis, options['porta']):
+                # Aquecimento: conexões, pool e cache de páginas
+                self._disparar(options['porta'], caminho, options['concorrencia'] * 4, options['concorrencia'])
+                latencias, erros, duracao = self._disparar(
+                    options['porta'], caminho, options['requisicoes'], options['concorrencia']
+                )
+            if len(latencias) < 2:
+                raise CommandError(f'Nenhuma resposta válida na configuração "{configuracao}".')
+            percentis = statistics.quantiles(latencias, n=100)
+            self.stdout.write(
+                f'{configuracao or "(padrão)":<{largura}} {len(latencias) / duracao:>8.1f} '
+                f'{percentis[49] * 1000:>7.1f}ms {percentis[98] * 1000:>7.1f}ms {erros:>6}'
+            )
+
+    def _variaveis(self, configuracao):
+        variaveis = {}
+        for item in filter(None, (parte.strip() for parte in configuracao.split(','))):
+            nome, separador, valor = item.partition('=')
+            if not separador:
+                raise CommandError(f'Configuração inválida: "{item}" (use NOME=valor).')
+            variaveis[nome.strip()] = valor.strip()
+        return variaveis
+
+    @contextmanager
+    def _servidor(self, variaveis, porta):
+        ambiente = {**os.environ, **variaveis, 'PORT': str(porta), 'GUNICORN_ACCESSLOG': ''}
+        with tempfile.TemporaryFile() as log:
+            processo = subprocess.Popen(
+                [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'scpi.wsgi:application'],
+                cwd=settings.BASE_DIR, env=ambiente, stdout=log, stderr=subprocess.STDOUT
+            )
+            try:
+                self._esperar(porta, processo, log)
+                yield
+            finally:
+                processo.terminate()
+                processo.wait(timeout=30)
+
+    def _esperar(self, porta, processo, log, limite=30):
+        fim = time.monotonic() + limite
+        while time.monotonic() < fim:
+            if processo.poll() is not None:
+                log.seek(0)
+                raise CommandError('O gunicorn não iniciou:\n' + log.read().decode('utf-8', 'replace'))
+            try:
+                conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=1)
+                conexao.request('HEAD', '/')
+                conexao.getresponse()
+                conexao.close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f'O gunicorn não respondeu em {limite}s.')
+
+    def _disparar(self, porta, caminho, quantidade, concorrencia):
+        """Faz as requisições com `concorrencia` threads, cada uma com a sua conexão keep-alive."""
+        locais = threading.local()
+
+        def requisitar(_):
+            if getattr(locais, 'conexao', None) is None:
+                locais.conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=30)
+            inicio = time.perf_counter()
+            try:
+                locais.conexao.request('GET', caminho)
+                resposta = locais.conexao.getresponse()
+                resposta.read()
+            except (OSError, http.client.HTTPException):
+                locais.conexao.close()
+                locais.conexao = None
+                return None
+            if resposta.status != 200:
+                return None
+            return time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+            resultados = list(executor.map(requisitar, range(quantidade)))
+        duracao = time.perf_counter() - inicio
+        latencias = [latencia for latencia in resultados if latencia is not None]
+        return latencias, len(resultados) - len(latencias), duracao
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from scpiapp.tarefas import (
+    executar_tarefa, limpar_tarefas_antigas, proxima_tarefa, recuperar_tarefas_travadas
+)
+
+# Intervalo entre limpezas de tarefas antigas, em segundos
+INTERVALO_LIMPEZA = 60 * 60
+
+# Intervalo entre buscas de tarefas travadas, em segundos. Não só na
+# partida: com mais de um worker, o que continua rodando devolve para a
+# fila as tarefas de um que parou
+INTERVALO_RECUPERACAO = 60
+
+
+class Command(BaseCommand):
+    help = 'Executa as importações e exportações enfileiradas para processamento em segundo plano.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--uma-vez', action='store_true',
+            help='Processa as tarefas pendentes e encerra, em vez de continuar aguardando novas tarefas.'
+        )
+        parser.add_argument(
+            '--intervalo', type=float, default=2.0,
+            help='Segundos de espera entre consultas à fila quando não há tarefas (padrão: 2).'
+        )
+
+    def handle(self, *args, **options):
+        ultima_limpeza = None
+        ultima_recuperacao = None
+        while True:
+            close_old_connections()
+
+            if ultima_recuperacao is None or time.monotonic() - ultima_recuperacao > INTERVALO_RECUPERACAO:
+                recuperadas = recuperar_tarefas_travadas()
+                if recuperadas:
+                    self.stdout.write(f'{recuperadas} tarefa(s) interrompida(s) devolvida(s) para a fila.')
+                ultima_recuperacao = time.monotonic()
+
+            if ultima_limpeza is None or time.monotonic() - ultima_limpeza > INTERVALO_LIMPEZA:
+                limpar_tarefas_antigas()
+                ultima_limpeza = time.monotonic()
+
+            tarefa = proxima_tarefa()
+            if tarefa:
+                self.stdout.write(f'Executando {tarefa}...')
+                tarefa = executar_tarefa(tarefa)
+                self.stdout.write(f'{tarefa} finalizada.')
+                continue
+
+            if options['uma_vez']:
+                break
+            time.sleep(options['intervalo'])
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from scpiapp.contadores import recalcular_contadores
+
+
+class Command(BaseCommand):
+    help = 'Recalcula, a partir dos processos, os contadores de processos de cada tabela e o resumo do painel.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'tabelas', nargs='*', type=int,
+            help='Ids das tabelas a recalcular (padrão: todas).'
+        )
+
+    def handle(self, *args, **options):
+        atualizadas = recalcular_contadores(options['tabelas'] or None)
+        self.stdout.write(self.style.SUCCESS(f'Contadores e resumo de {atualizadas} tabela(s) recalculados.'))
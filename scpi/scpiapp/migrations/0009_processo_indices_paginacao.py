@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scpiapp', '0008_alter_processo_setor_alter_processo_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='processo',
+            index=models.Index(fields=['tabela', 'nome', 'id'], name='processo_tabela_nome_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='processo',
+            index=models.Index(fields=['tabela', 'data_abertura', 'id'], name='processo_tabela_abertura_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='processo',
+            index=models.Index(fields=['tabela', 'data_retorno', 'id'], name='processo_tabela_retorno_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:33
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scpiapp', '0009_processo_indices_paginacao'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarefa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('importar', 'Importação de planilha'), ('exportar_xlsx', 'Exportação para Excel'), ('exportar_csv', 'Exportação para CSV')], max_length=20)),
+                ('status', models.CharField(choices=[('pendente', 'Na fila'), ('executando', 'Em execução'), ('concluida', 'Concluída'), ('erro', 'Erro')], default='pendente', max_length=15)),
+                ('parametros', models.JSONField(blank=True, default=dict)),
+                ('arquivo_entrada', models.FileField(blank=True, null=True, upload_to='tarefas/entrada/')),
+                ('arquivo_resultado', models.FileField(blank=True, null=True, upload_to='tarefas/resultado/')),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('mensagem_erro', models.TextField(blank=True, null=True)),
+                ('total_itens', models.PositiveIntegerField(blank=True, null=True)),
+                ('itens_processados', models.PositiveIntegerField(default=0)),
+                ('data_criacao', models.DateTimeField(default=django.utils.timezone.now)),
+                ('data_inicio', models.DateTimeField(blank=True, null=True)),
+                ('data_fim', models.DateTimeField(blank=True, null=True)),
+                ('data_atualizacao', models.DateTimeField(blank=True, null=True)),
+                ('tabela', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tarefas', to='scpiapp.tabelaprocessos')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tarefas', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'data_criacao'], name='tarefa_fila_idx')],
+            },
+        ),
+    ]
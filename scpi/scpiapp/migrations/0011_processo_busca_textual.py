@@ -0,0 +1,41 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Colunas indexadas quando esta migração foi criada
+COLUNAS = ('nome', 'numero_processo', 'assunto')
+
+
+def instalar(apps, schema_editor):
+    from scpiapp.busca import instalar_indice_busca
+    instalar_indice_busca(schema_editor.connection, COLUNAS)
+
+
+def remover(apps, schema_editor):
+    from scpiapp.busca import remover_indice_busca
+    remover_indice_busca(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    """
+    Índice de busca textual sobre nome, numero_processo e assunto de Processo.
+    A implementação depende do banco (GIN no PostgreSQL, FULLTEXT no MySQL,
+    FTS5 no SQLite) e fica em scpiapp.busca.
+    """
+
+    dependencies = [
+        ('scpiapp', '0010_tarefa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessoBusca',
+            fields=[
+                ('processo', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='busca_textual', serialize=False, to='scpiapp.processo')),
+            ],
+            options={
+                'db_table': 'scpiapp_processo_busca',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(instalar, remover),
+    ]
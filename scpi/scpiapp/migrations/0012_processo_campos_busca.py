@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:47
+
+from django.db import migrations, models
+
+from scpiapp.normalizacao import normalizar_numero, normalizar_texto
+
+# Colunas do índice textual antes e depois desta migração
+COLUNAS_ANTERIORES = ('nome', 'numero_processo', 'assunto')
+COLUNAS = ('nome', 'numero_processo', 'assunto', 'nome_busca', 'numero_processo_busca')
+
+
+def preencher_campos_busca(apps, schema_editor):
+    Processo = apps.get_model('scpiapp', 'Processo')
+    lote = []
+    for processo in Processo.objects.only('id', 'nome', 'numero_processo').iterator(chunk_size=2000):
+        processo.nome_busca = normalizar_texto(processo.nome)
+        processo.numero_processo_busca = normalizar_numero(processo.numero_processo)
+        lote.append(processo)
+        if len(lote) >= 2000:
+            Processo.objects.bulk_update(lote, ['nome_busca', 'numero_processo_busca'])
+            lote = []
+    if lote:
+        Processo.objects.bulk_update(lote, ['nome_busca', 'numero_processo_busca'])
+
+
+def _recriar_indice_busca(schema_editor, colunas):
+    from scpiapp.busca import instalar_indice_busca, remover_indice_busca
+    remover_indice_busca(schema_editor.connection)
+    instalar_indice_busca(schema_editor.connection, colunas)
+
+
+def incluir_no_indice_busca(apps, schema_editor):
+    _recriar_indice_busca(schema_editor, COLUNAS)
+
+
+def retirar_do_indice_busca(apps, schema_editor):
+    _recriar_indice_busca(schema_editor, COLUNAS_ANTERIORES)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scpiapp', '0011_processo_busca_textual'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processo',
+            name='nome_busca',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='processo',
+            name='numero_processo_busca',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=50),
+        ),
+        migrations.RunPython(preencher_campos_busca, migrations.RunPython.noop),
+        # O índice textual passa a cobrir as colunas normalizadas
+        migrations.RunPython(incluir_no_indice_busca, retirar_do_indice_busca),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:51
+
+from django.db import migrations, models
+
+
+def preencher_contadores(apps, schema_editor):
+    from scpiapp.contadores import recalcular_contadores
+    recalcular_contadores(registro=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scpiapp', '0012_processo_campos_busca'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tabelaprocessos',
+            name='processos_cic',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tabelaprocessos',
+            name='processos_concluidos',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tabelaprocessos',
+            name='processos_dpq',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tabelaprocessos',
+            name='processos_em_andamento',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tabelaprocessos',
+            name='total_processos',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(preencher_contadores, migrations.RunPython.noop),
+    ]
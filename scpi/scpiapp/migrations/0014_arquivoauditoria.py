@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:55
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scpiapp', '0013_tabelaprocessos_contadores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArquivoAuditoria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField()),
+                ('arquivo', models.FileField(upload_to='auditoria/arquivo/')),
+                ('quantidade', models.PositiveIntegerField(default=0)),
+                ('primeiro_evento', models.DateTimeField()),
+                ('ultimo_evento', models.DateTimeField()),
+                ('acoes', models.JSONField(default=list)),
+                ('usuarios', models.JSONField(default=list)),
+                ('processos', models.JSONField(default=list)),
+                ('tabelas', models.JSONField(default=list)),
+                ('data_criacao', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['mes'], name='arquivo_auditoria_mes_idx')],
+            },
+        ),
+    ]
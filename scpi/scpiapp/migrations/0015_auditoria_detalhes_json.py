@@ -0,0 +1,110 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:20
+
+import json
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+TAMANHO_LOTE = 2000
+
+
+def chaves_dos_detalhes(detalhes):
+    """numero_processo, id_processo e id_tabela a partir dos detalhes de um evento."""
+    if not isinstance(detalhes, dict):
+        return None, None, None
+    processo = detalhes.get('processo_info') or {}
+    tabela = detalhes.get('tabela_info') or {}
+    return processo.get('numero_processo'), processo.get('id'), processo.get('tabela_id') or tabela.get('id')
+
+
+def converter_detalhes(apps, schema_editor):
+    Auditoria = apps.get_model('scpiapp', 'Auditoria')
+    campos = ['detalhes_json', 'numero_processo', 'id_processo', 'id_tabela']
+    lote = []
+    for auditoria in Auditoria.objects.only('id', 'detalhes').iterator(chunk_size=TAMANHO_LOTE):
+        if not auditoria.detalhes:
+            continue
+        try:
+            detalhes = json.loads(auditoria.detalhes)
+        except ValueError:
+            # Texto livre de versões antigas é preservado como está
+            detalhes = {'texto': auditoria.detalhes}
+        auditoria.detalhes_json = detalhes
+        auditoria.numero_processo, auditoria.id_processo, auditoria.id_tabela = chaves_dos_detalhes(detalhes)
+        lote.append(auditoria)
+        if len(lote) >= TAMANHO_LOTE:
+            Auditoria.objects.bulk_update(lote, campos)
+            lote = []
+    if lote:
+        Auditoria.objects.bulk_update(lote, campos)
+
+
+def voltar_detalhes_texto(apps, schema_editor):
+    Auditoria = apps.get_model('scpiapp', 'Auditoria')
+    lote = []
+    for auditoria in Auditoria.objects.only('id', 'detalhes_json').iterator(chunk_size=TAMANHO_LOTE):
+        if auditoria.detalhes_json is None:
+            continue
+        auditoria.detalhes = json.dumps(
+            auditoria.detalhes_json, ensure_ascii=False, cls=django.core.serializers.json.DjangoJSONEncoder
+        )
+        lote.append(auditoria)
+        if len(lote) >= TAMANHO_LOTE:
+            Auditoria.objects.bulk_update(lote, ['detalhes'])
+            lote = []
+    if lote:
+        Auditoria.objects.bulk_update(lote, ['detalhes'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scpiapp', '0014_arquivoauditoria'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auditoria',
+            name='numero_processo',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='auditoria',
+            name='id_processo',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='auditoria',
+            name='id_tabela',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        # Os detalhes passam de texto para JSON numa coluna nova, convertida
+        # linha a linha, para não depender da conversão de tipo de cada banco
+        migrations.AddField(
+            model_name='auditoria',
+            name='detalhes_json',
+            field=models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, null=True),
+        ),
+        migrations.RunPython(converter_detalhes, voltar_detalhes_texto),
+        migrations.RemoveField(
+            model_name='auditoria',
+            name='detalhes',
+        ),
+        migrations.RenameField(
+            model_name='auditoria',
+            old_name='detalhes_json',
+            new_name='detalhes',
+        ),
+        migrations.AddIndex(
+            model_name='auditoria',
+            index=models.Index(fields=['id_processo', 'data_evento', 'id'], name='auditoria_processo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditoria',
+            index=models.Index(fields=['numero_processo', 'data_evento', 'id'], name='auditoria_numero_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditoria',
+            index=models.Index(fields=['id_tabela', 'data_evento', 'id'], name='auditoria_tabela_idx'),
+        ),
+    ]
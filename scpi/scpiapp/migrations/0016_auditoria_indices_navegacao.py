@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scpiapp', '0015_auditoria_detalhes_json'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auditoria',
+            index=models.Index(fields=['data_evento', 'id'], name='auditoria_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditoria',
+            index=models.Index(fields=['acao', 'data_evento', 'id'], name='auditoria_acao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditoria',
+            index=models.Index(fields=['usuario', 'data_evento', 'id'], name='auditoria_usuario_idx'),
+        ),
+    ]
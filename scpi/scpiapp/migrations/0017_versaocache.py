@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scpiapp', '0016_auditoria_indices_navegacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersaoCache',
+            fields=[
+                ('chave', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('versao', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
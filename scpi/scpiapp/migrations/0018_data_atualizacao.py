@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:04
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def preencher_data_atualizacao(apps, schema_editor):
+    # Sem histórico de alterações, a melhor aproximação é a data de criação
+    for modelo in ('Processo', 'TabelaProcessos'):
+        apps.get_model('scpiapp', modelo).objects.update(data_atualizacao=F('data_criacao'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scpiapp', '0017_versaocache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processo',
+            name='data_atualizacao',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='tabelaprocessos',
+            name='data_atualizacao',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddField(
+            model_name='versaocache',
+            name='data_atualizacao',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(preencher_data_atualizacao, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scpiapp', '0018_data_atualizacao'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='processo',
+            index=models.Index(fields=['data_atualizacao', 'id'], name='processo_atualizacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='processo',
+            index=models.Index(fields=['tabela', 'data_atualizacao', 'id'], name='processo_tabela_atualiz_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def preencher_resumo(apps, schema_editor):
+    from scpiapp.contadores import recalcular_contadores
+    recalcular_contadores(registro=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scpiapp', '0019_processo_indices_sincronizacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoProcessos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('setor', models.CharField(max_length=100, null=True)),
+                ('status', models.CharField(max_length=20, null=True)),
+                ('bolsa', models.CharField(max_length=3, null=True)),
+                ('mes', models.DateField(null=True)),
+                ('quantidade', models.IntegerField(default=0)),
+                ('tabela', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumo', to='scpiapp.tabelaprocessos')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['tabela', 'mes', 'setor', 'status', 'bolsa'], name='resumo_processos_chave_idx')],
+            },
+        ),
+        migrations.RunPython(preencher_resumo, migrations.RunPython.noop),
+    ]
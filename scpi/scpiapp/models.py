@@ -1,8 +1,18 @@
-from django.db import models
+import json
+from collections import Counter
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, models, transaction
 from django.utils import timezone
 from django.contrib.auth.models import User
 from django.contrib.auth.hashers import make_password, check_password
 
+from .cache_paginas import invalidar_tabelas
+from .contadores import (
+    CAMPOS_CONTADOS, agrupar_contagem, ajustar_contadores, chave_contagem, mes_de, recalcular_contadores
+)
+from .normalizacao import normalizar_numero, normalizar_texto
+
 class Usuario(models.Model):
     class TiposUsuario(models.TextChoices):
         ADMIN = 'admin', 'Administrador'
@@ -34,10 +44,202 @@ class TabelaProcessos(models.Model):
     descricao = models.TextField(blank=True, null=True)
     usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='tabelas')
     data_criacao = models.DateTimeField(default=timezone.now)
+    # Última alteração na tabela ou em qualquer um dos seus processos
+    # (atualizada junto com a versão do cache, ver cache_paginas.py)
+    data_atualizacao = models.DateTimeField(default=timezone.now, editable=False)
+
+    # Contadores dos processos da tabela, mantidos por Processo e pelo
+    # ProcessoQuerySet (ver contadores.py); o comando recalcular_contadores
+    # os refaz a partir dos processos
+    total_processos = models.IntegerField(default=0, editable=False)
+    processos_cic = models.IntegerField(default=0, editable=False)
+    processos_dpq = models.IntegerField(default=0, editable=False)
+    processos_em_andamento = models.IntegerField(default=0, editable=False)
+    processos_concluidos = models.IntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.nome
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        invalidar_tabelas([self.pk])
+
+    def delete(self, *args, **kwargs):
+        tabela_id = self.pk
+        resultado = super().delete(*args, **kwargs)
+        invalidar_tabelas([tabela_id])
+        return resultado
+
+class ProcessoQuerySet(models.QuerySet):
+    # As operações em massa não passam por save() e delete(), então as colunas
+    # de busca, os contadores de TabelaProcessos e as versões do cache de
+    # páginas são mantidos aqui
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for processo in objs:
+            processo.atualizar_campos_busca()
+        with transaction.atomic(using=self.db):
+            com_conflitos = kwargs.get('ignore_conflicts') or kwargs.get('update_conflicts')
+            if com_conflitos:
+                # Linhas em conflito são ignoradas ou atualizam um processo que
+                # já existia, talvez em outra tabela, sem que se saiba quais:
+                # as tabelas envolvidas são recontadas
+                tabelas = self._tabelas_em_conflito(objs) | {processo.tabela_id for processo in objs}
+                criados = super().bulk_create(objs, *args, **kwargs)
+                recalcular_contadores(tabelas - {None})
+                invalidar_tabelas(tabelas)
+            else:
+                if connections[self.db].features.can_return_rows_from_bulk_insert:
+                    criados = super().bulk_create(objs, *args, **kwargs)
+                else:
+                    criados = self._bulk_create_com_ids(objs, *args, **kwargs)
+                ajustar_contadores(Counter(chave_contagem(processo) for processo in objs))
+                invalidar_tabelas({processo.tabela_id for processo in objs})
+        for processo in objs:
+            processo._contagem_original = chave_contagem(processo)
+        return criados
+
+    def _tabelas_em_conflito(self, objs):
+        # Tabelas dos processos já gravados com o id ou o número de algum dos novos
+        ids = [processo.pk for processo in objs if processo.pk is not None]
+        numeros = [processo.numero_processo for processo in objs if processo.numero_processo]
+        tabelas = set()
+        for inicio in range(0, max(len(ids), len(numeros)), 1000):
+            tabelas |= set(
+                self.model._default_manager.using(self.db).filter(
+                    models.Q(pk__in=ids[inicio:inicio + 1000]) |
+                    models.Q(numero_processo__in=numeros[inicio:inicio + 1000])
+                ).order_by().values_list('tabela_id', flat=True).distinct()
+            )
+        return tabelas
+
+    def _bulk_create_com_ids(self, objs, *args, **kwargs):
+        # O MySQL não devolve os ids de um INSERT com várias linhas, e a
+        # auditoria e a API precisam deles: os processos com número são
+        # relidos pelo número, que é único, e os sem número (sem chave para
+        # relê-los) são inseridos um a um, cada um com o seu id
+        com_numero, sem_numero = [], []
+        for processo in objs:
+            (sem_numero if processo.pk is None and not processo.numero_processo else com_numero).append(processo)
+        super().bulk_create(com_numero, *args, **kwargs)
+        por_numero = {processo.numero_processo: processo for processo in com_numero if processo.pk is None}
+        numeros = list(por_numero)
+        for inicio in range(0, len(numeros), 1000):
+            for pk, numero in self.filter(numero_processo__in=numeros[inicio:inicio + 1000]).values_list(
+                'pk', 'numero_processo'
+            ):
+                por_numero[numero].pk = pk
+        for processo in sem_numero:
+            # save_base, e não save(): os contadores são ajustados por bulk_create
+            models.Model.save_base(processo, using=self.db, force_insert=True)
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        fields = list(fields)
+        agora = timezone.now()
+        for processo in objs:
+            processo.atualizar_campos_busca()
+            processo.data_atualizacao = agora
+        if 'data_atualizacao' not in fields:
+            fields.append('data_atualizacao')
+        fields += [campo for campo in self.model.campos_busca_afetados(fields) if campo not in fields]
+        if not set(fields) & set(CAMPOS_CONTADOS):
+            alterados = super().bulk_update(objs, fields, *args, **kwargs)
+            invalidar_tabelas({processo.tabela_id for processo in objs})
+            return alterados
+
+        with transaction.atomic(using=self.db):
+            tabelas = set(
+                self.filter(pk__in=[processo.pk for processo in objs])
+                .values_list('tabela_id', flat=True).distinct()
+            )
+            alterados = super().bulk_update(objs, fields, *args, **kwargs)
+            tabelas |= {processo.tabela_id for processo in objs}
+            recalcular_contadores(tabelas - {None})
+            invalidar_tabelas(tabelas)
+        return alterados
+
+    def update(self, **kwargs):
+        kwargs.setdefault('data_atualizacao', timezone.now())
+        # Colunas de busca dos campos alterados: calculadas aqui a partir do
+        # novo valor ou, se ele vier de uma expressão do banco, refeitas
+        # depois a partir das linhas alteradas
+        refazer = []
+        for campo_busca in self.model.campos_busca_afetados(kwargs):
+            origem, normalizar = self.model.CAMPOS_BUSCA[campo_busca]
+            if hasattr(kwargs[origem], 'resolve_expression'):
+                refazer.append(campo_busca)
+            else:
+                kwargs[campo_busca] = normalizar(kwargs[origem])
+        if not refazer:
+            return self._atualizar(kwargs)
+
+        with transaction.atomic(using=self.db):
+            ids = list(self.order_by().values_list('pk', flat=True))
+            alterados = self._atualizar(kwargs)
+            self._refazer_campos_busca(ids, refazer)
+        return alterados
+
+    def _refazer_campos_busca(self, ids, campos):
+        origens = {self.model.CAMPOS_BUSCA[campo][0] for campo in campos}
+        todos = self.model._default_manager.using(self.db)
+        for inicio in range(0, len(ids), 1000):
+            processos = list(todos.filter(pk__in=ids[inicio:inicio + 1000]).only('pk', *origens))
+            for processo in processos:
+                for campo in campos:
+                    origem, normalizar = self.model.CAMPOS_BUSCA[campo]
+                    setattr(processo, campo, normalizar(getattr(processo, origem)))
+            # O bulk_update do QuerySet, e não o daqui: só as colunas de busca mudam
+            models.QuerySet.bulk_update(todos, processos, campos)
+
+    def _atualizar(self, kwargs):
+        if not set(kwargs) & set(CAMPOS_CONTADOS):
+            with transaction.atomic(using=self.db):
+                tabelas = set(self.order_by().values_list('tabela_id', flat=True).distinct())
+                alterados = super().update(**kwargs)
+                invalidar_tabelas(tabelas)
+            return alterados
+
+        with transaction.atomic(using=self.db):
+            antes = agrupar_contagem(self)
+            alterados = super().update(**kwargs)
+            # Posição de cada campo alterado na chave de contagem e o seu novo valor
+            novos = {}
+            if 'tabela' in kwargs or 'tabela_id' in kwargs:
+                novos[0] = kwargs.get('tabela_id', getattr(kwargs.get('tabela'), 'pk', kwargs.get('tabela')))
+            for posicao, campo in ((1, 'setor'), (2, 'status'), (3, 'bolsa'), (4, 'data_abertura')):
+                if campo in kwargs:
+                    novos[posicao] = kwargs[campo]
+            if any(hasattr(valor, 'resolve_expression') for valor in novos.values()):
+                # Valor calculado pelo banco: recontar as tabelas envolvidas
+                tabelas = {chave[0] for chave in antes}
+                if 0 in novos:
+                    tabelas |= set(self.values_list('tabela_id', flat=True).distinct())
+                recalcular_contadores(tabelas - {None})
+                invalidar_tabelas(tabelas)
+                return alterados
+            if 4 in novos:
+                novos[4] = mes_de(novos[4])
+
+            depois = Counter()
+            for chave, quantidade in antes.items():
+                depois[tuple(novos.get(posicao, valor) for posicao, valor in enumerate(chave))] += quantidade
+            ajustar_contadores(antes, -1)
+            ajustar_contadores(depois)
+            invalidar_tabelas({chave[0] for chave in antes} | {chave[0] for chave in depois})
+        return alterados
+
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            antes = agrupar_contagem(self)
+            resultado = super().delete()
+            ajustar_contadores(antes, -1)
+            invalidar_tabelas({chave[0] for chave in antes})
+        return resultado
+
+
 class Processo(models.Model):
     class StatusProcesso(models.TextChoices):
         EM_ANDAMENTO = 'em_andamento', 'Em Andamento'
@@ -63,10 +265,128 @@ class Processo(models.Model):
     observacoes = models.TextField(blank=True, null=True)
     tabela = models.ForeignKey(TabelaProcessos, on_delete=models.CASCADE, related_name='processos', null=True, blank=True)
     data_criacao = models.DateTimeField(default=timezone.now)
+    # Preenchida por save() e bulk_create(); update() e bulk_update() do ProcessoQuerySet a
+    # atualizam, junto com as colunas de busca abaixo
+    data_atualizacao = models.DateTimeField(auto_now=True)
+
+    # Cópias normalizadas para a busca (ver normalizacao.py), mantidas por
+    # save() e, no ProcessoQuerySet, por bulk_create(), bulk_update() e
+    # update(); com db_index o PostgreSQL também cria o índice
+    # varchar_pattern_ops que atende LIKE 'prefixo%'
+    nome_busca = models.CharField(max_length=255, default='', editable=False, db_index=True)
+    numero_processo_busca = models.CharField(max_length=50, default='', editable=False, db_index=True)
+
+    objects = ProcessoQuerySet.as_manager()
+
+    # Campo de origem de cada coluna de busca
+    CAMPOS_BUSCA = {
+        'nome_busca': ('nome', normalizar_texto),
+        'numero_processo_busca': ('numero_processo', normalizar_numero),
+    }
+
+    class Meta:
+        # Índices para a paginação por cursor da listagem de uma tabela,
+        # um para cada ordenação disponível, com o id como desempate
+        indexes = [
+            models.Index(fields=['tabela', 'nome', 'id'], name='processo_tabela_nome_idx'),
+            models.Index(fields=['tabela', 'data_abertura', 'id'], name='processo_tabela_abertura_idx'),
+            models.Index(fields=['tabela', 'data_retorno', 'id'], name='processo_tabela_retorno_idx'),
+            # Sincronização pela API: alterações em ordem de data_atualizacao
+            models.Index(fields=['data_atualizacao', 'id'], name='processo_atualizacao_idx'),
+            models.Index(fields=['tabela', 'data_atualizacao', 'id'], name='processo_tabela_atualiz_idx'),
+        ]
 
     def __str__(self):
         return f"Processo #{self.numero_processo} - {self.nome}"
 
+    def atualizar_campos_busca(self):
+        for campo_busca, (origem, normalizar) in self.CAMPOS_BUSCA.items():
+            setattr(self, campo_busca, normalizar(getattr(self, origem)))
+
+    @classmethod
+    def campos_busca_afetados(cls, campos):
+        return [campo_busca for campo_busca, (origem, _) in cls.CAMPOS_BUSCA.items() if origem in campos]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        processo = super().from_db(db, field_names, values)
+        # Chave de contagem como veio do banco, para ajustar os contadores ao salvar
+        if not processo.get_deferred_fields() & {'tabela_id', 'setor', 'status', 'bolsa', 'data_abertura'}:
+            processo._contagem_original = chave_contagem(processo)
+        return processo
+
+    def _contagem_no_banco(self):
+        if hasattr(self, '_contagem_original'):
+            return self._contagem_original
+        linha = Processo.objects.filter(pk=self.pk).values_list(
+            'tabela_id', 'setor', 'status', 'bolsa', 'data_abertura'
+        ).first()
+        return (*linha[:4], mes_de(linha[4])) if linha else None
+
+    def save(self, *args, **kwargs):
+        self.atualizar_campos_busca()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = (
+                set(update_fields) | set(self.campos_busca_afetados(update_fields)) | {'data_atualizacao'}
+            )
+            if not set(update_fields) & set(CAMPOS_CONTADOS):
+                super().save(*args, **kwargs)
+                invalidar_tabelas([self.tabela_id])
+                return
+
+        with transaction.atomic(using=kwargs.get('using')):
+            anterior = None if self._state.adding else self._contagem_no_banco()
+            super().save(*args, **kwargs)
+            atual = chave_contagem(self)
+            if anterior != atual:
+                ajustar_contadores(Counter({anterior: -1, atual: 1}) if anterior else Counter({atual: 1}))
+            invalidar_tabelas([self.tabela_id, anterior[0] if anterior else None])
+        self._contagem_original = atual
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            anterior = self._contagem_no_banco()
+            resultado = super().delete(*args, **kwargs)
+            if anterior:
+                ajustar_contadores(Counter({anterior: 1}), -1)
+                invalidar_tabelas([anterior[0]])
+        return resultado
+
+class ResumoProcessos(models.Model):
+    """
+    Quantos processos há em cada (tabela, setor, status, bolsa, mês de
+    abertura), para o painel. Mantido junto com os contadores da tabela
+    (ver contadores.py); o comando recalcular_contadores o refaz.
+    """
+    tabela = models.ForeignKey(TabelaProcessos, on_delete=models.CASCADE, related_name='resumo')
+    setor = models.CharField(max_length=100, null=True)
+    status = models.CharField(max_length=20, null=True)
+    bolsa = models.CharField(max_length=3, null=True)
+    # Primeiro dia do mês de data_abertura
+    mes = models.DateField(null=True)
+    quantidade = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['tabela', 'mes', 'setor', 'status', 'bolsa'], name='resumo_processos_chave_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tabela_id} {self.setor}/{self.status}/{self.bolsa} {self.mes}: {self.quantidade}"
+
+class ProcessoBusca(models.Model):
+    # Tabela FTS5 da busca textual no SQLite, criada e mantida por scpiapp.busca.
+    # Existe como modelo só para que a busca possa fazer o JOIN com Processo.
+    processo = models.OneToOneField(
+        Processo, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+        db_constraint=False, related_name='busca_textual'
+    )
+
+    class Meta:
+        managed = False
+        db_table = 'scpiapp_processo_busca'
+
 class Auditoria(models.Model):
     class AcoesAuditoria(models.TextChoices):
         CRIAR = 'CRIAR', 'Criar'
@@ -77,5 +397,121 @@ class Auditoria(models.Model):
     tabela = models.ForeignKey(TabelaProcessos, on_delete=models.SET_NULL, related_name='auditorias', null=True, blank=True)
     usuario = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='acoes_auditadas', null=True)
     acao = models.CharField(max_length=15, choices=AcoesAuditoria.choices, null=True)
-    detalhes = models.TextField(null=True)
-    data_evento = models.DateTimeField(default=timezone.now)
\ No newline at end of file
+    # Fotografia do processo ou da tabela e, nas atualizações, o antes e o
+    # depois de cada campo alterado (ver auditoria.py)
+    detalhes = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    data_evento = models.DateTimeField(default=timezone.now)
+
+    # Chaves copiadas dos detalhes para consulta indexada. Ao contrário das
+    # FKs acima, continuam preenchidas depois que o processo ou a tabela é excluído
+    numero_processo = models.CharField(max_length=50, null=True, blank=True)
+    id_processo = models.IntegerField(null=True, blank=True)
+    id_tabela = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        # Navegação da tela de auditoria (ordem por data e id, com ou sem
+        # filtro de ação ou usuário) e histórico de um processo ou tabela
+        indexes = [
+            models.Index(fields=['data_evento', 'id'], name='auditoria_data_idx'),
+            models.Index(fields=['acao', 'data_evento', 'id'], name='auditoria_acao_idx'),
+            models.Index(fields=['usuario', 'data_evento', 'id'], name='auditoria_usuario_idx'),
+            models.Index(fields=['id_processo', 'data_evento', 'id'], name='auditoria_processo_idx'),
+            models.Index(fields=['numero_processo', 'data_evento', 'id'], name='auditoria_numero_idx'),
+            models.Index(fields=['id_tabela', 'data_evento', 'id'], name='auditoria_tabela_idx'),
+        ]
+
+    @property
+    def detalhes_formatados(self):
+        return json.dumps(self.detalhes, ensure_ascii=False, indent=2, cls=DjangoJSONEncoder)
+
+    @property
+    def alteracoes(self):
+        """(campo, antes, depois) de cada campo alterado numa atualização."""
+        alteracoes = (self.detalhes or {}).get('alteracoes') or {}
+        return [(campo, valores.get('antes'), valores.get('depois')) for campo, valores in alteracoes.items()]
+
+class ArquivoAuditoria(models.Model):
+    """
+    Eventos de auditoria de um mês movidos do banco para um arquivo JSONL
+    compactado pelo comando arquivar_auditoria. As listas de ações, usuários,
+    processos e tabelas formam um índice resumido: a busca no histórico só
+    abre os arquivos que podem conter o que foi pedido.
+    """
+    mes = models.DateField()
+    arquivo = models.FileField(upload_to='auditoria/arquivo/')
+    quantidade = models.PositiveIntegerField(default=0)
+    primeiro_evento = models.DateTimeField()
+    ultimo_evento = models.DateTimeField()
+    acoes = models.JSONField(default=list)
+    usuarios = models.JSONField(default=list)
+    processos = models.JSONField(default=list)
+    tabelas = models.JSONField(default=list)
+    data_criacao = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['mes'], name='arquivo_auditoria_mes_idx'),
+        ]
+
+    def __str__(self):
+        return f"Auditoria de {self.mes:%m/%Y} ({self.quantidade} eventos)"
+
+class VersaoCache(models.Model):
+    """Versão das páginas em cache de uma tabela ou da lista de tabelas (ver cache_paginas.py)."""
+    chave = models.CharField(max_length=50, primary_key=True)
+    versao = models.BigIntegerField(default=0)
+    data_atualizacao = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.chave} (versão {self.versao})"
+
+class Tarefa(models.Model):
+    """Importação ou exportação executada em segundo plano pelo comando processar_tarefas."""
+
+    class TiposTarefa(models.TextChoices):
+        IMPORTAR = 'importar', 'Importação de planilha'
+        EXPORTAR_XLSX = 'exportar_xlsx', 'Exportação para Excel'
+        EXPORTAR_CSV = 'exportar_csv', 'Exportação para CSV'
+
+    class StatusTarefa(models.TextChoices):
+        PENDENTE = 'pendente', 'Na fila'
+        EXECUTANDO = 'executando', 'Em execução'
+        CONCLUIDA = 'concluida', 'Concluída'
+        ERRO = 'erro', 'Erro'
+
+    tipo = models.CharField(max_length=20, choices=TiposTarefa.choices)
+    status = models.CharField(max_length=15, choices=StatusTarefa.choices, default=StatusTarefa.PENDENTE)
+    tabela = models.ForeignKey(TabelaProcessos, on_delete=models.CASCADE, related_name='tarefas', null=True, blank=True)
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='tarefas', null=True, blank=True)
+    parametros = models.JSONField(default=dict, blank=True)
+    arquivo_entrada = models.FileField(upload_to='tarefas/entrada/', null=True, blank=True)
+    arquivo_resultado = models.FileField(upload_to='tarefas/resultado/', null=True, blank=True)
+    resultado = models.JSONField(null=True, blank=True)
+    mensagem_erro = models.TextField(null=True, blank=True)
+    total_itens = models.PositiveIntegerField(null=True, blank=True)
+    itens_processados = models.PositiveIntegerField(default=0)
+    data_criacao = models.DateTimeField(default=timezone.now)
+    data_inicio = models.DateTimeField(null=True, blank=True)
+    data_fim = models.DateTimeField(null=True, blank=True)
+    # Atualizado periodicamente enquanto a tarefa executa
+    data_atualizacao = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'data_criacao'], name='tarefa_fila_idx'),
+        ]
+
+    @property
+    def finalizada(self):
+        return self.status in (self.StatusTarefa.CONCLUIDA, self.StatusTarefa.ERRO)
+
+    @property
+    def progresso(self):
+        if self.status == self.StatusTarefa.CONCLUIDA:
+            return 100
+        if not self.total_itens:
+            return 0
+        return min(99, int(self.itens_processados * 100 / self.total_itens))
+
+    def __str__(self):
+        return f"Tarefa #{self.id} - {self.get_tipo_display()} ({self.get_status_display()})"
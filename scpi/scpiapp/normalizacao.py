@@ -0,0 +1,18 @@
+import re
+import unicodedata
+
+
+def normalizar_texto(valor):
+    """Minúsculas e sem acentos: "João Ávila" vira "joao avila"."""
+    if not valor:
+        return ''
+    decomposto = unicodedata.normalize('NFKD', str(valor))
+    sem_acentos = ''.join(c for c in decomposto if not unicodedata.combining(c))
+    return ' '.join(sem_acentos.lower().split())
+
+
+def normalizar_numero(valor):
+    """Só letras e dígitos: "23107.012345/2024-11" vira "23107012345202411"."""
+    if not valor:
+        return ''
+    return re.sub(r'[\W_]', '', normalizar_texto(valor))
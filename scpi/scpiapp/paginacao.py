@@ -0,0 +1,208 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connections
+from django.db.models import F, FloatField, Q
+
+# Campos pelos quais a listagem de processos pode ser ordenada
+ORDENACOES_PERMITIDAS = ('nome', 'data_abertura', 'data_retorno')
+ORDENACAO_PADRAO = 'nome'
+
+# Ordenação pela anotação criada pela busca textual (ver busca.py)
+ORDENACAO_RELEVANCIA = 'relevancia'
+
+PROCESSOS_POR_PAGINA = 50
+
+
+def normalizar_ordenacao(sort_by, sort_direction, query=None):
+    """
+    Garante que a ordenação recebida pela URL seja uma das suportadas.
+    Com busca, a ordenação padrão passa a ser por relevância, da maior
+    para a menor; sem busca não há relevância para ordenar.
+    """
+    if query and (sort_by is None or sort_by == ORDENACAO_RELEVANCIA):
+        if sort_direction not in ('asc', 'desc'):
+            sort_direction = 'desc'
+        return ORDENACAO_RELEVANCIA, sort_direction
+    if sort_by not in ORDENACOES_PERMITIDAS:
+        sort_by = ORDENACAO_PADRAO
+    if sort_direction not in ('asc', 'desc'):
+        sort_direction = 'asc'
+    return sort_by, sort_direction
+
+
+def ordenar_processos(processos, sort_by, sort_direction):
+    """
+    Ordena pelo campo escolhido usando o id como desempate, com valores
+    nulos sempre no final. É a mesma ordem usada pela paginação por cursor.
+    """
+    descendente = sort_direction == 'desc'
+    return processos.order_by(*_ordem(sort_by, descendente, nulos_no_fim=True))
+
+
+def codificar_cursor(valor, pk):
+    if hasattr(valor, 'isoformat'):
+        valor = valor.isoformat()
+    dados = json.dumps([valor, pk], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(dados).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor, campo):
+    """
+    Converte o cursor da URL de volta em (valor, pk). Retorna None se o
+    cursor for inválido, fazendo a listagem voltar para a primeira página.
+    """
+    if not cursor:
+        return None
+    try:
+        dados = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        valor, pk = json.loads(dados.decode('utf-8'))
+        valor = campo.to_python(valor) if valor is not None else None
+        return valor, int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, ValidationError):
+        return None
+
+
+def paginar_keyset(processos, sort_by, sort_direction, depois=None, antes=None,
+                   tamanho=PROCESSOS_POR_PAGINA):
+    """
+    Paginação por cursor (keyset) sobre (campo de ordenação, id).
+
+    Em vez de OFFSET, cada página filtra a partir da última linha da página
+    anterior, então o custo é o mesmo na primeira ou na milésima página.
+    `depois` avança a partir do cursor e `antes` volta para a página anterior.
+    A ordenação já deve vir validada (ver normalizar_ordenacao).
+    """
+    if sort_by == ORDENACAO_RELEVANCIA:
+        # A relevância é uma anotação, não um campo do modelo
+        campo = FloatField()
+    else:
+        campo = processos.model._meta.get_field(sort_by)
+    descendente = sort_direction == 'desc'
+    # Em colunas sem nulos a ordem fica sem NULLS FIRST/LAST, que impediria
+    # o PostgreSQL de percorrer o índice de trás para frente
+    anulavel = campo.null
+
+    voltando = False
+    cursor = decodificar_cursor(depois, campo)
+    if cursor is None:
+        cursor = decodificar_cursor(antes, campo)
+        voltando = cursor is not None
+
+    # Para voltar, percorremos a ordem invertida e desinvertemos o resultado
+    desc_consulta = descendente != voltando
+    nulos_no_fim = not voltando
+
+    consulta = processos
+    if cursor is not None:
+        consulta = consulta.filter(
+            _depois_do_cursor(sort_by, cursor, desc_consulta, nulos_no_fim, anulavel)
+        )
+    consulta = consulta.order_by(*_ordem(sort_by, desc_consulta, nulos_no_fim, anulavel))
+
+    itens = list(consulta[:tamanho + 1])
+    tem_mais = len(itens) > tamanho
+    itens = itens[:tamanho]
+    if voltando:
+        itens.reverse()
+
+    if voltando:
+        tem_proxima, tem_anterior = True, tem_mais
+    else:
+        tem_proxima, tem_anterior = tem_mais, cursor is not None
+
+    return {
+        'itens': itens,
+        'tem_proxima': tem_proxima and bool(itens),
+        'tem_anterior': tem_anterior and bool(itens),
+        'cursor_proximo': _cursor_do_item(itens[-1], sort_by) if itens else None,
+        'cursor_anterior': _cursor_do_item(itens[0], sort_by) if itens else None,
+    }
+
+
+def a_partir_do_cursor(consulta, sort_by, cursor=None):
+    """
+    Consulta em ordem crescente de (campo, id), começando depois da posição
+    `cursor` (o (valor, pk) de decodificar_cursor). Usada para percorrer
+    todas as linhas em lotes, como na sincronização pela API; o campo não
+    pode aceitar nulos.
+    """
+    if cursor is not None:
+        consulta = consulta.filter(_depois_do_cursor(sort_by, cursor, False, True, anulavel=False))
+    return consulta.order_by(*_ordem(sort_by, False, True, anulavel=False))
+
+
+def _cursor_do_item(item, sort_by):
+    return codificar_cursor(getattr(item, sort_by), item.pk)
+
+
+def _ordem(sort_by, descendente, nulos_no_fim, anulavel=True):
+    if not anulavel:
+        nulos = {}
+    elif nulos_no_fim:
+        nulos = {'nulls_last': True}
+    else:
+        nulos = {'nulls_first': True}
+    if descendente:
+        return (F(sort_by).desc(**nulos), '-id')
+    return (F(sort_by).asc(**nulos), 'id')
+
+
+def _depois_do_cursor(sort_by, cursor, descendente, nulos_no_fim, anulavel=True):
+    """Monta o filtro 'linhas que vêm depois de (valor, pk)' na ordem dada."""
+    valor, pk = cursor
+    op = 'lt' if descendente else 'gt'
+    id_depois = Q(**{f'id__{op}': pk})
+
+    if not anulavel:
+        if valor is None:
+            return Q(pk__in=[])
+        return Q(**{f'{sort_by}__{op}': valor}) | (Q(**{sort_by: valor}) & id_depois)
+
+    if valor is None:
+        filtro = Q(**{f'{sort_by}__isnull': True}) & id_depois
+        if not nulos_no_fim:
+            filtro |= Q(**{f'{sort_by}__isnull': False})
+        return filtro
+
+    filtro = Q(**{f'{sort_by}__{op}': valor}) | (Q(**{sort_by: valor}) & id_depois)
+    if nulos_no_fim:
+        filtro |= Q(**{f'{sort_by}__isnull': True})
+    return filtro
+
+
+def contar_com_limite(consulta, limite):
+    """
+    Conta as linhas da consulta, parando em limite + 1. O custo fica limitado
+    mesmo em tabelas enormes; um resultado maior que `limite` quer dizer
+    "mais de `limite`".
+    """
+    return consulta.order_by().values('pk')[:limite + 1].count()
+
+
+def estimar_total(consulta):
+    """
+    Estimativa de linhas feita pelo planejador do banco, sem executar a
+    consulta. Só existe no PostgreSQL e no MySQL; nos demais retorna None.
+    """
+    connection = connections[consulta.db]
+    sql, parametros = consulta.order_by().query.sql_with_params()
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, parametros)
+                plano = cursor.fetchone()[0]
+                if isinstance(plano, str):
+                    plano = json.loads(plano)
+                return int(plano[0]['Plan']['Plan Rows'])
+            if connection.vendor == 'mysql':
+                cursor.execute('EXPLAIN ' + sql, parametros)
+                colunas = [coluna[0] for coluna in cursor.description]
+                # Linhas examinadas pela tabela principal, reduzidas pela seletividade do filtro
+                linha = dict(zip(colunas, cursor.fetchone()))
+                return int((linha.get('rows') or 0) * float(linha.get('filtered') or 100) / 100)
+    except DatabaseError:
+        return None
+    return None
@@ -0,0 +1,83 @@
+from collections import Counter, defaultdict
+
+from .models import Processo, ResumoProcessos
+
+# Rótulo das linhas do resumo sem setor, status, bolsa ou data de abertura
+SEM_VALOR = 'Não informado'
+
+
+def linhas_resumo():
+    """
+    Todas as linhas do resumo, com o nome da tabela, em uma consulta: são
+    poucas centenas (uma por combinação existente de tabela, setor, status,
+    bolsa e mês), qualquer que seja o número de processos.
+    """
+    return list(
+        ResumoProcessos.objects.order_by()
+        .values_list('tabela_id', 'tabela__nome', 'setor', 'status', 'bolsa', 'mes', 'quantidade')
+    )
+
+
+def _por_opcao(contagem, opcoes):
+    grupos = [(valor, rotulo, contagem[valor]) for valor, rotulo in opcoes]
+    if contagem[None]:
+        grupos.append((None, SEM_VALOR, contagem[None]))
+    return grupos
+
+
+def montar_painel(linhas, tabela_id=None, ano=None):
+    """
+    Totais do painel a partir das linhas do resumo (de linhas_resumo()),
+    opcionalmente só de uma tabela e de um ano de abertura: total geral,
+    divisão por setor, status e bolsa, por tabela e por mês de abertura.
+    """
+    anos = sorted({mes.year for _, _, _, _, _, mes, _ in linhas if mes}, reverse=True)
+    if tabela_id is not None:
+        linhas = [linha for linha in linhas if linha[0] == tabela_id]
+    if ano is not None:
+        linhas = [linha for linha in linhas if linha[5] and linha[5].year == ano]
+
+    total = 0
+    setores, status, bolsas = Counter(), Counter(), Counter()
+    tabelas = {}
+    meses = defaultdict(Counter)
+    for tabela, nome, setor, situacao, bolsa, mes, quantidade in linhas:
+        total += quantidade
+        setores[setor] += quantidade
+        status[situacao] += quantidade
+        bolsas[bolsa] += quantidade
+        tabelas.setdefault(tabela, {'id': tabela, 'nome': nome, 'total': 0, 'status': Counter()})
+        tabelas[tabela]['total'] += quantidade
+        tabelas[tabela]['status'][situacao] += quantidade
+        meses[mes]['total'] += quantidade
+        meses[mes][situacao] += quantidade
+
+    maior_mes = max((contagem['total'] for contagem in meses.values()), default=0)
+    return {
+        'total': total,
+        'anos': anos,
+        'por_setor': _por_opcao(setores, Processo.SetorOpcoes.choices),
+        'por_status': _por_opcao(status, Processo.StatusProcesso.choices),
+        'por_bolsa': _por_opcao(bolsas, Processo.BolsaOpcoes.choices),
+        'por_tabela': [
+            {
+                'id': tabela['id'],
+                'nome': tabela['nome'],
+                'total': tabela['total'],
+                'em_andamento': tabela['status'][Processo.StatusProcesso.EM_ANDAMENTO],
+                'concluidos': tabela['status'][Processo.StatusProcesso.CONCLUIDO],
+            }
+            for tabela in sorted(tabelas.values(), key=lambda tabela: (tabela['nome'] or '').lower())
+        ],
+        # Meses com processos, do mais recente ao mais antigo; sem data de abertura por último
+        'por_mes': [
+            {
+                'mes': mes,
+                'total': contagem['total'],
+                'em_andamento': contagem[Processo.StatusProcesso.EM_ANDAMENTO],
+                'concluidos': contagem[Processo.StatusProcesso.CONCLUIDO],
+                'percentual': round(100 * contagem['total'] / maior_mes) if maior_mes else 0,
+            }
+            for mes, contagem in sorted(meses.items(), key=lambda item: (item[0] is not None, item[0]), reverse=True)
+        ],
+    }
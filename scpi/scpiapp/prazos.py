@@ -0,0 +1,147 @@
+import math
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Processo, TabelaProcessos
+
+PERCENTIS = (('mediana', 0.5), ('p90', 0.9), ('p99', 0.99))
+
+# Processos em andamento abertos há mais tempo que o p90 do seu setor
+PERCENTIL_ATRASO = 'p90'
+
+# Quantos processos atrasados a página lista, dos abertos há mais tempo
+LIMITE_ATRASADOS = 200
+
+# Rótulo do grupo de processos sem setor ou sem bolsa
+SEM_VALOR = 'Não informado'
+
+
+def _percentis_por_grupo(codigos, dias, quantidade_grupos):
+    """
+    Quantidade, média e percentis (interpolação linear, como np.percentile)
+    dos dias de cada grupo, todos de uma vez: os valores são ordenados por
+    grupo e por duração, e cada percentil é lido na posição calculada a
+    partir do início e do tamanho de cada grupo, sem laço por grupo.
+    """
+    ordem = np.lexsort((dias, codigos))
+    ordenados = dias[ordem]
+    quantidades = np.bincount(codigos, minlength=quantidade_grupos)
+    inicios = np.concatenate(([0], np.cumsum(quantidades)[:-1]))
+
+    resultado = {
+        'quantidade': quantidades,
+        'media': np.bincount(codigos, weights=dias, minlength=quantidade_grupos) / np.maximum(quantidades, 1),
+    }
+    for nome, fracao in PERCENTIS:
+        posicao = inicios + fracao * np.maximum(quantidades - 1, 0)
+        abaixo = np.floor(posicao).astype(np.int64)
+        acima = np.ceil(posicao).astype(np.int64)
+        resultado[nome] = ordenados[abaixo] + (ordenados[acima] - ordenados[abaixo]) * (posicao - abaixo)
+    return resultado
+
+
+def _linha(estatisticas, i, **extras):
+    # Números do NumPy viram int e float, para o resultado poder ir para o cache
+    linha = dict(extras)
+    for campo, valores in estatisticas.items():
+        linha[campo] = int(valores[i]) if campo == 'quantidade' else round(float(valores[i]), 1)
+    return linha
+
+
+def _agrupar(valores, dias, rotulos=None, vazio=''):
+    # np.unique ordena os valores entre si: o grupo sem valor (None) recebe
+    # `vazio`, do mesmo tipo dos outros ('' para texto, -1 para ids)
+    valores = np.array([vazio if valor is None else valor for valor in valores], dtype=object)
+    grupos, codigos = np.unique(valores, return_inverse=True)
+    estatisticas = _percentis_por_grupo(codigos, dias, len(grupos))
+    return [
+        _linha(
+            estatisticas, i,
+            valor=None if grupo == vazio else grupo,
+            rotulo=SEM_VALOR if grupo == vazio else (rotulos or {}).get(grupo, grupo),
+        )
+        for i, grupo in enumerate(grupos)
+    ]
+
+
+def analisar_prazos(tabela_id=None, hoje=None):
+    """
+    Tempo de tramitação (dias entre abertura e retorno) dos processos
+    concluídos, da tabela informada ou de todas: mediana, p90 e p99 no
+    geral, por setor, por bolsa e por tabela, e os processos em andamento
+    abertos há mais tempo que o p90 do seu setor (ou o geral, para setores
+    sem processos concluídos).
+
+    As durações vêm de uma única consulta, só com as colunas necessárias,
+    e são calculadas como arrays do NumPy; a lista de atrasados é filtrada
+    no banco com os limites calculados.
+    """
+    hoje = hoje or timezone.localdate()
+    processos = Processo.objects.all()
+    if tabela_id is not None:
+        processos = processos.filter(tabela_id=tabela_id)
+
+    linhas = list(
+        processos.filter(
+            status=Processo.StatusProcesso.CONCLUIDO, data_abertura__isnull=False, data_retorno__isnull=False
+        ).order_by().values_list('tabela_id', 'setor', 'bolsa', 'data_abertura', 'data_retorno')
+    )
+    dados = {'total': 0, 'geral': None, 'por_setor': [], 'por_bolsa': [], 'por_tabela': [], 'atrasados': []}
+    if not linhas:
+        return dados
+
+    tabelas, setores, bolsas, aberturas, retornos = zip(*linhas)
+    dias = (
+        np.array(retornos, dtype='datetime64[D]') - np.array(aberturas, dtype='datetime64[D]')
+    ).astype(np.float64)
+    # Retorno anterior à abertura é erro de digitação, não tramitação
+    validos = dias >= 0
+    if not validos.any():
+        return dados
+    dias = dias[validos]
+    tabelas, setores, bolsas = (np.array(coluna, dtype=object)[validos] for coluna in (tabelas, setores, bolsas))
+
+    nomes = dict(TabelaProcessos.objects.filter(pk__in=set(tabelas)).values_list('id', 'nome'))
+    dados.update({
+        'total': int(len(dias)),
+        'geral': _linha(_percentis_por_grupo(np.zeros(len(dias), dtype=np.int64), dias, 1), 0),
+        'por_setor': _agrupar(setores, dias),
+        'por_bolsa': _agrupar(bolsas, dias),
+        'por_tabela': sorted(
+            _agrupar(tabelas, dias, nomes, vazio=-1),
+            key=lambda linha: str(linha['rotulo']).lower()
+        ),
+    })
+    dados['atrasados'] = processos_atrasados(processos, dados, hoje)
+    return dados
+
+
+def processos_atrasados(processos, dados, hoje):
+    """
+    Processos em andamento abertos há mais dias que o limite do seu setor
+    (PERCENTIL_ATRASO dos concluídos), dos abertos há mais tempo aos mais
+    recentes, até LIMITE_ATRASADOS.
+    """
+    limites = {linha['valor']: linha[PERCENTIL_ATRASO] for linha in dados['por_setor']}
+    geral = dados['geral'][PERCENTIL_ATRASO]
+
+    filtro = Q()
+    for setor in [valor for valor, _ in Processo.SetorOpcoes.choices] + [None]:
+        limite = limites.get(setor, geral)
+        corte = hoje - timedelta(days=math.floor(limite))
+        filtro |= Q(setor=setor, data_abertura__lt=corte) if setor else Q(setor__isnull=True, data_abertura__lt=corte)
+
+    atrasados = []
+    for processo in (
+        processos.filter(filtro, status=Processo.StatusProcesso.EM_ANDAMENTO)
+        .order_by('data_abertura', 'id')
+        .values('id', 'nome', 'numero_processo', 'setor', 'data_abertura', 'tabela_id', 'tabela__nome')
+        [:LIMITE_ATRASADOS]
+    ):
+        processo['dias_aberto'] = (hoje - processo['data_abertura']).days
+        processo['limite'] = limites.get(processo['setor'], geral)
+        atrasados.append(processo)
+    return atrasados
@@ -0,0 +1,113 @@
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import FileResponse
+
+# Cookie com o instante até o qual as leituras do navegador ficam no banco
+# principal, depois de uma gravação
+COOKIE_PRIMARIO = 'scpi_primario'
+
+METODOS_SEGUROS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_estado = threading.local()
+
+
+@contextmanager
+def _na_replica():
+    anterior = getattr(_estado, 'replica', False)
+    _estado.replica = True
+    try:
+        yield
+    finally:
+        _estado.replica = anterior
+
+
+def _iterar_na_replica(conteudo):
+    # O conteúdo de uma resposta em streaming é gerado depois que a view retorna
+    with _na_replica():
+        yield from conteudo
+
+
+def fixado_no_primario(request):
+    """Se o navegador gravou algo há menos de SCPI_REPLICA_FIXAR_SEGUNDOS."""
+    try:
+        return float(request.COOKIES.get(COOKIE_PRIMARIO, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def ler_da_replica(view):
+    """
+    As leituras da view num GET (e do conteúdo da resposta, se for em
+    streaming) vão para a réplica, se houver uma configurada. Depois de uma
+    gravação do mesmo navegador, por SCPI_REPLICA_FIXAR_SEGUNDOS, e depois
+    de qualquer gravação dentro da própria view, as leituras voltam ao banco
+    principal, para o usuário sempre ver o que acabou de gravar.
+    """
+    @wraps(view)
+    def view_na_replica(request, *args, **kwargs):
+        if not settings.SCPI_REPLICA or request.method not in METODOS_SEGUROS or fixado_no_primario(request):
+            return view(request, *args, **kwargs)
+        with _na_replica():
+            response = view(request, *args, **kwargs)
+        if response.streaming and not isinstance(response, FileResponse):
+            response.streaming_content = _iterar_na_replica(response.streaming_content)
+        return response
+    return view_na_replica
+
+
+class FixarPrimarioMiddleware:
+    """
+    Depois de uma requisição que pode ter gravado (POST, PUT, DELETE...) ou
+    que gravou de fato, marca o navegador para ler do banco principal pelos
+    próximos SCPI_REPLICA_FIXAR_SEGUNDOS, o atraso tolerado da réplica.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _estado.gravou = False
+        response = self.get_response(request)
+        if settings.SCPI_REPLICA and (request.method not in METODOS_SEGUROS or _estado.gravou):
+            segundos = settings.SCPI_REPLICA_FIXAR_SEGUNDOS
+            response.set_cookie(
+                COOKIE_PRIMARIO, str(int(time.time() + segundos)), max_age=segundos, httponly=True, samesite='Lax'
+            )
+        return response
+
+
+class RoteadorReplica:
+    """
+    Leituras das views marcadas com ler_da_replica vão para a réplica
+    (o alias em SCPI_REPLICA); todo o resto, e toda gravação, vai para o
+    banco principal. Dentro de uma transação no principal as leituras
+    também ficam nele, para enxergar o que a transação já gravou.
+    """
+
+    def db_for_read(self, model, **hints):
+        if (
+            settings.SCPI_REPLICA and getattr(_estado, 'replica', False)
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return settings.SCPI_REPLICA
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Uma gravação no meio da view: o resto dela lê do principal
+        _estado.replica = False
+        _estado.gravou = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # A réplica recebe o esquema do principal pela replicação
+        if settings.SCPI_REPLICA and db == settings.SCPI_REPLICA:
+            return False
+        return None
@@ -0,0 +1,217 @@
+import logging
+import tempfile
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import DatabaseError, connection
+from django.utils import timezone
+
+from .busca import anotar_relevancia, filtrar_processos
+from .exportacao import compactar_gzip, gerar_csv, gerar_xlsx, titulo_exportacao
+from .importacao import importar_planilha
+from .models import Tarefa
+from .paginacao import ORDENACAO_RELEVANCIA, normalizar_ordenacao, ordenar_processos
+
+logger = logging.getLogger(__name__)
+
+# Tarefa em execução sem sinal de vida há mais tempo que isso volta para a fila
+TEMPO_LIMITE_SEM_ATUALIZACAO = timedelta(minutes=10)
+
+
+def exportacao_em_segundo_plano(total_linhas):
+    return total_linhas > settings.SCPI_TAREFAS_LIMITE_LINHAS
+
+
+def importacao_em_segundo_plano(arquivo):
+    return arquivo.size > settings.SCPI_TAREFAS_LIMITE_UPLOAD
+
+
+def enfileirar_exportacao(tipo, tabela, usuario, parametros, total_itens):
+    """
+    Coloca uma exportação na fila. Se o mesmo usuário já tiver pedido a mesma
+    exportação e ela ainda não terminou, reaproveita a tarefa existente.
+    """
+    existente = Tarefa.objects.filter(
+        tipo=tipo,
+        tabela=tabela,
+        usuario=usuario,
+        parametros=parametros,
+        status__in=[Tarefa.StatusTarefa.PENDENTE, Tarefa.StatusTarefa.EXECUTANDO],
+    ).first()
+    if existente:
+        return existente
+    return Tarefa.objects.create(
+        tipo=tipo,
+        tabela=tabela,
+        usuario=usuario,
+        parametros=parametros,
+        total_itens=total_itens,
+    )
+
+
+def enfileirar_importacao(tabela, usuario, arquivo):
+    tarefa = Tarefa(tipo=Tarefa.TiposTarefa.IMPORTAR, tabela=tabela, usuario=usuario)
+    tarefa.arquivo_entrada.save(arquivo.name, arquivo, save=False)
+    tarefa.save()
+    return tarefa
+
+
+def proxima_tarefa():
+    """
+    Reserva a tarefa pendente mais antiga. A reserva é um UPDATE condicionado
+    ao status, então dois workers nunca pegam a mesma tarefa.
+    """
+    candidatas = Tarefa.objects.filter(
+        status=Tarefa.StatusTarefa.PENDENTE
+    ).order_by('data_criacao', 'id').values_list('id', flat=True)[:10]
+
+    for tarefa_id in candidatas:
+        agora = timezone.now()
+        reservada = Tarefa.objects.filter(
+            id=tarefa_id, status=Tarefa.StatusTarefa.PENDENTE
+        ).update(status=Tarefa.StatusTarefa.EXECUTANDO, data_inicio=agora, data_atualizacao=agora)
+        if reservada:
+            return Tarefa.objects.select_related('tabela').get(id=tarefa_id)
+    return None
+
+
+def recuperar_tarefas_travadas():
+    """Devolve para a fila tarefas cujo worker parou no meio da execução."""
+    limite = timezone.now() - TEMPO_LIMITE_SEM_ATUALIZACAO
+    return Tarefa.objects.filter(
+        status=Tarefa.StatusTarefa.EXECUTANDO, data_atualizacao__lt=limite
+    ).update(status=Tarefa.StatusTarefa.PENDENTE, itens_processados=0)
+
+
+def limpar_tarefas_antigas():
+    """Remove tarefas finalizadas há mais de SCPI_TAREFAS_DIAS_RETENCAO dias e seus arquivos."""
+    limite = timezone.now() - timedelta(days=settings.SCPI_TAREFAS_DIAS_RETENCAO)
+    antigas = Tarefa.objects.filter(
+        status__in=[Tarefa.StatusTarefa.CONCLUIDA, Tarefa.StatusTarefa.ERRO],
+        data_fim__lt=limite,
+    )
+    removidas = 0
+    for tarefa in antigas.iterator():
+        for arquivo in (tarefa.arquivo_entrada, tarefa.arquivo_resultado):
+            if arquivo:
+                arquivo.delete(save=False)
+        tarefa.delete()
+        removidas += 1
+    return removidas
+
+
+def executar_tarefa(tarefa):
+    acompanhamento = _Acompanhamento(tarefa)
+    acompanhamento.start()
+    try:
+        if tarefa.tipo == Tarefa.TiposTarefa.IMPORTAR:
+            _executar_importacao(tarefa, acompanhamento)
+        else:
+            _executar_exportacao(tarefa, acompanhamento)
+        tarefa.status = Tarefa.StatusTarefa.CONCLUIDA
+    except Exception as e:
+        logger.exception("Erro ao executar a tarefa %s", tarefa.id)
+        tarefa.status = Tarefa.StatusTarefa.ERRO
+        tarefa.mensagem_erro = str(e)
+    finally:
+        acompanhamento.parar()
+
+    tarefa.itens_processados = acompanhamento.processados
+    if acompanhamento.total is not None:
+        tarefa.total_itens = acompanhamento.total
+    tarefa.data_fim = timezone.now()
+    tarefa.data_atualizacao = tarefa.data_fim
+    tarefa.save()
+    return tarefa
+
+
+def _executar_importacao(tarefa, acompanhamento):
+    with tarefa.arquivo_entrada.open('rb') as arquivo:
+        importados, ignorados, erros = importar_planilha(
+            arquivo, tarefa.tabela, acompanhamento.atualizar, usuario=tarefa.usuario
+        )
+    tarefa.resultado = {
+        'importados': importados,
+        'ignorados': ignorados,
+        'erros': erros,
+    }
+    # A planilha enviada não é mais necessária depois de importada
+    tarefa.arquivo_entrada.delete(save=False)
+
+
+def _executar_exportacao(tarefa, acompanhamento):
+    tabela = tarefa.tabela
+    parametros = tarefa.parametros
+    query = parametros.get('q')
+    sort_by, sort_direction = normalizar_ordenacao(
+        parametros.get('sort'), parametros.get('direction'), query
+    )
+
+    processos = filtrar_processos(tabela, query)
+    if sort_by == ORDENACAO_RELEVANCIA:
+        processos = anotar_relevancia(processos, query)
+    processos = ordenar_processos(processos, sort_by, sort_direction)
+    titulo = titulo_exportacao(tabela, query, sort_by, sort_direction)
+
+    with tempfile.TemporaryFile() as arquivo:
+        if tarefa.tipo == Tarefa.TiposTarefa.EXPORTAR_XLSX:
+            nome_arquivo = f'processos_{tabela.nome}.xlsx'
+            gerar_xlsx(processos, titulo, arquivo, acompanhamento.atualizar)
+        else:
+            nome_arquivo = f'processos_{tabela.nome}.csv'
+            blocos = gerar_csv(processos, titulo, acompanhamento.atualizar)
+            if parametros.get('gzip'):
+                nome_arquivo += '.gz'
+                blocos = compactar_gzip(blocos)
+            for bloco in blocos:
+                arquivo.write(bloco)
+        arquivo.seek(0)
+        tarefa.arquivo_resultado.save(nome_arquivo, File(arquivo), save=False)
+
+    tarefa.resultado = {'linhas': acompanhamento.processados, 'nome_arquivo': nome_arquivo}
+
+
+class _Acompanhamento(threading.Thread):
+    """
+    Grava o progresso da tarefa periodicamente a partir de uma thread separada.
+    Como cada thread tem sua própria conexão com o banco, o progresso fica
+    visível mesmo enquanto a importação roda dentro de uma transação.
+    """
+
+    INTERVALO = 2
+
+    def __init__(self, tarefa):
+        super().__init__(daemon=True)
+        self.tarefa_id = tarefa.id
+        self.processados = 0
+        self.total = tarefa.total_itens
+        self._parar = threading.Event()
+
+    def atualizar(self, processados, total=None):
+        self.processados = processados
+        if total is not None:
+            self.total = total
+
+    def parar(self):
+        self._parar.set()
+        self.join()
+
+    def run(self):
+        try:
+            while not self._parar.wait(self.INTERVALO):
+                self._gravar()
+        finally:
+            connection.close()
+
+    def _gravar(self):
+        campos = {'itens_processados': self.processados, 'data_atualizacao': timezone.now()}
+        if self.total is not None:
+            campos['total_itens'] = self.total
+        try:
+            Tarefa.objects.filter(
+                id=self.tarefa_id, status=Tarefa.StatusTarefa.EXECUTANDO
+            ).update(**campos)
+        except DatabaseError as e:
+            logger.warning("Não foi possível atualizar o progresso da tarefa %s: %s", self.tarefa_id, e)
@@ -1,3 +1,1500 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import json
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+from functools import partial
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Value
+from django.db.models.functions import Concat
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from openpyxl import Workbook, load_workbook
+
+from . import auditoria, exportacao, importacao
+from .arquivamento import arquivar_auditoria, buscar_arquivados
+from .busca import anotar_relevancia, filtrar_processos, motor_busca
+from .contadores import recalcular_contadores
+from .estatisticas import estatisticas_processos
+from .exportacao_colunar import exportacao_colunar_disponivel
+from .importacao import importar_planilha
+from .paginacao import ORDENACOES_PERMITIDAS, codificar_cursor, ordenar_processos, paginar_keyset
+from .prazos import analisar_prazos
+from .tarefas import _Acompanhamento, proxima_tarefa, recuperar_tarefas_travadas
+from .replica import COOKIE_PRIMARIO, FixarPrimarioMiddleware, RoteadorReplica, ler_da_replica
+from .models import (
+    ArquivoAuditoria, Auditoria, Processo, ProcessoQuerySet, ResumoProcessos, TabelaProcessos, Tarefa, Usuario
+)
+
+
+def criar_tabela_exemplo():
+    """Tabela com quatro processos, um deles sem setor, status nem bolsa."""
+    # Deixa em cache a detecção do FTS5, feita uma vez por conexão
+    motor_busca(connection)
+    usuario = Usuario.objects.create(nome='Teste', email='teste@example.com')
+    tabela = TabelaProcessos.objects.create(nome='Tabela', usuario=usuario)
+    dados = [
+        ('João Silva', 'CIC', 'em_andamento', 'Sim'),
+        ('Maria Souza', 'CIC', 'concluido', 'Não'),
+        ('José Silva', 'DPQ', 'concluido', 'Sim'),
+        ('Ana Lima', None, None, None),
+    ]
+    Processo.objects.bulk_create([
+        Processo(tabela=tabela, nome=nome, numero_processo=f'23107.00000{i}/2024-11',
+                 setor=setor, status=status, bolsa=bolsa)
+        for i, (nome, setor, status, bolsa) in enumerate(dados)
+    ])
+    return tabela
+
+
+def planilha_xlsx(linhas, cabecalho=('Nome', 'Nº Processo')):
+    """Arquivo .xlsx em memória com o cabeçalho e as linhas informadas."""
+    planilha = Workbook()
+    planilha.active.append(list(cabecalho))
+    for linha in linhas:
+        planilha.active.append(list(linha))
+    arquivo = BytesIO()
+    planilha.save(arquivo)
+    arquivo.seek(0)
+    return arquivo
+
+
+class DiretorioTemporarioMixin:
+    """
+    Aponta cada configuração em `diretorios_temporarios` para um diretório
+    temporário, apagado no fim do teste, para que nada seja gravado nos
+    diretórios reais. Os caminhos ficam em self.diretorios.
+    """
+    diretorios_temporarios = ('SCPI_EXPORTACOES_DIR',)
+
+    def setUp(self):
+        super().setUp()
+        self.diretorios = {}
+        for configuracao in self.diretorios_temporarios:
+            diretorio = tempfile.TemporaryDirectory()
+            self.addCleanup(diretorio.cleanup)
+            self.diretorios[configuracao] = diretorio.name
+        configuracoes = override_settings(**self.diretorios)
+        configuracoes.enable()
+        self.addCleanup(configuracoes.disable)
+
+
+class EstatisticasTabelaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tabela = criar_tabela_exemplo()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_estatisticas_sem_busca(self):
+        with self.assertNumQueries(1):
+            estatisticas = estatisticas_processos(self.tabela)
+        self.assertEqual(estatisticas['total_sem_filtro'], 4)
+        self.assertEqual(estatisticas['total_processos'], 4)
+        self.assertEqual(
+            [(valor, quantidade) for valor, _, quantidade in estatisticas['por_setor']],
+            [('CIC', 2), ('DPQ', 1)]
+        )
+        self.assertEqual(
+            [(valor, quantidade) for valor, _, quantidade in estatisticas['por_status']],
+            [('em_andamento', 1), ('concluido', 2)]
+        )
+        self.assertEqual(
+            [(valor, quantidade) for valor, _, quantidade in estatisticas['por_bolsa']],
+            [('Sim', 2), ('Não', 1)]
+        )
+
+    def test_estatisticas_com_busca(self):
+        # Com índice textual, antes das contagens um EXISTS confere se ele encontra algo
+        with self.assertNumQueries(2 if motor_busca(connection) else 1):
+            estatisticas = estatisticas_processos(self.tabela, 'silva')
+        self.assertEqual(estatisticas['total_sem_filtro'], 4)
+        self.assertEqual(estatisticas['total_processos'], 2)
+        self.assertEqual(
+            [(valor, quantidade) for valor, _, quantidade in estatisticas['por_setor']],
+            [('CIC', 1), ('DPQ', 1)]
+        )
+
+    def test_tabela_consultas(self):
+        # Versões do cache, tabela, página da listagem, estatísticas e, na primeira
+        # visita, as tabelas de destino da ação "mover": nenhuma contagem a mais
+        url = reverse('tabela_processos', args=[self.tabela.id])
+        with self.assertNumQueries(5):
+            resposta = self.client.get(url)
+        self.assertEqual(resposta.context['count_cic'], 2)
+        self.assertEqual(resposta.context['count_dpq'], 1)
+        self.assertEqual(resposta.context['total_sem_filtro'], 4)
+
+        # Com busca, o EXISTS do índice textual é feito uma vez para a listagem e as estatísticas
+        with self.assertNumQueries(5 if motor_busca(connection) else 4):
+            resposta = self.client.get(url, {'q': 'joao'})
+        self.assertEqual(resposta.context['total_processos'], 1)
+        self.assertEqual([p.nome for p in resposta.context['processos']], ['João Silva'])
+
+
+class PaginacaoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        usuario = Usuario.objects.create(nome='Teste', email='teste@example.com')
+        cls.tabela = TabelaProcessos.objects.create(nome='Tabela', usuario=usuario)
+        # Nomes repetidos (desempate pelo id) e datas nulas, que ficam sempre no final
+        dados = [
+            ('Carla', date(2024, 3, 1)),
+            ('Ana', None),
+            ('Bruno', date(2024, 1, 10)),
+            ('Ana', date(2024, 3, 1)),
+            ('Bruno', None),
+            ('Ana', date(2024, 2, 5)),
+            ('Davi', date(2024, 1, 10)),
+        ]
+        Processo.objects.bulk_create([
+            Processo(tabela=cls.tabela, nome=nome, numero_processo=f'23107.00000{i}/2024-11', data_abertura=data)
+            for i, (nome, data) in enumerate(dados)
+        ])
+        cls.processos = Processo.objects.filter(tabela=cls.tabela)
+
+    def setUp(self):
+        cache.clear()
+
+    def percorrer(self, sort_by, sort_direction, tamanho=2):
+        # Todas as páginas seguindo o cursor da próxima
+        paginas = []
+        depois = None
+        while True:
+            pagina = paginar_keyset(self.processos, sort_by, sort_direction, depois=depois, tamanho=tamanho)
+            paginas.append(pagina)
+            if not pagina['tem_proxima']:
+                return paginas
+            depois = pagina['cursor_proximo']
+
+    def esperado(self, sort_by, sort_direction):
+        return list(ordenar_processos(self.processos, sort_by, sort_direction).values_list('pk', flat=True))
+
+    def test_paginas_seguem_a_ordem_completa(self):
+        for sort_by in ORDENACOES_PERMITIDAS:
+            for sort_direction in ('asc', 'desc'):
+                with self.subTest(sort_by=sort_by, sort_direction=sort_direction):
+                    paginas = self.percorrer(sort_by, sort_direction)
+                    self.assertEqual(
+                        [processo.pk for pagina in paginas for processo in pagina['itens']],
+                        self.esperado(sort_by, sort_direction)
+                    )
+                    self.assertEqual([len(pagina['itens']) for pagina in paginas], [2, 2, 2, 1])
+                    self.assertFalse(paginas[0]['tem_anterior'])
+                    self.assertTrue(all(pagina['tem_anterior'] for pagina in paginas[1:]))
+
+    def test_nulos_no_final_nas_duas_direcoes(self):
+        for sort_direction in ('asc', 'desc'):
+            paginas = self.percorrer('data_abertura', sort_direction, tamanho=3)
+            datas = [processo.data_abertura for pagina in paginas for processo in pagina['itens']]
+            self.assertEqual(datas[-2:], [None, None])
+            self.assertNotIn(None, datas[:-2])
+
+    def test_volta_para_a_pagina_anterior(self):
+        for sort_by in ('nome', 'data_abertura'):
+            with self.subTest(sort_by=sort_by):
+                paginas = self.percorrer(sort_by, 'asc')
+                for anterior, atual in zip(paginas, paginas[1:]):
+                    pagina = paginar_keyset(
+                        self.processos, sort_by, 'asc', antes=atual['cursor_anterior'], tamanho=2
+                    )
+                    self.assertEqual(pagina['itens'], anterior['itens'])
+                    self.assertTrue(pagina['tem_proxima'])
+                    self.assertEqual(pagina['tem_anterior'], anterior['tem_anterior'])
+
+    def test_cursor_invalido_volta_para_o_inicio(self):
+        primeira = paginar_keyset(self.processos, 'nome', 'asc', tamanho=2)
+        for cursor in ('lixo', codificar_cursor('x', 'y'), base64.urlsafe_b64encode(b'[1]').decode()):
+            pagina = paginar_keyset(self.processos, 'nome', 'asc', depois=cursor, tamanho=2)
+            self.assertEqual(pagina['itens'], primeira['itens'])
+            self.assertFalse(pagina['tem_anterior'])
+
+    def test_links_da_pagina_da_tabela(self):
+        url = reverse('tabela_processos', args=[self.tabela.id])
+        # Páginas de 3 processos
+        with mock.patch('scpiapp.views.paginar_keyset', partial(paginar_keyset, tamanho=3)):
+            resposta = self.client.get(url, {'sort': 'data_abertura'})
+            self.assertIsNone(resposta.context['url_anterior'])
+            self.assertEqual(
+                [p.data_abertura for p in resposta.context['processos']],
+                [date(2024, 1, 10), date(2024, 1, 10), date(2024, 2, 5)]
+            )
+            resposta = self.client.get(url + resposta.context['url_proxima'])
+            self.assertEqual(
+                [p.data_abertura for p in resposta.context['processos']],
+                [date(2024, 3, 1), date(2024, 3, 1), None]
+            )
+            resposta = self.client.get(url + resposta.context['url_anterior'])
+        self.assertEqual([p.nome for p in resposta.context['processos']], ['Bruno', 'Davi', 'Ana'])
+
+
+class DetalhesProcessoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tabela = criar_tabela_exemplo()
+        cls.assunto = 'Solicitação de bolsa ' + 'x' * 300 + ' fim do assunto'
+        cls.processo = Processo.objects.create(
+            tabela=cls.tabela, nome='Zeca', numero_processo='23107.000099/2024-11',
+            assunto=cls.assunto, observacoes='Primeira linha\nSegunda linha'
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_listagem_sem_o_texto_completo(self):
+        resposta = self.client.get(reverse('tabela_processos', args=[self.tabela.id]))
+        processo = next(p for p in resposta.context['processos'] if p.pk == self.processo.pk)
+        self.assertLessEqual({'assunto', 'observacoes'}, processo.get_deferred_fields())
+        self.assertNotContains(resposta, 'fim do assunto')
+        self.assertNotContains(resposta, 'Segunda linha')
+        self.assertContains(resposta, reverse('detalhes_processo', args=[self.processo.id]))
+
+    def test_detalhes_do_processo(self):
+        with self.assertNumQueries(1):
+            resposta = self.client.get(reverse('detalhes_processo', args=[self.processo.id]))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertContains(resposta, self.assunto)
+        self.assertContains(resposta, 'Primeira linha<br>Segunda linha')
+        self.assertContains(resposta, reverse('historico_processo', args=[self.processo.id]))
+
+        resposta = self.client.get(reverse('detalhes_processo', args=[Processo.objects.get(nome='Ana Lima').id]))
+        self.assertContains(resposta, 'Nenhuma observação cadastrada.')
+        self.assertEqual(self.client.get(reverse('detalhes_processo', args=[0])).status_code, 404)
+
+
+@mock.patch('scpiapp.busca.motor_busca', return_value=None)
+class BuscaNormalizadaTests(TestCase):
+    # Busca usada pelos bancos sem índice textual
+    @classmethod
+    def setUpTestData(cls):
+        cls.tabela = criar_tabela_exemplo()
+        Processo.objects.create(tabela=cls.tabela, nome='Ângela Índio', numero_processo='23107.012345/2023-07')
+
+    def buscar(self, query):
+        return sorted(filtrar_processos(self.tabela, query).values_list('nome', flat=True))
+
+    def test_sem_acentos_e_sem_pontuacao(self, _motor):
+        self.assertEqual(self.buscar('joao'), ['João Silva'])
+        self.assertEqual(self.buscar('ANGELA ind'), ['Ângela Índio'])
+        self.assertEqual(self.buscar('silva'), ['José Silva', 'João Silva'])
+        self.assertEqual(self.buscar('23107012345'), ['Ângela Índio'])
+        self.assertEqual(self.buscar('012345/2023'), ['Ângela Índio'])
+        self.assertEqual(self.buscar('pedro'), [])
+
+    def test_update_mantem_as_colunas_normalizadas(self, _motor):
+        processo = Processo.objects.get(nome='João Silva')
+        Processo.objects.filter(pk=processo.pk).update(nome='Mário Souza', numero_processo='23107.099999/2024-01')
+        processo.refresh_from_db()
+        self.assertEqual((processo.nome_busca, processo.numero_processo_busca), ('mario souza', '23107099999202401'))
+        self.assertEqual(self.buscar('mario'), ['Mário Souza'])
+
+        # Valor calculado pelo banco: as colunas são refeitas a partir das linhas alteradas
+        Processo.objects.filter(pk=processo.pk).update(nome=Concat(Value('Éder '), 'nome'))
+        processo.refresh_from_db()
+        self.assertEqual(processo.nome_busca, 'eder mario souza')
+        self.assertEqual(self.buscar('eder'), ['Éder Mário Souza'])
+
+    def test_colunas_normalizadas_pelo_prefixo(self, _motor):
+        # LIKE 'prefixo%' nas colunas normalizadas, que o índice delas atende
+        sql = str(filtrar_processos(self.tabela, 'joao').query)
+        self.assertIn('"nome_busca" LIKE joao%', sql)
+        self.assertNotIn('"nome_busca" LIKE %', sql)
+        sql = str(filtrar_processos(self.tabela, '23107.012345').query)
+        self.assertIn('"numero_processo_busca" LIKE 23107012345%', sql)
+
+
+@skipUnless(motor_busca(connection) == 'sqlite', 'SQLite sem FTS5')
+class BuscaTextualTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tabela = criar_tabela_exemplo()
+        Processo.objects.filter(tabela=cls.tabela, nome='Maria Souza').update(assunto='Bolsa de iniciação científica')
+
+    def setUp(self):
+        cache.clear()
+
+    def buscar(self, query):
+        return sorted(filtrar_processos(self.tabela, query).values_list('nome', flat=True))
+
+    def test_prefixos_das_palavras(self):
+        self.assertEqual(self.buscar('silva'), ['José Silva', 'João Silva'])
+        self.assertEqual(self.buscar('jo sil'), ['José Silva', 'João Silva'])
+        self.assertEqual(self.buscar('JOAO'), ['João Silva'])
+        self.assertEqual(self.buscar('inicia'), ['Maria Souza'])
+        self.assertEqual(self.buscar('23107.000002/2024'), ['José Silva'])
+        self.assertEqual(self.buscar('pedro'), [])
+
+    def test_substring_quando_o_indice_nao_encontra(self):
+        # O índice casa só o começo das palavras; no meio delas vale a busca por substring
+        self.assertEqual(self.buscar('ilva'), ['José Silva', 'João Silva'])
+        self.assertEqual(self.buscar('oao'), ['João Silva'])
+        self.assertEqual(self.buscar('nicia'), ['Maria Souza'])
+        self.assertEqual(self.buscar('0000022024'), ['José Silva'])
+        # Com resultado no índice, a substring não entra: "sil" não traz quem só tem "sil" no meio
+        Processo.objects.create(tabela=self.tabela, nome='Brasil Neto', numero_processo='23107.000009/2024-11')
+        self.assertEqual(self.buscar('sil'), ['José Silva', 'João Silva'])
+        self.assertEqual(self.buscar('asil'), ['Brasil Neto'])
+
+    def test_relevancia_na_busca_por_substring(self):
+        processos = anotar_relevancia(filtrar_processos(self.tabela, 'ilva'), 'ilva')
+        self.assertEqual({p.relevancia for p in processos}, {0.0})
+        processos = anotar_relevancia(filtrar_processos(self.tabela, 'silva'), 'silva')
+        self.assertEqual(len(processos), 2)
+        self.assertTrue(all(p.relevancia > 0 for p in processos))
+
+    def test_pagina_da_tabela(self):
+        url = reverse('tabela_processos', args=[self.tabela.id])
+        resposta = self.client.get(url, {'q': 'ilva'})
+        self.assertEqual(resposta.context['sort_by'], 'relevancia')
+        self.assertEqual(resposta.context['total_processos'], 2)
+        self.assertEqual(resposta.context['count_dpq'], 1)
+        self.assertEqual(sorted(p.nome for p in resposta.context['processos']), ['José Silva', 'João Silva'])
+
+        resposta = self.client.get(url, {'q': 'maria'})
+        self.assertEqual([p.nome for p in resposta.context['processos']], ['Maria Souza'])
+        self.assertEqual(resposta.context['total_processos'], 1)
+
+
+class CachePaginasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tabela = criar_tabela_exemplo()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cache_da_pagina_por_versao(self):
+        url = reverse('tabela_processos', args=[self.tabela.id])
+        self.client.get(url)
+        # Visita repetida: só a leitura da versão
+        with self.assertNumQueries(1):
+            resposta = self.client.get(url)
+        self.assertEqual(resposta.context['total_sem_filtro'], 4)
+
+        # Qualquer alteração nos processos da tabela troca a versão no commit
+        with self.captureOnCommitCallbacks(execute=True):
+            Processo.objects.filter(tabela=self.tabela, nome='Ana Lima').update(nome='Ana Lima Costa')
+        resposta = self.client.get(url)
+        self.assertIn('Ana Lima Costa', [p.nome for p in resposta.context['processos']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Processo.objects.create(tabela=self.tabela, nome='Nova', setor='DPQ')
+        resposta = self.client.get(url)
+        self.assertEqual(resposta.context['count_dpq'], 2)
+
+
+class GetCondicionalTests(DiretorioTemporarioMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tabela = criar_tabela_exemplo()
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_get_condicional(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Processo.objects.filter(tabela=self.tabela, nome='Ana Lima').update(setor='CIC')
+        for url in (
+            reverse('exportar_processos_csv', args=[self.tabela.id]),
+            reverse('exportar_processos_xlsx', args=[self.tabela.id]),
+        ):
+            resposta = self.client.get(url)
+            self.assertEqual(resposta.status_code, 200)
+            self.assertIn('Last-Modified', resposta)
+            # Sem alteração desde a última visita: 304 só com a leitura da versão
+            with self.assertNumQueries(1):
+                resposta = self.client.get(url, HTTP_IF_NONE_MATCH=resposta['ETag'])
+            self.assertEqual(resposta.status_code, 304)
+
+        etag = self.client.get(url)['ETag']
+        processo = Processo.objects.get(tabela=self.tabela, nome='Ana Lima')
+        atualizado_em = processo.data_atualizacao
+        with self.captureOnCommitCallbacks(execute=True):
+            processo.status = 'concluido'
+            processo.save(update_fields=['status'])
+        processo.refresh_from_db()
+        self.assertGreater(processo.data_atualizacao, atualizado_em)
+        self.tabela.refresh_from_db()
+        self.assertGreaterEqual(self.tabela.data_atualizacao, processo.data_atualizacao)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_pagina_da_tabela_sem_304(self):
+        # A página leva o token CSRF e as mensagens pendentes: é sempre gerada de novo
+        User.objects.create_user('analista', password='teste')
+        self.client.login(username='analista', password='teste')
+        url = reverse('tabela_processos', args=[self.tabela.id])
+        resposta = self.client.get(url)
+        self.assertNotIn('ETag', resposta)
+        self.assertNotIn('Last-Modified', resposta)
+
+        resposta = self.client.post(reverse('acoes_em_lote', args=[self.tabela.id]), {'acao': 'status'})
+        self.assertRedirects(resposta, url, fetch_redirect_response=False)
+        resposta = self.client.get(
+            url, HTTP_IF_NONE_MATCH='"qualquer"', HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT'
+        )
+        self.assertEqual(resposta.status_code, 200)
+        self.assertContains(resposta, 'Nenhum processo selecionado.')
+
+
+class CacheExportacoesTests(DiretorioTemporarioMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tabela = criar_tabela_exemplo()
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_exportacao_em_disco_e_download_retomado(self):
+        url = reverse('exportar_processos_csv', args=[self.tabela.id])
+        # Primeira exportação: enviada enquanto é gerada, e gravada em disco ao mesmo tempo
+        resposta = self.client.get(url)
+        self.assertNotIsInstance(resposta, FileResponse)
+        self.assertEqual(os.listdir(self.diretorios['SCPI_EXPORTACOES_DIR']), [])
+        conteudo = b''.join(resposta.streaming_content)
+        self.assertEqual(len(os.listdir(self.diretorios['SCPI_EXPORTACOES_DIR'])), 1)
+
+        # Mesma exportação de novo: o arquivo sai do disco; só a versão e a tabela, sem os processos
+        with self.assertNumQueries(2):
+            resposta = self.client.get(url)
+        self.assertEqual(resposta['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(resposta.streaming_content), conteudo)
+
+        resposta = self.client.get(url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE=resposta['ETag'])
+        self.assertEqual(resposta.status_code, 206)
+        self.assertEqual(resposta['Content-Range'], f'bytes 10-19/{len(conteudo)}')
+        self.assertEqual(b''.join(resposta.streaming_content), conteudo[10:20])
+        resposta = self.client.get(url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(resposta.streaming_content), conteudo[-5:])
+        # If-Range de outra versão: o arquivo vai inteiro
+        resposta = self.client.get(url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"outra"')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_RANGE=f'bytes={len(conteudo)}-').status_code, 416)
+
+        # Uma alteração na tabela gera um arquivo novo e descarta o da versão anterior
+        with self.captureOnCommitCallbacks(execute=True):
+            Processo.objects.filter(tabela=self.tabela, nome='Ana Lima').update(nome='Ana Lima Costa')
+        self.assertIn('Ana Lima Costa'.encode('utf-8'), b''.join(self.client.get(url).streaming_content))
+        self.assertEqual(len(os.listdir(self.diretorios['SCPI_EXPORTACOES_DIR'])), 1)
+
+        # Acima do limite de tamanho, o arquivo usado há mais tempo é removido
+        with override_settings(SCPI_EXPORTACOES_LIMITE_BYTES=1):
+            b''.join(self.client.get(url, {'gzip': '1'}).streaming_content)
+        self.assertEqual([nome.endswith('.csv.gz') for nome in os.listdir(self.diretorios['SCPI_EXPORTACOES_DIR'])], [True])
+
+    def test_download_interrompido_nao_publica_o_arquivo(self):
+        resposta = self.client.get(reverse('exportar_processos_csv', args=[self.tabela.id]))
+        next(iter(resposta.streaming_content))
+        self.assertEqual(len(os.listdir(self.diretorios['SCPI_EXPORTACOES_DIR'])), 1)
+        # O cliente desconectou: o arquivo temporário é descartado, nada fica publicado
+        resposta.close()
+        self.assertEqual(os.listdir(self.diretorios['SCPI_EXPORTACOES_DIR']), [])
+
+
+class ExportacaoCsvTests(DiretorioTemporarioMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tabela = criar_tabela_exemplo()
+        Processo.objects.filter(tabela=cls.tabela, nome='João Silva').update(
+            data_abertura=date(2024, 3, 5), assunto='Bolsa; "PIBIC"', observacoes='Linha 1\nLinha 2'
+        )
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def ler_csv(self, conteudo):
+        texto = conteudo.decode('utf-8')
+        self.assertTrue(texto.startswith('﻿'))
+        return list(csv.reader(StringIO(texto[1:]), delimiter=';'))
+
+    def test_csv_enviado_em_blocos(self):
+        url = reverse('exportar_processos_csv', args=[self.tabela.id])
+        # Blocos pequenos: cada linha sai assim que é escrita
+        with mock.patch.object(exportacao, 'TAMANHO_BLOCO', 100):
+            resposta = self.client.get(url, {'sort': 'nome', 'direction': 'desc'})
+            self.assertIsInstance(resposta, StreamingHttpResponse)
+            blocos = list(resposta.streaming_content)
+        self.assertGreater(len(blocos), 3)
+        self.assertEqual(resposta['Content-Type'], 'text/csv')
+        self.assertEqual(resposta['Content-Disposition'], 'attachment; filename="processos_Tabela.csv"')
+
+        linhas = self.ler_csv(b''.join(blocos))
+        self.assertEqual(linhas[0], ['SCPI - Processos da Tabela: Tabela - Ordenado por Nome (decrescente)'])
+        self.assertEqual(linhas[1], [])
+        self.assertEqual(linhas[2], exportacao.CABECALHOS)
+        # A mesma ordem da tela (a posição de João e José depende da collation do banco)
+        self.assertEqual(
+            [linha[0] for linha in linhas[3:]],
+            list(ordenar_processos(self.tabela.processos.all(), 'nome', 'desc').values_list('nome', flat=True))
+        )
+        self.assertEqual(linhas[3][0], 'Maria Souza')
+        por_nome = {linha[0]: linha for linha in linhas[3:]}
+        self.assertEqual(
+            por_nome['João Silva'],
+            ['João Silva', '', '23107.000000/2024-11', '05/03/2024', '', 'CIC', 'Sim', 'Em Andamento',
+             'Bolsa; "PIBIC"', 'Linha 1\nLinha 2']
+        )
+        self.assertEqual(por_nome['Ana Lima'][5:8], ['', '', ''])
+
+    def test_csv_com_busca(self):
+        resposta = self.client.get(reverse('exportar_processos_csv', args=[self.tabela.id]), {'q': 'silva'})
+        linhas = self.ler_csv(b''.join(resposta.streaming_content))
+        self.assertIn('(Filtro: silva)', linhas[0][0])
+        self.assertEqual(sorted(linha[0] for linha in linhas[3:]), ['José Silva', 'João Silva'])
+
+    def test_csv_compactado(self):
+        url = reverse('exportar_processos_csv', args=[self.tabela.id])
+        conteudo = b''.join(self.client.get(url).streaming_content)
+
+        resposta = self.client.get(url, {'gzip': '1'})
+        self.assertEqual(resposta['Content-Type'], 'application/gzip')
+        self.assertEqual(resposta['Content-Disposition'], 'attachment; filename="processos_Tabela.csv.gz"')
+        self.assertEqual(gzip.decompress(b''.join(resposta.streaming_content)), conteudo)
+        # A cópia em disco também sai compactada
+        resposta = self.client.get(url, {'gzip': '1'})
+        self.assertIsInstance(resposta, FileResponse)
+        self.assertEqual(gzip.decompress(b''.join(resposta.streaming_content)), conteudo)
+
+
+class ExportacaoXlsxTests(DiretorioTemporarioMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tabela = criar_tabela_exemplo()
+        Processo.objects.filter(tabela=cls.tabela, nome='Maria Souza').update(
+            data_abertura=date(2024, 3, 5), data_retorno=date(2024, 4, 1), assunto='Auxílio', observacoes='Ok'
+        )
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def ler_planilha(self, resposta):
+        self.assertEqual(
+            resposta['Content-Type'], 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+        return load_workbook(BytesIO(b''.join(resposta.streaming_content)))['Processos']
+
+    def test_conteudo_da_planilha(self):
+        url = reverse('exportar_processos_xlsx', args=[self.tabela.id])
+        resposta = self.client.get(url, {'sort': 'data_abertura'})
+        self.assertEqual(resposta['Content-Disposition'], 'attachment; filename="processos_Tabela.xlsx"')
+        planilha = self.ler_planilha(resposta)
+
+        self.assertEqual(planilha['A1'].value, 'SCPI - Processos da Tabela: Tabela - Ordenado por Data de Abertura (crescente)')
+        self.assertIn('A1:J1', [str(intervalo) for intervalo in planilha.merged_cells.ranges])
+        self.assertEqual(planilha.freeze_panes, 'A3')
+        self.assertEqual(planilha.column_dimensions['I'].width, exportacao.LARGURAS_COLUNAS['I'])
+        linhas = list(planilha.iter_rows(min_row=2, values_only=True))
+        self.assertEqual(list(linhas[0]), exportacao.CABECALHOS)
+        self.assertEqual(len(linhas), 5)
+        # Processo com data primeiro, os sem data depois
+        self.assertEqual(
+            list(linhas[1]),
+            ['Maria Souza', None, '23107.000001/2024-11', '05/03/2024', '01/04/2024', 'CIC', 'Não', 'Concluído',
+             'Auxílio', 'Ok']
+        )
+        self.assertEqual({linha[0] for linha in linhas[2:]}, {'João Silva', 'José Silva', 'Ana Lima'})
+        # Linhas de dados com fundo alternado e altura fixa
+        self.assertNotEqual(planilha['A3'].fill.fgColor.rgb, planilha['A4'].fill.fgColor.rgb)
+        self.assertEqual(planilha.row_dimensions[3].height, exportacao.ALTURA_LINHA_DADOS)
+
+        # A mesma exportação de novo sai do disco, com o mesmo conteúdo
+        resposta = self.client.get(url, {'sort': 'data_abertura'})
+        self.assertEqual(resposta['Accept-Ranges'], 'bytes')
+        self.assertEqual(
+            list(self.ler_planilha(resposta).iter_rows(min_row=2, values_only=True)), linhas
+        )
+
+    def test_planilha_com_busca(self):
+        resposta = self.client.get(reverse('exportar_processos_xlsx', args=[self.tabela.id]), {'q': 'souza'})
+        planilha = self.ler_planilha(resposta)
+        self.assertIn('(Filtro: souza)', planilha['A1'].value)
+        self.assertEqual([linha[0] for linha in planilha.iter_rows(min_row=3, values_only=True)], ['Maria Souza'])
+
+
+class ExportacaoColunarTests(DiretorioTemporarioMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tabela = criar_tabela_exemplo()
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    @skipUnless(exportacao_colunar_disponivel(), 'pyarrow não instalado')
+    def test_exportacao_colunar(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        outra = TabelaProcessos.objects.create(nome='Outra', usuario=self.tabela.usuario)
+        Processo.objects.create(tabela=outra, nome='Pedro', setor='DPQ', data_abertura=date(2024, 3, 1))
+
+        resposta = self.client.get(reverse('exportar_processos_colunar', args=[self.tabela.id]))
+        dados = pq.read_table(BytesIO(b''.join(resposta.streaming_content)))
+        self.assertEqual(dados.num_rows, 4)
+        self.assertEqual(dados.schema.field('setor').type, pa.dictionary(pa.int8(), pa.string()))
+        self.assertEqual(dados.schema.field('data_abertura').type, pa.date32())
+        self.assertEqual(
+            sorted(zip(dados.column('nome').to_pylist(), dados.column('setor').to_pylist())),
+            [('Ana Lima', None), ('José Silva', 'DPQ'), ('João Silva', 'CIC'), ('Maria Souza', 'CIC')]
+        )
+
+        # Todas as tabelas, em Arrow IPC
+        User.objects.create_user('analista', password='teste')
+        self.client.login(username='analista', password='teste')
+        resposta = self.client.get(reverse('exportar_todas_colunar'), {'formato': 'arrow'})
+        dados = pa.ipc.open_file(pa.BufferReader(b''.join(resposta.streaming_content))).read_all()
+        self.assertEqual(dados.num_rows, 5)
+        linha = dados.filter(pa.compute.equal(dados.column('nome'), 'Pedro')).to_pylist()[0]
+        self.assertEqual((linha['tabela'], linha['data_abertura']), ('Outra', date(2024, 3, 1)))
+
+
+class ContadoresTabelaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create(nome='Teste', email='teste@example.com')
+
+    def setUp(self):
+        self.tabela = TabelaProcessos.objects.create(nome='Tabela', usuario=self.usuario)
+        self.outra = TabelaProcessos.objects.create(nome='Outra', usuario=self.usuario)
+
+    def contadores(self, tabela):
+        tabela.refresh_from_db()
+        return (tabela.total_processos, tabela.processos_cic, tabela.processos_dpq,
+                tabela.processos_em_andamento, tabela.processos_concluidos)
+
+    def test_save_e_delete(self):
+        processo = Processo.objects.create(tabela=self.tabela, nome='A', setor='CIC', status='em_andamento')
+        self.assertEqual(self.contadores(self.tabela), (1, 1, 0, 1, 0))
+
+        processo = Processo.objects.get(pk=processo.pk)
+        processo.setor = 'DPQ'
+        processo.status = 'concluido'
+        processo.save()
+        self.assertEqual(self.contadores(self.tabela), (1, 0, 1, 0, 1))
+
+        processo.tabela = self.outra
+        processo.save()
+        self.assertEqual(self.contadores(self.tabela), (0, 0, 0, 0, 0))
+        self.assertEqual(self.contadores(self.outra), (1, 0, 1, 0, 1))
+
+        processo.delete()
+        self.assertEqual(self.contadores(self.outra), (0, 0, 0, 0, 0))
+
+    def test_operacoes_em_massa(self):
+        Processo.objects.bulk_create([
+            Processo(tabela=self.tabela, nome='A', setor='CIC', status='em_andamento'),
+            Processo(tabela=self.tabela, nome='B', setor='CIC'),
+            Processo(tabela=self.tabela, nome='C', setor='DPQ', status='concluido'),
+        ])
+        self.assertEqual(self.contadores(self.tabela), (3, 2, 1, 1, 1))
+
+        Processo.objects.filter(tabela=self.tabela, setor='CIC').update(status='concluido')
+        self.assertEqual(self.contadores(self.tabela), (3, 2, 1, 0, 3))
+
+        Processo.objects.filter(nome='A').update(tabela=self.outra)
+        self.assertEqual(self.contadores(self.tabela), (2, 1, 1, 0, 2))
+        self.assertEqual(self.contadores(self.outra), (1, 1, 0, 0, 1))
+
+        Processo.objects.filter(tabela=self.tabela, setor='DPQ').delete()
+        self.assertEqual(self.contadores(self.tabela), (1, 1, 0, 0, 1))
+
+    def test_bulk_create_com_conflitos(self):
+        Processo.objects.create(tabela=self.tabela, nome='A', numero_processo='1', setor='CIC')
+        # A linha repetida é ignorada pelo banco e não entra nos contadores nem no resumo
+        Processo.objects.bulk_create([
+            Processo(tabela=self.tabela, nome='A', numero_processo='1', setor='CIC'),
+            Processo(tabela=self.tabela, nome='B', numero_processo='2', setor='DPQ'),
+        ], ignore_conflicts=True)
+        self.assertEqual(Processo.objects.filter(tabela=self.tabela).count(), 2)
+        self.assertEqual(self.contadores(self.tabela), (2, 1, 1, 0, 0))
+        self.assertEqual(
+            sum(ResumoProcessos.objects.filter(tabela=self.tabela).values_list('quantidade', flat=True)), 2
+        )
+
+        # A linha em conflito atualiza o processo existente, levado para a outra tabela
+        Processo.objects.bulk_create(
+            [Processo(tabela=self.outra, nome='B', numero_processo='2', setor='CIC', status='concluido')],
+            update_conflicts=True, unique_fields=['numero_processo'], update_fields=['tabela', 'setor', 'status']
+        )
+        self.assertEqual(self.contadores(self.tabela), (1, 1, 0, 0, 0))
+        self.assertEqual(self.contadores(self.outra), (1, 1, 0, 0, 1))
+
+    def test_recalcular_contadores(self):
+        Processo.objects.create(tabela=self.tabela, nome='A', setor='CIC', status='concluido')
+        TabelaProcessos.objects.filter(pk=self.tabela.pk).update(total_processos=10, processos_cic=0)
+        recalcular_contadores()
+        self.assertEqual(self.contadores(self.tabela), (1, 1, 0, 0, 1))
+
+    def test_home_em_uma_consulta(self):
+        cache.clear()
+        Processo.objects.create(tabela=self.tabela, nome='A', setor='CIC')
+        self.client.force_login(User.objects.create_user('teste', password='teste'))
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(reverse('visualizarTabelas'))
+        self.assertContains(resposta, '1 processo(s)')
+        # Fora sessão, usuário e a versão do cache, só a consulta das tabelas com seus contadores
+        consultas_app = [
+            c['sql'] for c in consultas.captured_queries
+            if 'scpiapp_' in c['sql'] and 'scpiapp_versaocache' not in c['sql']
+        ]
+        self.assertEqual(len(consultas_app), 1)
+        self.assertNotIn('scpiapp_processo', consultas_app[0])
+
+
+class ResumoProcessosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create(nome='Teste', email='teste@example.com')
+
+    def setUp(self):
+        self.tabela = TabelaProcessos.objects.create(nome='Tabela', usuario=self.usuario)
+        self.outra = TabelaProcessos.objects.create(nome='Outra', usuario=self.usuario)
+
+    def resumo(self):
+        return {
+            (linha.tabela_id, linha.setor, linha.status, linha.bolsa, linha.mes): linha.quantidade
+            for linha in ResumoProcessos.objects.all()
+        }
+
+    def test_resumo_acompanha_as_alteracoes(self):
+        Processo.objects.bulk_create([
+            Processo(tabela=self.tabela, nome='A', setor='CIC', bolsa='Sim', data_abertura=date(2024, 3, 5)),
+            Processo(tabela=self.tabela, nome='B', setor='CIC', bolsa='Sim', data_abertura=date(2024, 3, 20)),
+            Processo(tabela=self.tabela, nome='C', setor='DPQ'),
+        ])
+        self.assertEqual(self.resumo(), {
+            (self.tabela.id, 'CIC', None, 'Sim', date(2024, 3, 1)): 2,
+            (self.tabela.id, 'DPQ', None, None, None): 1,
+        })
+
+        processo = Processo.objects.get(nome='A')
+        processo.bolsa = 'Não'
+        processo.data_abertura = date(2024, 4, 1)
+        processo.save()
+        Processo.objects.filter(nome='C').update(data_abertura=date(2024, 3, 9), tabela=self.outra)
+        Processo.objects.filter(nome='B').delete()
+        esperado = {
+            (self.tabela.id, 'CIC', None, 'Não', date(2024, 4, 1)): 1,
+            (self.outra.id, 'DPQ', None, None, date(2024, 3, 1)): 1,
+        }
+        self.assertEqual(self.resumo(), esperado)
+
+        # A recontagem completa chega ao mesmo resumo
+        ResumoProcessos.objects.all().delete()
+        recalcular_contadores()
+        self.assertEqual(self.resumo(), esperado)
+
+    def test_painel_le_so_o_resumo(self):
+        User.objects.create_user('painel', password='teste')
+        self.client.login(username='painel', password='teste')
+        Processo.objects.bulk_create([
+            Processo(tabela=self.tabela, nome=str(i), status='concluido', data_abertura=date(2023 + i % 2, 1, 1))
+            for i in range(10)
+        ])
+        resposta = self.client.get(reverse('painel'))
+        self.assertEqual(resposta.context['total'], 10)
+        self.assertEqual(resposta.context['anos'], [2024, 2023])
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(reverse('painel'), {'tabela': self.tabela.id, 'ano': 2024})
+        self.assertEqual(resposta.context['total'], 5)
+        self.assertEqual(resposta.context['por_tabela'][0]['concluidos'], 5)
+        self.assertFalse([c for c in consultas.captured_queries if 'scpiapp_processo"' in c['sql']])
+
+
+class PrazosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        usuario = Usuario.objects.create(nome='Teste', email='teste@example.com')
+        cls.tabela = TabelaProcessos.objects.create(nome='Tabela', usuario=usuario)
+        cls.outra = TabelaProcessos.objects.create(nome='Outra', usuario=usuario)
+        cls.duracoes = {'CIC': [1, 2, 3, 4, 10], 'DPQ': [30, 40]}
+        abertura = date(2024, 1, 1)
+        Processo.objects.bulk_create([
+            Processo(tabela=cls.tabela if setor == 'CIC' else cls.outra, nome=f'{setor} {i}', setor=setor,
+                     status='concluido', data_abertura=abertura, data_retorno=abertura + timedelta(days=dias))
+            for setor, duracoes in cls.duracoes.items() for i, dias in enumerate(duracoes)
+        ] + [
+            Processo(tabela=cls.tabela, nome='Atrasado', setor='CIC', status='em_andamento',
+                     data_abertura=date(2024, 5, 1)),
+            Processo(tabela=cls.tabela, nome='No prazo', setor='DPQ', status='em_andamento',
+                     data_abertura=date(2024, 5, 1)),
+        ])
+
+    def test_percentis_por_grupo(self):
+        import numpy as np
+        dados = analisar_prazos(hoje=date(2024, 5, 20))
+        self.assertEqual(dados['total'], 7)
+        for linha in dados['por_setor']:
+            duracoes = self.duracoes[linha['valor']]
+            self.assertEqual(linha['quantidade'], len(duracoes))
+            for nome, percentil in (('mediana', 50), ('p90', 90), ('p99', 99)):
+                self.assertAlmostEqual(linha[nome], np.percentile(duracoes, percentil), places=1)
+        self.assertEqual([linha['rotulo'] for linha in dados['por_tabela']], ['Outra', 'Tabela'])
+        self.assertEqual(dados['geral']['mediana'], 4)
+
+        # 19 dias em aberto: acima do p90 do CIC (7,6), abaixo do p90 do DPQ (39)
+        self.assertEqual([processo['nome'] for processo in dados['atrasados']], ['Atrasado'])
+        self.assertEqual(dados['atrasados'][0]['dias_aberto'], 19)
+
+    def test_pagina_em_cache_por_versao(self):
+        User.objects.create_user('prazos', password='teste')
+        self.client.login(username='prazos', password='teste')
+        url = reverse('prazos')
+        self.client.get(url, {'tabela': self.tabela.id})
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(url, {'tabela': self.tabela.id})
+        self.assertEqual(resposta.context['total'], 5)
+        self.assertFalse([c for c in consultas.captured_queries if 'scpiapp_processo"' in c['sql']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Processo.objects.filter(nome='CIC 4').update(data_retorno=date(2024, 1, 2))
+        resposta = self.client.get(url, {'tabela': self.tabela.id})
+        self.assertEqual(resposta.context['geral']['p99'], 4.0)
+
+    def test_processos_sem_tabela(self):
+        # Processo avulso, criado fora de uma tabela: grupo próprio, sem quebrar a ordenação
+        Processo.objects.create(nome='Avulso', setor='CIC', status='concluido',
+                                data_abertura=date(2024, 1, 1), data_retorno=date(2024, 1, 6))
+        Processo.objects.create(nome='Avulso atrasado', setor='CIC', status='em_andamento',
+                                data_abertura=date(2024, 4, 1))
+        dados = analisar_prazos(hoje=date(2024, 5, 20))
+        self.assertEqual(
+            [(linha['valor'], linha['rotulo'], linha['quantidade']) for linha in dados['por_tabela']],
+            [(None, 'Não informado', 1), (self.outra.id, 'Outra', 2), (self.tabela.id, 'Tabela', 5)]
+        )
+
+        User.objects.create_user('prazos', password='teste')
+        self.client.login(username='prazos', password='teste')
+        resposta = self.client.get(reverse('prazos'))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertContains(resposta, 'Avulso atrasado')
+
+
+class ImportacaoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('importador', password='teste')
+        usuario = Usuario.objects.create(nome='Teste', email='teste@example.com')
+        cls.tabela = TabelaProcessos.objects.create(nome='Tabela', usuario=usuario)
+        Processo.objects.create(tabela=cls.tabela, nome='Já existe', numero_processo='23107.000001/2024-00')
+
+    def importar(self, arquivo, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return importar_planilha(arquivo, self.tabela, usuario=self.user, **kwargs)
+
+    def test_duplicados_e_conversoes(self):
+        arquivo = planilha_xlsx([
+            ('Ana', '23107.000001/2024-00', '01/03/2024', 'Departamento de Pesquisa', 'S', 'Finalizado'),
+            ('Bruno', '23107.000002/2024-00', '2024-03-02', 'cic', 'não', 'Em andamento'),
+            ('Bruno de novo', '23107.000002/2024-00', None, None, None, None),
+            (None, '23107.000003/2024-00', None, None, None, None),
+            ('Carla', None, 'data inválida', None, None, None),
+        ], cabecalho=('Nome', 'Nº Processo', 'Data de Abertura', 'Setor', 'Bolsa', 'Status'))
+        importados, ignorados, erros = self.importar(arquivo)
+
+        self.assertEqual((importados, ignorados), (2, 2))
+        # Número já no sistema e repetido na planilha; a linha sem nome é pulada
+        self.assertEqual([erro.split(':')[0] for erro in erros], ['Linha 2', 'Linha 4'])
+        bruno = Processo.objects.get(nome='Bruno')
+        self.assertEqual(
+            (bruno.data_abertura, bruno.setor, bruno.bolsa, bruno.status),
+            (date(2024, 3, 2), 'CIC', 'Não', 'em_andamento')
+        )
+        self.assertIsNone(Processo.objects.get(nome='Carla').data_abertura)
+        self.tabela.refresh_from_db()
+        self.assertEqual((self.tabela.total_processos, self.tabela.processos_cic), (3, 1))
+
+    def test_verifica_e_grava_por_lote(self):
+        arquivo = planilha_xlsx((f'Aluno {i}', f'23107.{i + 10:06d}/2024-00') for i in range(5))
+        chamadas = []
+        with mock.patch.object(importacao, 'TAMANHO_LOTE', 2), CaptureQueriesContext(connection) as consultas:
+            importados, _, _ = self.importar(arquivo, progresso=lambda lidas, total: chamadas.append((lidas, total)))
+        self.assertEqual(importados, 5)
+        self.assertEqual(chamadas, [(2, 5), (4, 5)])
+        # Uma verificação de números existentes e um INSERT por lote de 2, 2 e 1 linhas
+        verificacoes = [c for c in consultas.captured_queries
+                        if c['sql'].startswith('SELECT "scpiapp_processo"."numero_processo"')]
+        inserts = [c for c in consultas.captured_queries if c['sql'].startswith('INSERT INTO "scpiapp_processo"')]
+        self.assertEqual((len(verificacoes), len(inserts)), (3, 3))
+
+    def test_lote_recusado_grava_linha_a_linha(self):
+        arquivo = planilha_xlsx((f'Aluno {i}', f'23107.{i + 10:06d}/2024-00') for i in range(3))
+        with mock.patch.object(ProcessoQuerySet, 'bulk_create', side_effect=IntegrityError('recusado')):
+            importados, ignorados, erros = self.importar(arquivo)
+        self.assertEqual((importados, ignorados, erros), (3, 0, []))
+        self.assertEqual(Processo.objects.filter(nome__startswith='Aluno').count(), 3)
+        self.tabela.refresh_from_db()
+        self.assertEqual(self.tabela.total_processos, 4)
+
+    def test_falha_na_auditoria_nao_regrava_o_lote(self):
+        arquivo = planilha_xlsx((f'Aluno {i}', f'23107.{i + 10:06d}/2024-00') for i in range(3))
+        with mock.patch.object(importacao, 'registrar_criacao_processos', side_effect=RuntimeError('auditoria')), \
+                mock.patch.object(Processo, 'save', autospec=True) as save:
+            with self.assertRaisesMessage(RuntimeError, 'auditoria'):
+                self.importar(arquivo)
+        # Nenhuma tentativa de gravar de novo, linha a linha, o lote já gravado
+        save.assert_not_called()
+        self.assertFalse(Processo.objects.filter(nome__startswith='Aluno').exists())
+
+    def test_auditoria_com_id_sem_retorno_do_bulk_insert(self):
+        # Como no MySQL, que não devolve os ids de um INSERT com várias linhas
+        arquivo = planilha_xlsx([('Ana', '23107.000020/2024-00'), ('Bruno', None), ('Carla', '23107.000021/2024-00')])
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            importados, _, _ = self.importar(arquivo)
+        self.assertEqual(importados, 3)
+        eventos = Auditoria.objects.filter(acao=Auditoria.AcoesAuditoria.CRIAR)
+        self.assertEqual(
+            sorted(eventos.values_list('id_processo', 'processo_id')),
+            sorted((pk, pk) for pk in Processo.objects.exclude(nome='Já existe').values_list('pk', flat=True))
+        )
+        self.assertEqual(
+            eventos.get(id_processo=Processo.objects.get(nome='Bruno').pk).detalhes['processo_info']['nome'], 'Bruno'
+        )
+
+
+@override_settings(SCPI_TAREFAS_LIMITE_LINHAS=1, SCPI_TAREFAS_LIMITE_UPLOAD=0)
+class TarefasTests(DiretorioTemporarioMixin, TestCase):
+    diretorios_temporarios = ('MEDIA_ROOT', 'SCPI_EXPORTACOES_DIR')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('operador', password='teste')
+        cls.tabela = criar_tabela_exemplo()
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.login(username='operador', password='teste')
+
+    def processar(self):
+        call_command('processar_tarefas', '--uma-vez', stdout=StringIO())
+
+    def test_exportacao_grande_vai_para_a_fila(self):
+        url = reverse('exportar_processos_csv', args=[self.tabela.id])
+        resposta = self.client.get(url, {'q': 'silva'})
+        tarefa = Tarefa.objects.get()
+        self.assertRedirects(resposta, reverse('tarefa', args=[tarefa.id]), fetch_redirect_response=False)
+        self.assertEqual((tarefa.status, tarefa.total_itens), (Tarefa.StatusTarefa.PENDENTE, 2))
+        # O mesmo pedido, ainda na fila, reaproveita a tarefa
+        self.client.get(url, {'q': 'silva'})
+        self.assertEqual(Tarefa.objects.count(), 1)
+
+        self.processar()
+        status = self.client.get(reverse('status_tarefa', args=[tarefa.id])).json()
+        self.assertEqual((status['status'], status['progresso']), (Tarefa.StatusTarefa.CONCLUIDA, 100))
+        self.assertEqual(status['resultado']['linhas'], 2)
+        resposta = self.client.get(status['url_download'])
+        conteudo = b''.join(resposta.streaming_content).decode('utf-8-sig')
+        self.assertIn('João Silva', conteudo)
+        self.assertNotIn('Maria Souza', conteudo)
+
+        # Outro usuário não vê a tarefa
+        User.objects.create_user('outro', password='teste')
+        self.client.login(username='outro', password='teste')
+        self.assertEqual(self.client.get(reverse('status_tarefa', args=[tarefa.id])).status_code, 404)
+
+    def test_importacao_em_segundo_plano(self):
+        arquivo = planilha_xlsx([('Novo', '23107.999999/2024-00')])
+        resposta = self.client.post(
+            reverse('importar_processos', args=[self.tabela.id]),
+            {'excel_file': SimpleUploadedFile('processos.xlsx', arquivo.read())}
+        )
+        tarefa = Tarefa.objects.get(tipo=Tarefa.TiposTarefa.IMPORTAR)
+        self.assertRedirects(resposta, reverse('tarefa', args=[tarefa.id]), fetch_redirect_response=False)
+        self.assertFalse(Processo.objects.filter(nome='Novo').exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.processar()
+        tarefa.refresh_from_db()
+        self.assertEqual(tarefa.status, Tarefa.StatusTarefa.CONCLUIDA)
+        self.assertEqual(tarefa.resultado['importados'], 1)
+        self.assertFalse(tarefa.arquivo_entrada)
+        self.assertTrue(Processo.objects.filter(tabela=self.tabela, nome='Novo').exists())
+
+    def test_reserva_e_recuperacao(self):
+        def criar(**campos):
+            return Tarefa.objects.create(tipo=Tarefa.TiposTarefa.EXPORTAR_CSV, tabela=self.tabela, **campos)
+        agora = timezone.now()
+        mais_nova = criar(data_criacao=agora)
+        mais_antiga = criar(data_criacao=agora - timedelta(minutes=1))
+        travada = criar(status=Tarefa.StatusTarefa.EXECUTANDO, itens_processados=50,
+                        data_atualizacao=agora - timedelta(minutes=30))
+        viva = criar(status=Tarefa.StatusTarefa.EXECUTANDO, data_atualizacao=agora)
+
+        # A mais antiga primeiro, e nenhuma é reservada duas vezes
+        reservadas = [proxima_tarefa().id, proxima_tarefa().id, proxima_tarefa()]
+        self.assertEqual(reservadas, [mais_antiga.id, mais_nova.id, None])
+
+        self.assertEqual(recuperar_tarefas_travadas(), 1)
+        travada.refresh_from_db()
+        viva.refresh_from_db()
+        self.assertEqual((travada.status, travada.itens_processados), (Tarefa.StatusTarefa.PENDENTE, 0))
+        self.assertEqual(viva.status, Tarefa.StatusTarefa.EXECUTANDO)
+
+    def test_progresso_gravado_durante_a_execucao(self):
+        tarefa = Tarefa.objects.create(
+            tipo=Tarefa.TiposTarefa.EXPORTAR_CSV, tabela=self.tabela, status=Tarefa.StatusTarefa.EXECUTANDO
+        )
+        acompanhamento = _Acompanhamento(tarefa)
+        acompanhamento.atualizar(30, 120)
+        acompanhamento._gravar()
+        tarefa.refresh_from_db()
+        self.assertEqual((tarefa.itens_processados, tarefa.total_itens, tarefa.progresso), (30, 120, 25))
+        self.assertIsNotNone(tarefa.data_atualizacao)
+
+
+class AuditoriaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create(nome='Teste', email='teste@example.com')
+        cls.user = User.objects.create_user('auditor', password='teste')
+        cls.tabela = TabelaProcessos.objects.create(nome='Tabela', usuario=cls.usuario)
+
+    def test_gravada_so_apos_commit(self):
+        processo = Processo.objects.create(tabela=self.tabela, nome='A')
+        with self.captureOnCommitCallbacks(execute=True):
+            auditoria.registrar_auditoria(self.user, 'CRIAR', processo=processo, tabela=self.tabela)
+            self.assertFalse(Auditoria.objects.exists())
+        self.assertEqual(Auditoria.objects.get().processo_id, processo.pk)
+
+    def test_descartada_com_rollback(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic(), auditoria.auditoria_em_lote():
+                    auditoria.registrar_auditoria(self.user, 'CRIAR', tabela=self.tabela)
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertFalse(Auditoria.objects.exists())
+
+    def test_detalhes_sem_consultar_tabela(self):
+        processo = Processo.objects.get(pk=Processo.objects.create(tabela=self.tabela, nome='A').pk)
+        with self.assertNumQueries(0):
+            detalhes = auditoria.gerar_detalhes_processo(processo, 'ATUALIZAR')
+        self.assertEqual(detalhes['processo_info']['tabela_id'], self.tabela.pk)
+
+    def test_edicao_registra_alteracoes_e_historico(self):
+        processo = Processo.objects.create(
+            tabela=self.tabela, nome='Maria', numero_processo='23107.000001/2024-10', status='em_andamento'
+        )
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('editar_processo', args=[processo.pk]), {
+                'nome': 'Maria Silva', 'numero_processo': '23107.000001/2024-10', 'status': 'concluido',
+            })
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('deletar_processo', args=[processo.pk]))
+
+        evento = Auditoria.objects.get(acao='ATUALIZAR')
+        self.assertEqual(evento.id_processo, processo.pk)
+        self.assertEqual(evento.id_tabela, self.tabela.pk)
+        self.assertEqual(evento.numero_processo, '23107.000001/2024-10')
+        self.assertEqual(evento.detalhes['alteracoes'], {
+            'nome': {'antes': 'Maria', 'depois': 'Maria Silva'},
+            'status': {'antes': 'em_andamento', 'depois': 'concluido'},
+        })
+
+        # O processo foi excluído, mas o histórico continua pelo id guardado na auditoria
+        self.assertEqual(
+            list(Auditoria.objects.filter(numero_processo='23107.000001/2024-10').values_list('acao', flat=True)
+                 .order_by('id')),
+            ['ATUALIZAR', 'EXCLUIR']
+        )
+        resposta = self.client.get(reverse('historico_processo', args=[processo.pk]))
+        self.assertContains(resposta, 'Maria Silva')
+        self.assertContains(resposta, 'Excluído')
+
+    def test_historico_usa_indice(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Plano de consulta verificado só no SQLite')
+        consulta, parametros = auditoria.eventos_do_processo(1)[:200].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + consulta, parametros)
+            plano = ' '.join(str(linha) for linha in cursor.fetchall())
+        # Filtro e ordenação resolvidos pelo índice, sem ordenar em memória
+        self.assertIn('auditoria_processo_idx', plano)
+        self.assertNotIn('TEMP B-TREE', plano)
+
+    def test_importacao_grava_auditoria_em_lotes(self):
+        arquivo = planilha_xlsx((f'Aluno {i}', f'23107.{i:06d}/2024-00') for i in range(2500))
+
+        with CaptureQueriesContext(connection) as consultas:
+            with self.captureOnCommitCallbacks(execute=True):
+                importados, _, _ = importar_planilha(arquivo, self.tabela, usuario=self.user)
+        self.assertEqual(importados, 2500)
+        self.assertEqual(Auditoria.objects.filter(usuario=self.user, tabela=self.tabela).count(), 2500)
+        inserts = [c for c in consultas.captured_queries if c['sql'].startswith('INSERT INTO "scpiapp_auditoria"')]
+        # Poucos INSERTs em lote (o SQLite limita os parâmetros por comando), não um por linha
+        self.assertLess(len(inserts), 25)
+
+
+class ArquivamentoAuditoriaTests(DiretorioTemporarioMixin, TestCase):
+    diretorios_temporarios = ('MEDIA_ROOT',)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('auditor', password='teste')
+        eventos = [
+            (datetime(2024, 1, 10), 'CRIAR', 1),
+            (datetime(2024, 1, 20), 'ATUALIZAR', 1),
+            (datetime(2024, 2, 5), 'EXCLUIR', 2),
+            (datetime(2024, 6, 15), 'CRIAR', 3),
+        ]
+        Auditoria.objects.bulk_create([
+            Auditoria(
+                usuario=cls.user, acao=acao, data_evento=timezone.make_aware(data),
+                detalhes={'acao': acao, 'processo_info': {'id': processo_id}}, id_processo=processo_id,
+            )
+            for data, acao, processo_id in eventos
+        ])
+
+    def test_arquiva_meses_completos_anteriores_a_retencao(self):
+        agora = timezone.make_aware(datetime(2024, 7, 10))
+        arquivos = arquivar_auditoria(dias=30, agora=agora)
+
+        # Junho fica no banco: o limite é o início do mês de 10/06
+        self.assertEqual([arquivo.mes.month for arquivo in arquivos], [1, 2])
+        self.assertEqual([arquivo.quantidade for arquivo in arquivos], [2, 1])
+        self.assertEqual(list(Auditoria.objects.values_list('acao', flat=True)), ['CRIAR'])
+        self.assertEqual(ArquivoAuditoria.objects.get(mes__month=1).acoes, ['ATUALIZAR', 'CRIAR'])
+
+        with arquivos[0].arquivo.open('rb') as bruto:
+            linhas = [json.loads(linha) for linha in gzip.decompress(bruto.read()).splitlines()]
+        self.assertEqual([linha['acao'] for linha in linhas], ['CRIAR', 'ATUALIZAR'])
+        self.assertEqual(linhas[0]['usuario'], 'auditor')
+
+        # Rodar de novo não arquiva nada
+        self.assertEqual(arquivar_auditoria(dias=30, agora=agora), [])
+
+    def test_busca_no_historico_arquivado(self):
+        arquivar_auditoria(dias=30, agora=timezone.make_aware(datetime(2024, 7, 10)))
+
+        self.assertEqual([evento['acao'] for evento in buscar_arquivados(acao='EXCLUIR')], ['EXCLUIR'])
+        self.assertEqual(len(list(buscar_arquivados(usuario_id=self.user.pk))), 3)
+        self.assertEqual([evento['acao'] for evento in buscar_arquivados(id_processo=1)], ['CRIAR', 'ATUALIZAR'])
+        self.assertEqual(len(list(buscar_arquivados(texto='ATUALIZAR'))), 1)
+        inicio = timezone.make_aware(datetime(2024, 1, 15))
+        fim = timezone.make_aware(datetime(2024, 1, 31))
+        self.assertEqual([evento['acao'] for evento in buscar_arquivados(inicio=inicio, fim=fim)], ['ATUALIZAR'])
+        # O índice descarta os arquivos sem o usuário pedido sem abri-los
+        with self.assertNumQueries(1):
+            self.assertEqual(list(buscar_arquivados(usuario_id=self.user.pk + 1)), [])
+
+
+class NavegacaoAuditoriaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('auditor', password='teste')
+        cls.outro = User.objects.create_user('outro', password='teste')
+        # 120 eventos, um por hora a partir de 01/03/2024 00:00
+        inicio = timezone.make_aware(datetime(2024, 3, 1))
+        Auditoria.objects.bulk_create([
+            Auditoria(
+                usuario=cls.user if i % 2 else cls.outro, acao='CRIAR' if i % 3 else 'EXCLUIR',
+                data_evento=inicio + timedelta(hours=i),
+            )
+            for i in range(120)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        cache.delete(auditoria.CHAVE_CACHE_USUARIOS)
+
+    def test_paginas_por_cursor(self):
+        vistos = []
+        url = reverse('visualizar_auditoria')
+        while url:
+            resposta = self.client.get(url)
+            vistos.extend(evento.id for evento in resposta.context['auditorias'])
+            proxima = resposta.context['url_proxima']
+            url = reverse('visualizar_auditoria') + proxima if proxima else None
+        self.assertEqual(vistos, list(Auditoria.objects.order_by('-data_evento', '-id').values_list('id', flat=True)))
+        self.assertEqual(resposta.context['total'], 120)
+
+    def test_filtro_de_datas_inclui_o_dia_final(self):
+        resposta = self.client.get(reverse('visualizar_auditoria'), {
+            'data_inicio': '2024-03-02', 'data_fim': '2024-03-02', 'usuario': self.user.pk,
+        })
+        # 24 eventos no dia 02/03, metade do usuário filtrado
+        self.assertEqual(resposta.context['total'], 12)
+        self.assertTrue(all(evento.usuario_id == self.user.pk for evento in resposta.context['auditorias']))
+
+    def test_filtro_de_datas_usa_indice(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Plano de consulta verificado só no SQLite')
+        consulta = auditoria.filtrar_auditorias(acao='EXCLUIR', data_inicio='2024-03-02', data_fim='2024-03-03')
+        sql, parametros = consulta.order_by('-data_evento', '-id')[:50].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, parametros)
+            plano = ' '.join(str(linha) for linha in cursor.fetchall())
+        self.assertIn('auditoria_acao_idx', plano)
+        self.assertNotIn('TEMP B-TREE', plano)
+
+    def test_lista_de_usuarios_em_cache(self):
+        self.client.get(reverse('visualizar_auditoria'))
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(reverse('visualizar_auditoria'))
+        self.assertEqual(
+            resposta.context['usuarios_disponiveis'], [(self.user.pk, 'auditor'), (self.outro.pk, 'outro')]
+        )
+        self.assertFalse(any('EXISTS' in consulta['sql'] for consulta in consultas.captured_queries))
+
+    def test_exportacao_jsonl_com_filtros(self):
+        resposta = self.client.get(reverse('exportar_auditoria'), {
+            'formato': 'jsonl', 'acao': 'EXCLUIR', 'data_inicio': '2024-03-01', 'data_fim': '2024-03-01',
+        })
+        self.assertTrue(resposta.streaming)
+        eventos = [json.loads(linha) for linha in b''.join(resposta.streaming_content).splitlines()]
+        # 24 eventos em 01/03, um terço deles EXCLUIR, em ordem cronológica
+        self.assertEqual(len(eventos), 8)
+        self.assertEqual({evento['acao'] for evento in eventos}, {'EXCLUIR'})
+        self.assertEqual([evento['id'] for evento in eventos], sorted(evento['id'] for evento in eventos))
+        self.assertEqual(eventos[0]['usuario'], 'outro')
+
+    def test_exportacao_csv_compactada(self):
+        resposta = self.client.get(reverse('exportar_auditoria'), {'formato': 'csv', 'gzip': '1'})
+        linhas = gzip.decompress(b''.join(resposta.streaming_content)).decode('utf-8-sig').splitlines()
+        self.assertTrue(linhas[0].startswith('"ID";"Data/Hora";"Ação"'))
+        self.assertEqual(len(linhas), 121)
+
+
+class AcoesEmLoteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user('operador', password='teste')
+        usuario = Usuario.objects.create(nome='Teste', email='teste@example.com')
+        cls.tabela = TabelaProcessos.objects.create(nome='Tabela', usuario=usuario)
+        cls.outra = TabelaProcessos.objects.create(nome='Outra', usuario=usuario)
+
+    def setUp(self):
+        self.client.login(username='operador', password='teste')
+        Processo.objects.bulk_create([
+            Processo(tabela=self.tabela, nome=f'Processo {i}', setor='CIC', status='em_andamento')
+            for i in range(5)
+        ])
+        self.url = reverse('acoes_em_lote', args=[self.tabela.id])
+
+    def aplicar(self, dados):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.url, dados)
+
+    def test_status_dos_selecionados_num_so_update(self):
+        ids = list(Processo.objects.filter(tabela=self.tabela).order_by('id').values_list('id', flat=True)[:3])
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.aplicar({'acao': 'status', 'valor': 'concluido', 'ids': ids, 'q': 'processo'})
+        self.assertRedirects(resposta, reverse('tabela_processos', args=[self.tabela.id]) + '?q=processo',
+                             fetch_redirect_response=False)
+        updates = [c['sql'] for c in consultas.captured_queries
+                   if c['sql'].startswith('UPDATE "scpiapp_processo"')]
+        self.assertEqual(len(updates), 1)
+        # Sem subconsulta na própria tabela, que o MySQL recusa num UPDATE (erro 1093)
+        self.assertNotIn('FROM "scpiapp_processo"', updates[0])
+
+        self.assertEqual(Processo.objects.filter(pk__in=ids, status='concluido').count(), 3)
+        self.tabela.refresh_from_db()
+        self.assertEqual((self.tabela.processos_em_andamento, self.tabela.processos_concluidos), (2, 3))
+        eventos = Auditoria.objects.filter(acao=Auditoria.AcoesAuditoria.ATUALIZAR)
+        self.assertEqual(eventos.count(), 3)
+        self.assertEqual(eventos.first().detalhes['alteracoes']['status']['depois'], 'concluido')
+
+        # Quem já tem o valor fica de fora, também da auditoria
+        self.aplicar({'acao': 'status', 'valor': 'concluido', 'todos': '1'})
+        self.assertEqual(Auditoria.objects.filter(acao=Auditoria.AcoesAuditoria.ATUALIZAR).count(), 5)
+
+    def test_mover_e_excluir_todos(self):
+        with CaptureQueriesContext(connection) as consultas:
+            self.aplicar({'acao': 'mover', 'valor': self.outra.id, 'todos': '1', 'q': 'processo'})
+        updates = [c['sql'] for c in consultas.captured_queries
+                   if c['sql'].startswith('UPDATE "scpiapp_processo"')]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('FROM "scpiapp_processo"', updates[0])
+        self.assertFalse(Processo.objects.filter(tabela=self.tabela).exists())
+        self.outra.refresh_from_db()
+        self.assertEqual(self.outra.total_processos, 5)
+
+        self.url = reverse('acoes_em_lote', args=[self.outra.id])
+        self.aplicar({'acao': 'excluir', 'todos': '1'})
+        self.outra.refresh_from_db()
+        self.assertEqual(self.outra.total_processos, 0)
+        self.assertEqual(Auditoria.objects.filter(acao=Auditoria.AcoesAuditoria.EXCLUIR).count(), 5)
+
+    def test_acao_invalida_nao_altera_nada(self):
+        ids = list(Processo.objects.values_list('id', flat=True))
+        self.aplicar({'acao': 'status', 'valor': 'inexistente', 'ids': ids})
+        self.aplicar({'acao': 'mover', 'valor': self.tabela.id, 'ids': ids})
+        self.assertEqual(Processo.objects.filter(tabela=self.tabela, status='em_andamento').count(), 5)
+        self.assertFalse(Auditoria.objects.exists())
+
+
+# Sem banco: o TestCase rodaria tudo dentro de uma transação, que fixa as leituras no principal
+@override_settings(SCPI_REPLICA='replica', SCPI_REPLICA_FIXAR_SEGUNDOS=10)
+class ReplicaTests(SimpleTestCase):
+    def setUp(self):
+        self.roteador = RoteadorReplica()
+        self.fabrica = RequestFactory()
+
+        # Anota para onde vai cada leitura feita pela view
+        self.destinos = []
+        def view(request):
+            self.destinos.append(self.roteador.db_for_read(Processo))
+            if request.GET.get('gravar'):
+                self.roteador.db_for_write(Processo)
+                self.destinos.append(self.roteador.db_for_read(Processo))
+            return HttpResponse()
+        self.view = FixarPrimarioMiddleware(ler_da_replica(view))
+
+    def test_leituras_da_view_vao_para_a_replica(self):
+        self.view(self.fabrica.get('/'))
+        self.assertEqual(self.destinos, ['replica'])
+        # Fora da view, e em qualquer gravação, o principal
+        self.assertEqual(self.roteador.db_for_read(Processo), 'default')
+        self.assertEqual(self.roteador.db_for_write(Processo), 'default')
+
+    def test_le_do_principal_depois_de_gravar(self):
+        resposta = self.view(self.fabrica.post('/'))
+        self.assertIn(COOKIE_PRIMARIO, resposta.cookies)
+
+        request = self.fabrica.get('/')
+        request.COOKIES[COOKIE_PRIMARIO] = resposta.cookies[COOKIE_PRIMARIO].value
+        self.view(request)
+        self.assertEqual(self.destinos, ['default', 'default'])
+
+        # Gravação no meio de uma view de leitura: o resto dela lê do principal
+        self.destinos.clear()
+        resposta = self.view(self.fabrica.get('/', {'gravar': '1'}))
+        self.assertEqual(self.destinos, ['replica', 'default'])
+        self.assertIn(COOKIE_PRIMARIO, resposta.cookies)
+
+    @override_settings(SCPI_REPLICA=None)
+    def test_sem_replica_tudo_no_principal(self):
+        resposta = self.view(self.fabrica.post('/'))
+        self.view(self.fabrica.get('/'))
+        self.assertEqual(self.destinos, ['default', 'default'])
+        self.assertNotIn(COOKIE_PRIMARIO, resposta.cookies)
+
+
+class ApiProcessosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user('integracao', password='teste')
+        usuario = Usuario.objects.create(nome='Teste', email='teste@example.com')
+        cls.tabela = TabelaProcessos.objects.create(nome='Tabela', usuario=usuario)
+        cls.outra = TabelaProcessos.objects.create(nome='Outra', usuario=usuario)
+
+    def setUp(self):
+        credenciais = base64.b64encode(b'integracao:teste').decode('ascii')
+        self.autenticacao = {'HTTP_AUTHORIZATION': f'Basic {credenciais}'}
+
+    def enviar(self, dados):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse('api_processos_lote'), json.dumps(dados), content_type='application/json', **self.autenticacao
+            )
+
+    def test_exige_autenticacao(self):
+        resposta = self.client.get(reverse('api_processos'))
+        self.assertEqual(resposta.status_code, 401)
+        self.assertIn('Basic', resposta['WWW-Authenticate'])
+
+    def test_lote_numa_transacao(self):
+        existente = Processo.objects.create(tabela=self.tabela, nome='Antigo', numero_processo='1', setor='CIC')
+        removido = Processo.objects.create(tabela=self.tabela, nome='Removido', numero_processo='2', setor='CIC')
+
+        resposta = self.enviar({
+            'tabela': self.tabela.id,
+            'criar': [
+                {'nome': f'Novo {i}', 'numero_processo': f'N{i}', 'setor': 'DPQ', 'data_abertura': '2024-05-02'}
+                for i in range(3)
+            ],
+            'atualizar': [{'id': existente.id, 'status': 'concluido', 'tabela': self.outra.id}],
+            'excluir': [removido.id],
+        })
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['atualizados'], 1)
+        self.assertEqual(resposta.json()['excluidos'], 1)
+        self.assertEqual(len(resposta.json()['criados']), 3)
+
+        existente.refresh_from_db()
+        # Campos não enviados ficam como estavam
+        self.assertEqual((existente.nome, existente.setor, existente.status), ('Antigo', 'CIC', 'concluido'))
+        self.assertEqual(existente.tabela_id, self.outra.id)
+        self.tabela.refresh_from_db()
+        self.outra.refresh_from_db()
+        self.assertEqual((self.tabela.total_processos, self.tabela.processos_dpq), (3, 3))
+        self.assertEqual((self.outra.total_processos, self.outra.processos_concluidos), (1, 1))
+        self.assertEqual(
+            sorted(Auditoria.objects.values_list('acao', flat=True)),
+            ['ATUALIZAR', 'CRIAR', 'CRIAR', 'CRIAR', 'EXCLUIR']
+        )
+        self.assertEqual(
+            Auditoria.objects.get(acao='ATUALIZAR').detalhes['alteracoes']['status'],
+            {'antes': None, 'depois': 'concluido'}
+        )
+
+    def test_ids_dos_criados_sem_retorno_do_bulk_insert(self):
+        # Como no MySQL, que não devolve os ids de um INSERT com várias linhas
+        criar = [{'nome': nome, 'numero_processo': f'N{i}'} for i, nome in enumerate('ABC')]
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            resposta = self.enviar({'tabela': self.tabela.id, 'criar': criar})
+        criados = resposta.json()['criados']
+        self.assertNotIn(None, criados)
+        self.assertEqual([Processo.objects.get(pk=pk).nome for pk in criados], ['A', 'B', 'C'])
+
+    def test_conflito_sem_detalhes_do_banco(self):
+        erro = IntegrityError('UNIQUE constraint failed: scpiapp_processo.numero_processo')
+        with mock.patch.object(ProcessoQuerySet, 'bulk_create', side_effect=erro), self.assertLogs('scpiapp.api'):
+            resposta = self.enviar({'tabela': self.tabela.id, 'criar': [{'nome': 'A', 'numero_processo': 'N1'}]})
+        self.assertEqual(resposta.status_code, 409)
+        self.assertNotIn('scpiapp', resposta.json()['erro'])
+
+        with mock.patch.object(TabelaProcessos, 'save', side_effect=erro), self.assertLogs('scpiapp.api'):
+            resposta = self.client.post(
+                reverse('api_tabelas_lote'), json.dumps({'criar': [{'nome': 'Nova'}]}),
+                content_type='application/json', **self.autenticacao
+            )
+        self.assertEqual(resposta.status_code, 409)
+        self.assertNotIn('scpiapp', resposta.json()['erro'])
+
+    def test_lote_invalido_nao_grava_nada(self):
+        Processo.objects.create(tabela=self.tabela, nome='Antigo', numero_processo='1')
+        resposta = self.enviar({
+            'tabela': self.tabela.id,
+            'criar': [{'nome': 'A', 'numero_processo': '9'}, {'nome': 'B', 'numero_processo': '1'}, {'setor': 'XYZ'}],
+        })
+        self.assertEqual(resposta.status_code, 400)
+        erros = {(erro['indice'], campo) for erro in resposta.json()['erros'] for campo in erro['erros']}
+        self.assertEqual(erros, {(1, 'numero_processo'), (2, 'nome'), (2, 'numero_processo'), (2, 'setor')})
+        self.assertEqual(Processo.objects.count(), 1)
+        self.assertFalse(Auditoria.objects.exists())
+
+    def test_listagem_ndjson_por_cursor(self):
+        Processo.objects.bulk_create([Processo(tabela=self.tabela, nome=f'P{i}') for i in range(5)])
+        Processo.objects.create(tabela=self.outra, nome='Fora')
+
+        nomes = []
+        url = f"{reverse('api_processos')}?tabela={self.tabela.id}&limite=2"
+        while url:
+            resposta = self.client.get(url, **self.autenticacao)
+            self.assertEqual(resposta['Content-Type'], 'application/x-ndjson')
+            nomes += [json.loads(linha)['nome'] for linha in b''.join(resposta.streaming_content).splitlines()]
+            url = resposta['Link'][1:resposta['Link'].index('>')] if resposta.has_header('Link') else None
+        self.assertEqual(nomes, [f'P{i}' for i in range(5)])
+
+        self.assertEqual(self.client.get(reverse('api_processos'), {'depois': 'x'}, **self.autenticacao).status_code, 400)
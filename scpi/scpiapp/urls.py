@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 from django.contrib.auth import views as auth_views
 from django.shortcuts import redirect
 
@@ -10,6 +10,8 @@ def redirect_to_login(request):
 urlpatterns = [
     path('', redirect_to_login, name='index'),
     path('home/', views.home, name='visualizarTabelas'),
+    path('painel/', views.painel, name='painel'),
+    path('prazos/', views.prazos, name='prazos'),
     path('tabela/<int:tabela_id>/', views.tabela, name='tabela_processos'),
     path('adicionarTabela/', views.adicionarTabela, name='adicionarTabela'),
     path('adicionarProcesso/', views.adicionarProcesso, name='adicionar_processo'),
@@ -17,14 +19,27 @@ urlpatterns = [
     path('tabela/<int:tabela_id>/adicionar_processo/', views.adicionarProcesso, name='adicionar_processo_tabela'),
     path('processo/editar/<int:processo_id>/', views.editarProcesso, name='editar_processo'),
     path('processo/deletar/<int:processo_id>/', views.deletaProcesso, name='deletar_processo'),
+    path('processo/<int:processo_id>/detalhes/', views.detalhes_processo, name='detalhes_processo'),
+    path('processo/<int:processo_id>/historico/', views.historico_processo, name='historico_processo'),
     path('usuario/', views.usuarios, name='usuarios'),
     path('usuario/alterar-senha-propeg/', views.alterar_senha_propeg, name='alterar_senha_propeg'),
     path('tabela/editar/<int:tabela_id>/', views.editar_tabela, name='editar_tabela'),
     path('tabela/excluir/<int:tabela_id>/', views.excluir_tabela, name='excluir_tabela'),
     path('tabela/<int:tabela_id>/exportar/xlsx/', views.exportar_xlsx, name='exportar_processos_xlsx'),
     path('tabela/<int:tabela_id>/exportar/csv/', views.exportar_processos_csv, name='exportar_processos_csv'),
+    path('tabela/<int:tabela_id>/exportar/colunar/', views.exportar_processos_colunar, name='exportar_processos_colunar'),
+    path('exportar/colunar/', views.exportar_todas_colunar, name='exportar_todas_colunar'),
+    path('api/tabelas/', api.listar_tabelas, name='api_tabelas'),
+    path('api/tabelas/lote/', api.lote_tabelas, name='api_tabelas_lote'),
+    path('api/processos/', api.listar_processos, name='api_processos'),
+    path('api/processos/lote/', api.lote_processos, name='api_processos_lote'),
     path('tabela/<int:tabela_id>/importar/', views.importar_processos, name='importar_processos'),
+    path('tabela/<int:tabela_id>/acoes/', views.acoes_em_lote, name='acoes_em_lote'),
+    path('tarefa/<int:tarefa_id>/', views.tarefa, name='tarefa'),
+    path('tarefa/<int:tarefa_id>/status/', views.status_tarefa, name='status_tarefa'),
+    path('tarefa/<int:tarefa_id>/download/', views.baixar_tarefa, name='baixar_tarefa'),
     path('auditoria/', views.visualizar_auditoria, name='visualizar_auditoria'),
+    path('auditoria/exportar/', views.exportar_auditoria, name='exportar_auditoria'),
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout')
 ]
\ No newline at end of file
@@ -1,62 +1,44 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse
+from django.urls import reverse
+from django.http import HttpResponse, StreamingHttpResponse, FileResponse, JsonResponse, Http404
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import User
-from .models import Processo, Usuario, TabelaProcessos, Auditoria
+from .models import Processo, Usuario, TabelaProcessos, Auditoria, Tarefa
 from .forms import ProcessoForm, TabelaForm, AlterarSenhaPropegForm
-from datetime import datetime
-from django.db.models import Q
+from .busca import anotar_relevancia, filtrar_processos
+from .cache_paginas import CHAVE_TABELAS, chave_tabela, em_cache, estados, versoes
+from .cache_exportacoes import buscar_artefato, gravar_artefato, gravar_artefato_ao_enviar, resposta_arquivo
+from .acoes_lote import ACAO_EXCLUIR, ACAO_MOVER, ACAO_SETOR, ACAO_STATUS, ACOES_EM_LOTE, aplicar_acao_em_lote
+from .exportacao_colunar import FORMATOS_COLUNARES, exportacao_colunar_disponivel, gerar_colunar
+from .estatisticas import estatisticas_processos
+from .painel import linhas_resumo, montar_painel
+from .prazos import LIMITE_ATRASADOS, analisar_prazos
+from .replica import ler_da_replica
+from .paginacao import (
+    ORDENACAO_RELEVANCIA, contar_com_limite, estimar_total, normalizar_ordenacao, ordenar_processos, paginar_keyset
+)
+from .importacao import importar_planilha
+from .auditoria import (
+    CAMPOS_AUDITADOS_PROCESSO, CAMPOS_AUDITADOS_TABELA, gerar_detalhes_processo, gerar_detalhes_tabela,
+    eventos_do_processo, filtrar_auditorias, registrar_auditoria, usuarios_auditados, valores_auditados
+)
+from . import tarefas
+from .exportacao import (
+    CAMPO_EXIBICAO, DIRECAO_EXIBICAO, titulo_exportacao, gerar_csv, gerar_xlsx, compactar_gzip,
+    gerar_csv_auditoria, gerar_jsonl_auditoria
+)
+from django.db.models.functions import Left
+from django.views.decorators.cache import cache_control
+from django.utils import timezone
+from django.utils.http import content_disposition_header, http_date, quote_etag
+from django.views.decorators.http import condition, require_POST
+from urllib.parse import urlencode
 import json
 
-# csv, xlsx
-import csv
-from openpyxl import load_workbook, Workbook
-from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
-
-# Funções auxiliares para auditoria
-def registrar_auditoria(usuario, acao, processo=None, tabela=None, detalhes=None):
-    try:
-        Auditoria.objects.create(
-            usuario=usuario,
-            acao=acao,
-            processo=processo,
-            tabela=tabela,
-            detalhes=detalhes
-        )
-    except Exception as e:
-        print(f"Erro ao registrar auditoria: {e}")
-
-def gerar_detalhes_processo(processo, acao):
-    detalhes = {
-        'acao': acao,
-        'processo_info': {
-            'id': processo.id,
-            'nome': processo.nome,
-            'matricula': processo.matricula,
-            'numero_processo': processo.numero_processo,
-            'setor': processo.setor,
-            'bolsa': processo.bolsa,
-            'status': processo.status,
-            'tabela_id': processo.tabela.id if processo.tabela else None,
-            'tabela_nome': processo.tabela.nome if processo.tabela else None
-        }
-    }
-    return json.dumps(detalhes, ensure_ascii=False)
-
-def gerar_detalhes_tabela(tabela, acao):
-    detalhes = {
-        'acao': acao,
-        'tabela_info': {
-            'id': tabela.id,
-            'nome': tabela.nome,
-            'descricao': tabela.descricao,
-            'data_criacao': str(tabela.data_criacao)
-        }
-    }
-    return json.dumps(detalhes, ensure_ascii=False)
 
+@ler_da_replica
 @login_required(login_url='login')
 def home(request):
     print(f"DEBUG - Usuário autenticado: {request.user.is_authenticated}")
@@ -67,12 +49,58 @@ def home(request):
         tabelas = TabelaProcessos.objects.filter(nome__icontains=query)
     else:
         tabelas = TabelaProcessos.objects.all()
+    # Os cards usam os contadores da própria tabela: uma consulta só, sem contar processos
+    tabelas = tabelas.only(
+        'id', 'nome', 'total_processos', 'processos_cic', 'processos_dpq',
+        'processos_em_andamento', 'processos_concluidos'
+    )
     
+    # A lista fica em cache até a próxima alteração em qualquer tabela
     context = {
-        'tabelas': tabelas
+        'tabelas': em_cache(CHAVE_TABELAS, versoes(CHAVE_TABELAS)[CHAVE_TABELAS], [query], lambda: list(tabelas))
     }
     return render(request, 'visualizarTabelas.html', context)
 
+@ler_da_replica
+@login_required(login_url='login')
+def painel(request):
+    tabela_id = request.GET.get('tabela')
+    tabela_id = int(tabela_id) if tabela_id and tabela_id.isdigit() else None
+    ano = request.GET.get('ano')
+    ano = int(ano) if ano and ano.isdigit() else None
+    
+    # Lê só o resumo, nunca os processos; em cache até a próxima alteração em qualquer tabela
+    linhas = em_cache(CHAVE_TABELAS, versoes(CHAVE_TABELAS)[CHAVE_TABELAS], ['painel'], linhas_resumo)
+    context = montar_painel(linhas, tabela_id, ano)
+    context.update({
+        'tabelas': sorted({(linha[0], linha[1]) for linha in linhas}, key=lambda tabela: (tabela[1] or '').lower()),
+        'tabela_selecionada': tabela_id,
+        'ano_selecionado': ano,
+    })
+    return render(request, 'painel.html', context)
+
+@ler_da_replica
+@login_required(login_url='login')
+def prazos(request):
+    tabela_id = request.GET.get('tabela')
+    tabela_id = int(tabela_id) if tabela_id and tabela_id.isdigit() else None
+    chave = chave_tabela(tabela_id) if tabela_id is not None else CHAVE_TABELAS
+    versoes_atuais = versoes(chave, CHAVE_TABELAS)
+    
+    # Calculado uma vez por versão da tabela (ou de todas) e por dia, já que os atrasos dependem da data
+    hoje = timezone.localdate()
+    context = em_cache(
+        chave, versoes_atuais[chave], ['prazos', tabela_id, hoje],
+        lambda: analisar_prazos(tabela_id, hoje)
+    )
+    context = {
+        **context,
+        'tabelas': _lista_tabelas(versoes_atuais[CHAVE_TABELAS]),
+        'tabela_selecionada': tabela_id,
+        'limite_atrasados': LIMITE_ATRASADOS,
+    }
+    return render(request, 'prazos.html', context)
+
 def processo(request):
     processos = TabelaProcessos.objects.all()
     return render(request, 'tabelaProcessos.html', {'processos': processos})
@@ -117,14 +145,16 @@ def adicionarTabela(request):
     return render(request, 'adicionarTabela.html')
 
 def editarProcesso(request, processo_id):
-    processo = get_object_or_404(Processo, id=processo_id)
+    processo = get_object_or_404(Processo.objects.select_related('tabela'), id=processo_id)
     if request.method == 'POST':
+        # Valores de antes da edição: o formulário altera a própria instância
+        antes = valores_auditados(processo, CAMPOS_AUDITADOS_PROCESSO)
         form = ProcessoForm(request.POST, instance=processo)
         if form.is_valid():
             processo_atualizado = form.save()
             
             # Registrar auditoria
-            detalhes = gerar_detalhes_processo(processo_atualizado, 'ATUALIZAR')
+            detalhes = gerar_detalhes_processo(processo_atualizado, 'ATUALIZAR', antes=antes)
             registrar_auditoria(
                 usuario=request.user,
                 acao='ATUALIZAR',
@@ -151,8 +181,8 @@ def editarProcesso(request, processo_id):
     return render(request, 'processo_form.html', context)
 
 def deletaProcesso(request, processo_id):
-    processo = get_object_or_404(Processo, id=processo_id)
-    tabela_id = processo.tabela.id if processo.tabela else None
+    processo = get_object_or_404(Processo.objects.select_related('tabela'), id=processo_id)
+    tabela_id = processo.tabela_id
 
     if request.method == 'POST':
         try:
@@ -217,62 +247,203 @@ def adicionarProcesso(request, tabela_id=None):
     }
     return render(request, 'processo_form.html', context)
 
+def _lista_tabelas(versao_lista):
+    # (id, nome) de todas as tabelas, para escolher uma; em cache até a lista mudar
+    return em_cache(
+        CHAVE_TABELAS, versao_lista, ['destinos'],
+        lambda: list(TabelaProcessos.objects.order_by('nome').values_list('id', 'nome'))
+    )
+
+def _estado_tabela(request, tabela_id=None):
+    # (versão, última alteração) da tabela, ou de todas com tabela_id None,
+    # lido uma vez por requisição e usado pelo cache da página e, nas
+    # exportações, pelo ETag e pelo Last-Modified. A versão da lista de
+    # tabelas vem na mesma consulta
+    if not hasattr(request, '_estados_cache'):
+        chave = chave_tabela(tabela_id) if tabela_id is not None else CHAVE_TABELAS
+        request._estados_cache = estados(chave, CHAVE_TABELAS)
+        request._estado_tabela = request._estados_cache[chave]
+    return request._estado_tabela
+
+def _versao_lista_tabelas(request, tabela_id=None):
+    _estado_tabela(request, tabela_id)
+    return request._estados_cache[CHAVE_TABELAS][0]
+
+def _etag_exportacao(request, tabela_id=None):
+    # Busca, ordenação e gzip fazem parte da URL, que já identifica o arquivo
+    versao, _ = _estado_tabela(request, tabela_id)
+    return f'exportacao-{tabela_id or "todas"}-v{versao}'
+
+def _ultima_alteracao_tabela(request, tabela_id=None):
+    return _estado_tabela(request, tabela_id)[1]
+
+def _validadores_exportacao(request, tabela_id):
+    # Valores aceitos no If-Range para retomar um download: o ETag ou o Last-Modified enviados antes
+    validadores = [quote_etag(_etag_exportacao(request, tabela_id))]
+    ultima_alteracao = _ultima_alteracao_tabela(request, tabela_id)
+    if ultima_alteracao is not None:
+        validadores.append(http_date(ultima_alteracao.timestamp()))
+    return validadores
+
+# A página não responde 304: ela leva o token CSRF do formulário das ações
+# em lote e as mensagens da requisição anterior, que não podem vir de uma
+# cópia guardada pelo navegador. Só os dados ficam em cache, por versão
+@ler_da_replica
 def tabela(request, tabela_id):
-    tabela = get_object_or_404(TabelaProcessos, id=tabela_id)
     query = request.GET.get('q')
     
-    # Parâmetros de ordenação
-    sort_by = request.GET.get('sort', 'nome')  # Ordenação padrão por nome
-    sort_direction = request.GET.get('direction', 'asc')  # Direção padrão ascendente
+    # Parâmetros de ordenação: por nome, ou por relevância quando há busca
+    sort_by, sort_direction = normalizar_ordenacao(
+        request.GET.get('sort'), request.GET.get('direction'), query
+    )
+    depois = request.GET.get('depois')
+    antes = request.GET.get('antes')
+    
+    # Os dados da página ficam em cache na versão atual da tabela, que muda a
+    # cada alteração nos seus processos: uma visita repetida só lê a versão
+    context = em_cache(
+        chave_tabela(tabela_id), _estado_tabela(request, tabela_id)[0], [query, sort_by, sort_direction, depois, antes],
+        lambda: _dados_tabela(tabela_id, query, sort_by, sort_direction, depois, antes)
+    )
+    # Opções das ações em lote; as tabelas de destino mudam só com a lista de tabelas
+    context = {
+        **context,
+        'opcoes_status': Processo.StatusProcesso.choices,
+        'opcoes_setor': Processo.SetorOpcoes.choices,
+        'tabelas_destino': _lista_tabelas(_versao_lista_tabelas(request, tabela_id)),
+    }
+    return render(request, 'tabelaProcessos.html', context)
+
+@login_required(login_url='login')
+@require_POST
+def acoes_em_lote(request, tabela_id):
+    tabela = get_object_or_404(TabelaProcessos, id=tabela_id)
+    acao = request.POST.get('acao')
+    valor = request.POST.get('valor') or None
+    query = request.POST.get('q')
+    
+    # Volta para a mesma busca e ordenação
+    parametros = {chave: request.POST[chave] for chave in ('q', 'sort', 'direction') if request.POST.get(chave)}
+    voltar = reverse('tabela_processos', args=[tabela.id]) + ('?' + urlencode(parametros) if parametros else '')
     
-    if query:
-        processos = Processo.objects.filter(
-            Q(tabela=tabela) & 
-            (Q(nome__icontains=query) | 
-             Q(numero_processo__icontains=query) |
-             Q(assunto__icontains=query))
-        )
+    # Os processos marcados na página ou, com "todos", todos os resultados da busca
+    if request.POST.get('todos') == '1':
+        processos = filtrar_processos(tabela, query)
     else:
-        processos = Processo.objects.filter(tabela=tabela)
-    
-    # Aplicar ordenação
-    if sort_by == 'nome':
-        if sort_direction == 'desc':
-            processos = processos.order_by('-nome')
-        else:
-            processos = processos.order_by('nome')
-    elif sort_by == 'data_abertura':
-        if sort_direction == 'desc':
-            processos = processos.order_by('-data_abertura')
-        else:
-            processos = processos.order_by('data_abertura')
-    elif sort_by == 'data_retorno':
-        if sort_direction == 'desc':
-            processos = processos.order_by('-data_retorno')
-        else:
-            processos = processos.order_by('data_retorno')
+        ids = [int(pk) for pk in request.POST.getlist('ids') if pk.isdigit()]
+        if not ids:
+            messages.error(request, 'Nenhum processo selecionado.')
+            return redirect(voltar)
+        processos = Processo.objects.filter(tabela=tabela, pk__in=ids)
+    
+    destino = None
+    if acao == ACAO_MOVER:
+        destino = TabelaProcessos.objects.filter(pk=valor).first() if valor and valor.isdigit() else None
+        if destino is None or destino.pk == tabela.pk:
+            messages.error(request, 'Escolha a tabela de destino.')
+            return redirect(voltar)
+    elif acao == ACAO_STATUS and valor not in Processo.StatusProcesso.values:
+        messages.error(request, 'Escolha o novo status.')
+        return redirect(voltar)
+    elif acao == ACAO_SETOR and valor not in Processo.SetorOpcoes.values:
+        messages.error(request, 'Escolha o novo setor.')
+        return redirect(voltar)
+    elif acao not in ACOES_EM_LOTE:
+        messages.error(request, 'Ação inválida.')
+        return redirect(voltar)
     
-    # Contagem de processos por setor
-    count_cic = processos.filter(setor='CIC').count()
-    count_dpq = processos.filter(setor='DPQ').count()
+    try:
+        quantidade = aplicar_acao_em_lote(processos, acao, request.user, valor, destino)
+    except Exception as e:
+        messages.error(request, f'Erro ao aplicar a ação: {str(e)}')
+        return redirect(voltar)
     
-    # Contagem total para exibir informação sobre filtragem
-    total_processos = processos.count()
-    total_sem_filtro = Processo.objects.filter(tabela=tabela).count()
+    if acao == ACAO_EXCLUIR:
+        messages.success(request, f'{quantidade} processo(s) excluído(s).')
+    elif acao == ACAO_MOVER:
+        messages.success(request, f'{quantidade} processo(s) movido(s) para "{destino.nome}".')
+    else:
+        messages.success(request, f'{quantidade} processo(s) atualizado(s).')
+    return redirect(voltar)
+
+def _dados_tabela(tabela_id, query, sort_by, sort_direction, depois, antes):
+    tabela = get_object_or_404(TabelaProcessos, id=tabela_id)
+    processos = filtrar_processos(tabela, query)
+    
+    # A listagem carrega só as colunas exibidas; assunto e observações
+    # completos vêm de detalhes_processo quando o modal é aberto
+    listagem = processos.only(
+        'id', 'nome', 'matricula', 'numero_processo', 'data_abertura',
+        'data_retorno', 'setor', 'bolsa', 'status'
+    ).annotate(assunto_resumo=Left('assunto', 151))
+    if sort_by == ORDENACAO_RELEVANCIA:
+        listagem = anotar_relevancia(listagem, query)
+    
+    # Paginação por cursor: a página é sempre uma consulta indexada com LIMIT
+    pagina = paginar_keyset(listagem, sort_by, sort_direction, depois=depois, antes=antes)
+    
+    # Busca e ordenação acompanham os links de navegação entre páginas
+    parametros = {'sort': sort_by, 'direction': sort_direction}
+    if query:
+        parametros['q'] = query
+    url_proxima = None
+    url_anterior = None
+    if pagina['tem_proxima']:
+        url_proxima = '?' + urlencode({**parametros, 'depois': pagina['cursor_proximo']})
+    if pagina['tem_anterior']:
+        url_anterior = '?' + urlencode({**parametros, 'antes': pagina['cursor_anterior']})
+    
+    # Totais, com e sem filtro, e divisão por setor, status e bolsa em uma só consulta
+    estatisticas = estatisticas_processos(tabela, query, processos)
+    por_setor = {valor: quantidade for valor, _, quantidade in estatisticas['por_setor']}
     tem_filtro = query is not None and query != ''
 
-    context = {
-        'processos': processos,
+    return {
+        'processos': pagina['itens'],
         'tabela': tabela,
-        'count_cic': count_cic,
-        'count_dpq': count_dpq,
+        'count_cic': por_setor['CIC'],
+        'count_dpq': por_setor['DPQ'],
         'sort_by': sort_by,
         'sort_direction': sort_direction,
-        'total_processos': total_processos,
-        'total_sem_filtro': total_sem_filtro,
+        'total_processos': estatisticas['total_processos'],
+        'total_sem_filtro': estatisticas['total_sem_filtro'],
+        'por_status': estatisticas['por_status'],
+        'por_bolsa': estatisticas['por_bolsa'],
         'tem_filtro': tem_filtro,
+        'url_proxima': url_proxima,
+        'url_anterior': url_anterior,
+        'url_primeira': '?' + urlencode(parametros),
     }
-    return render(request, 'tabelaProcessos.html', context)
+
+def detalhes_processo(request, processo_id):
+    processo = get_object_or_404(Processo, id=processo_id)
+    return render(request, 'processo_detalhes.html', {'processo': processo})
+
+# Eventos exibidos no histórico de um processo
+LIMITE_HISTORICO = 200
+
+@login_required(login_url='login')
+def historico_processo(request, processo_id):
+    # O histórico vem só da auditoria, então continua disponível depois que o processo é excluído
+    eventos = list(eventos_do_processo(processo_id)[:LIMITE_HISTORICO + 1])
+    if not eventos:
+        raise Http404("Nenhum evento de auditoria para este processo.")
+    mais_eventos = len(eventos) > LIMITE_HISTORICO
+    eventos = eventos[:LIMITE_HISTORICO]
+
+    processo = Processo.objects.filter(id=processo_id).only('id', 'nome', 'numero_processo', 'tabela_id').first()
+    # Processo excluído: nome e número vêm da fotografia mais recente
+    info = (eventos[0].detalhes or {}).get('processo_info') or {}
+    context = {
+        'processo': processo,
+        'processo_id': processo_id,
+        'nome': processo.nome if processo else info.get('nome'),
+        'numero_processo': processo.numero_processo if processo else info.get('numero_processo'),
+        'eventos': eventos,
+        'mais_eventos': mais_eventos,
+        'limite': LIMITE_HISTORICO,
+    }
+    return render(request, 'historico_processo.html', context)
 
 @login_required(login_url='login')
 def usuarios(request):
@@ -303,12 +474,13 @@ def usuarios(request):
 def editar_tabela(request, tabela_id):
     tabela = get_object_or_404(TabelaProcessos, id=tabela_id)
     if request.method == 'POST':
+        antes = valores_auditados(tabela, CAMPOS_AUDITADOS_TABELA)
         form = TabelaForm(request.POST, instance=tabela)
         if form.is_valid():
             tabela_atualizada = form.save()
             
             # Registrar auditoria
-            detalhes = gerar_detalhes_tabela(tabela_atualizada, 'ATUALIZAR')
+            detalhes = gerar_detalhes_tabela(tabela_atualizada, 'ATUALIZAR', antes=antes)
             registrar_auditoria(
                 usuario=request.user,
                 acao='ATUALIZAR',
@@ -355,175 +527,50 @@ def excluir_tabela(request, tabela_id):
     }
     return render(request, 'confirmar_exclusao_tabela.html', context)
 
+@ler_da_replica
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_etag_exportacao, last_modified_func=_ultima_alteracao_tabela)
 def exportar_xlsx(request, tabela_id):
     tabela = get_object_or_404(TabelaProcessos, id=tabela_id)
     query = request.GET.get('q')
     
-    # Parâmetros de ordenação
-    sort_by = request.GET.get('sort', 'nome')  # Ordenação padrão por nome
-    sort_direction = request.GET.get('direction', 'asc')  # Direção padrão ascendente
-    
-    # Filtrar processos de acordo com a busca, se houver
-    if query:
-        processos = Processo.objects.filter(
-            Q(tabela=tabela) & 
-            (Q(nome__icontains=query) | 
-             Q(numero_processo__icontains=query) |
-             Q(assunto__icontains=query))
-        )
-    else:
-        processos = Processo.objects.filter(tabela=tabela)
-    
-    # Aplicar ordenação
-    if sort_by == 'nome':
-        if sort_direction == 'desc':
-            processos = processos.order_by('-nome')
-        else:
-            processos = processos.order_by('nome')
-    elif sort_by == 'data_abertura':
-        if sort_direction == 'desc':
-            processos = processos.order_by('-data_abertura')
-        else:
-            processos = processos.order_by('data_abertura')
-    elif sort_by == 'data_retorno':
-        if sort_direction == 'desc':
-            processos = processos.order_by('-data_retorno')
-        else:
-            processos = processos.order_by('data_retorno')
-    
-    # Criar um novo workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Processos"
-    
-    # Definir estilos
-    header_font = Font(name='Arial', size=12, bold=True, color='FFFFFF')
-    header_fill = PatternFill(start_color='006600', end_color='006600', fill_type='solid')
-    
-    # Definir bordas
-    thin_border = Border(
-        left=Side(style='thin', color='000000'),
-        right=Side(style='thin', color='000000'),
-        top=Side(style='thin', color='000000'),
-        bottom=Side(style='thin', color='000000')
+    # Parâmetros de ordenação, os mesmos da tela
+    sort_by, sort_direction = normalizar_ordenacao(
+        request.GET.get('sort'), request.GET.get('direction'), query
     )
     
-    # Alinhamento
-    center_aligned = Alignment(horizontal='center', vertical='center')
-    wrapped_alignment = Alignment(wrap_text=True, vertical='top')
-    
-    # Definir estilo zebra para linhas alternadas
-    light_green_fill = PatternFill(start_color='E6FFE6', end_color='E6FFE6', fill_type='solid')
-    
-    # Adicionar título principal
-    ws.merge_cells('A1:J1')  # Mesclar células para o título
-    titulo_cell = ws['A1']
-    
-    # Adicionar informações sobre filtro e ordenação no título
-    sort_by_info = ""
-    if sort_by:
-        # Mapeamento de campos para exibição amigável
-        campo_exibicao = {
-            'nome': 'Nome',
-            'data_abertura': 'Data de Abertura',
-            'data_retorno': 'Data de Retorno'
-        }
-        
-        # Mapeamento de direção para exibição amigável
-        direcao_exibicao = {
-            'asc': 'crescente',
-            'desc': 'decrescente'
-        }
-        
-        sort_by_info = f" - Ordenado por {campo_exibicao.get(sort_by, sort_by)} ({direcao_exibicao.get(sort_direction, sort_direction)})"
-    
-    if query:
-        titulo_cell.value = f"SCPI - Processos filtrados da Tabela: {tabela.nome} (Filtro: {query}){sort_by_info}"
-    else:
-        titulo_cell.value = f"SCPI - Processos da Tabela: {tabela.nome}{sort_by_info}"
-    
-    titulo_cell.font = Font(name='Arial', size=14, bold=True)
-    titulo_cell.alignment = center_aligned
-    titulo_cell.fill = PatternFill(start_color='DDDDDD', end_color='DDDDDD', fill_type='solid')
-    
-    # Adicionar cabeçalhos na linha 2
-    headers = ['Nome', 'Matrícula', 'Nº Processo', 'Data de Abertura', 'Data de Retorno', 'Setor', 'Bolsa', 'Status', 'Assunto', 'Observações']
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=2, column=col_num, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.border = thin_border
-        cell.alignment = center_aligned
-    
-    # Adicionar dados
-    for row_num, processo in enumerate(processos, 3):  # Começar da linha 3 (após título e cabeçalho)
-        # Aplicar cor de fundo alternada
-        row_fill = light_green_fill if row_num % 2 == 0 else None
+    # A planilha de cada busca e ordenação fica em disco até a próxima alteração na tabela
+    versao = _estado_tabela(request, tabela_id)[0]
+    partes = [query, sort_by, sort_direction]
+    caminho = buscar_artefato(tabela.id, versao, partes, 'xlsx')
+    gerado = caminho is None
+    if gerado:
+        # Filtrar processos de acordo com a busca, se houver, na mesma ordem da tela
+        processos = filtrar_processos(tabela, query)
         
-        # Formatar data para exibição
-        data_abertura = processo.data_abertura.strftime('%d/%m/%Y') if processo.data_abertura else ""
-        data_retorno = processo.data_retorno.strftime('%d/%m/%Y') if processo.data_retorno else ""
-        
-        # Preencher células com valores e aplicar formatação
-        cells = [
-            (1, processo.nome),
-            (2, processo.matricula),
-            (3, processo.numero_processo),
-            (4, data_abertura),
-            (5, data_retorno),
-            (6, processo.get_setor_display() if processo.setor else ""),
-            (7, processo.get_bolsa_display() if processo.bolsa else ""),
-            (8, processo.get_status_display() if processo.status else ""),
-            (9, processo.assunto),
-            (10, processo.observacoes)
-        ]
+        # Exportações grandes vão para a fila e o usuário acompanha o progresso
+        total = processos.count()
+        if tarefas.exportacao_em_segundo_plano(total):
+            tarefa = tarefas.enfileirar_exportacao(
+                Tarefa.TiposTarefa.EXPORTAR_XLSX, tabela, _usuario_da_tarefa(request),
+                _parametros_exportacao(request), total
+            )
+            messages.info(request, f"A exportação de {total} processos para Excel foi colocada na fila.")
+            return redirect('tarefa', tarefa_id=tarefa.id)
         
-        for col_num, value in cells:
-            cell = ws.cell(row=row_num, column=col_num, value=value)
-            cell.border = thin_border
-            
-            # Aplicar alinhamento e quebra de texto para campos longos
-            if col_num in [9, 10]:  # Assunto e Observações
-                cell.alignment = wrapped_alignment
-            else:
-                cell.alignment = Alignment(vertical='center')
-                
-            # Aplicar cor de fundo alternada
-            if row_fill:
-                cell.fill = row_fill
-    
-    # Ajustar largura das colunas
-    column_widths = {
-        'A': 25,  # Nome
-        'B': 15,  # Matrícula
-        'C': 20,  # Nº Processo
-        'D': 15,  # Data de Abertura
-        'E': 15,  # Data de Retorno
-        'F': 15,  # Setor
-        'G': 10,  # Bolsa
-        'H': 15,  # Status
-        'I': 30,  # Assunto
-        'J': 30,  # Observações
-    }
-    
-    for col_letter, width in column_widths.items():
-        ws.column_dimensions[col_letter].width = width
-    
-    # Ajustar altura das linhas
-    for row_num in range(3, len(processos) + 3):
-        ws.row_dimensions[row_num].height = 30  # Altura fixa para todas as linhas de dados
-    
-    # Congelar painel para manter cabeçalhos visíveis ao rolar
-    ws.freeze_panes = 'A3'
-    
-    # Criar a resposta HTTP
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = f'attachment; filename="processos_{tabela.nome}.xlsx"'
-    
-    # Salvar o workbook para a resposta
-    wb.save(response)
+        if sort_by == ORDENACAO_RELEVANCIA:
+            processos = anotar_relevancia(processos, query)
+        processos = ordenar_processos(processos, sort_by, sort_direction)
+        titulo = titulo_exportacao(tabela, query, sort_by, sort_direction)
+        caminho = gravar_artefato(
+            tabela.id, versao, partes, 'xlsx', lambda arquivo: gerar_xlsx(processos, titulo, arquivo)
+        )
     
-    return response
+    return resposta_arquivo(
+        request, caminho, f'processos_{tabela.nome}.xlsx',
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        _validadores_exportacao(request, tabela_id), parcial=not gerado
+    )
 
 def exportar_processos_xlsx(request, tabela_id):
     response = exportar_xlsx(request, tabela_id)
@@ -550,132 +597,127 @@ def exportar_processos_xlsx(request, tabela_id):
     # Construir mensagem de sucesso
     ordenacao_info = f" (ordenados por {campo_exibicao.get(sort_by, sort_by)} em ordem {direcao_exibicao.get(sort_direction, sort_direction)})"
     
+    processos = filtrar_processos(tabela, query).count()
     if query:
-        processos = Processo.objects.filter(
-            Q(tabela=tabela) & 
-            (Q(nome__icontains=query) | 
-             Q(numero_processo__icontains=query) |
-             Q(assunto__icontains=query))
-        ).count()
         messages.success(request, f"{processos} processos filtrados foram exportados para Excel{ordenacao_info}.")
     else:
-        processos = Processo.objects.filter(tabela=tabela).count()
         messages.success(request, f"Todos os {processos} processos foram exportados para Excel{ordenacao_info}.")
     
     return response
 
+@ler_da_replica
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_etag_exportacao, last_modified_func=_ultima_alteracao_tabela)
 def exportar_processos_csv(request, tabela_id):
     tabela = get_object_or_404(TabelaProcessos, id=tabela_id)
     query = request.GET.get('q')
     
-    # Parâmetros de ordenação
-    sort_by = request.GET.get('sort', 'nome')  # Ordenação padrão por nome
-    sort_direction = request.GET.get('direction', 'asc')  # Direção padrão ascendente
-    
-    # Filtrar processos de acordo com a busca, se houver
-    # Mapeamento de campos para exibição amigável
-    campo_exibicao = {
-        'nome': 'Nome',
-        'data_abertura': 'Data de Abertura',
-        'data_retorno': 'Data de Retorno'
-    }
-    
-    # Mapeamento de direção para exibição amigável
-    direcao_exibicao = {
-        'asc': 'crescente',
-        'desc': 'decrescente'
-    }
-    
-    # Construir mensagem de sucesso
-    ordenacao_info = f" (ordenados por {campo_exibicao.get(sort_by, sort_by)} em ordem {direcao_exibicao.get(sort_direction, sort_direction)})"
+    # Parâmetros de ordenação, os mesmos da tela
+    sort_by, sort_direction = normalizar_ordenacao(
+        request.GET.get('sort'), request.GET.get('direction'), query
+    )
     
-    if query:
-        processos = Processo.objects.filter(
-            Q(tabela=tabela) & 
-            (Q(nome__icontains=query) | 
-             Q(numero_processo__icontains=query) |
-             Q(assunto__icontains=query))
-        )
-        processos_count = processos.count()
-        messages.success(request, f"{processos_count} processos filtrados foram exportados para CSV{ordenacao_info}.")
-    else:
-        processos = Processo.objects.filter(tabela=tabela)
+    # Compactação opcional em gzip (?gzip=1), guardada como um arquivo à parte
+    compactar = request.GET.get('gzip') == '1'
+    extensao = 'csv.gz' if compactar else 'csv'
+    
+    # O CSV de cada busca e ordenação fica em disco até a próxima alteração na tabela
+    versao = _estado_tabela(request, tabela_id)[0]
+    partes = [query, sort_by, sort_direction]
+    caminho = buscar_artefato(tabela.id, versao, partes, extensao)
+    if caminho is None:
+        # Construir mensagem de sucesso
+        ordenacao_info = f" (ordenados por {CAMPO_EXIBICAO.get(sort_by, sort_by)} em ordem {DIRECAO_EXIBICAO.get(sort_direction, sort_direction)})"
+        
+        # Filtrar processos de acordo com a busca, se houver
+        processos = filtrar_processos(tabela, query)
         processos_count = processos.count()
-        messages.success(request, f"Todos os {processos_count} processos foram exportados para CSV{ordenacao_info}.")
-    
-    # Aplicar ordenação
-    if sort_by == 'nome':
-        if sort_direction == 'desc':
-            processos = processos.order_by('-nome')
-        else:
-            processos = processos.order_by('nome')
-    elif sort_by == 'data_abertura':
-        if sort_direction == 'desc':
-            processos = processos.order_by('-data_abertura')
-        else:
-            processos = processos.order_by('data_abertura')
-    elif sort_by == 'data_retorno':
-        if sort_direction == 'desc':
-            processos = processos.order_by('-data_retorno')
+        
+        # Exportações grandes vão para a fila e o usuário acompanha o progresso
+        if tarefas.exportacao_em_segundo_plano(processos_count):
+            tarefa = tarefas.enfileirar_exportacao(
+                Tarefa.TiposTarefa.EXPORTAR_CSV, tabela, _usuario_da_tarefa(request),
+                _parametros_exportacao(request), processos_count
+            )
+            messages.info(request, f"A exportação de {processos_count} processos para CSV foi colocada na fila.")
+            return redirect('tarefa', tarefa_id=tarefa.id)
+        
+        if query:
+            messages.success(request, f"{processos_count} processos filtrados foram exportados para CSV{ordenacao_info}.")
         else:
-            processos = processos.order_by('data_retorno')
-    
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="processos_{tabela.nome}.csv"'
-    
-    # Usar ponto-e-vírgula como delimitador para melhor compatibilidade com Excel brasileiro
-    writer = csv.writer(response, delimiter=';', quoting=csv.QUOTE_ALL)
-    
-    # Adicionar BOM (Byte Order Mark) para garantir que o Excel interprete corretamente caracteres especiais
-    response.write(u'\ufeff'.encode('utf-8'))
-    
-    # Adicionar linha com o nome da tabela
-    # Mapeamento de campos para exibição amigável
-    campo_exibicao = {
-        'nome': 'Nome',
-        'data_abertura': 'Data de Abertura',
-        'data_retorno': 'Data de Retorno'
-    }
-    
-    # Mapeamento de direção para exibição amigável
-    direcao_exibicao = {
-        'asc': 'crescente',
-        'desc': 'decrescente'
-    }
-    
-    sort_by_info = ""
-    if sort_by:
-        sort_by_info = f" - Ordenado por {campo_exibicao.get(sort_by, sort_by)} ({direcao_exibicao.get(sort_direction, sort_direction)})"
-    
-    if query:
-        writer.writerow([f'SCPI - Processos filtrados da Tabela: {tabela.nome} (Filtro: {query}){sort_by_info}'])
-    else:
-        writer.writerow([f'SCPI - Processos da Tabela: {tabela.nome}{sort_by_info}'])
-    writer.writerow([]) # Linha vazia
+            messages.success(request, f"Todos os {processos_count} processos foram exportados para CSV{ordenacao_info}.")
+        
+        # Aplicar ordenação
+        if sort_by == ORDENACAO_RELEVANCIA:
+            processos = anotar_relevancia(processos, query)
+        processos = ordenar_processos(processos, sort_by, sort_direction)
+        
+        # O CSV é gerado lendo o banco em lotes e enviado aos poucos; cada
+        # bloco também vai para o arquivo em disco, publicado quando o envio
+        # termina, que atende as próximas exportações
+        blocos = gerar_csv(processos, titulo_exportacao(tabela, query, sort_by, sort_direction))
+        if compactar:
+            blocos = compactar_gzip(blocos)
+        response = StreamingHttpResponse(
+            gravar_artefato_ao_enviar(tabela.id, versao, partes, extensao, blocos),
+            content_type='application/gzip' if compactar else 'text/csv'
+        )
+        response['Content-Disposition'] = content_disposition_header(True, f'processos_{tabela.nome}.{extensao}')
+        return response
     
-    # Adicionar cabeçalhos
-    writer.writerow(['Nome', 'Matrícula', 'Nº Processo', 'Data de Abertura', 'Data de Retorno', 'Setor', 'Bolsa', 'Status', 'Assunto', 'Observações'])
+    return resposta_arquivo(
+        request, caminho, f'processos_{tabela.nome}.{extensao}',
+        'application/gzip' if compactar else 'text/csv',
+        _validadores_exportacao(request, tabela_id)
+    )
+
+@ler_da_replica
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_etag_exportacao, last_modified_func=_ultima_alteracao_tabela)
+def exportar_processos_colunar(request, tabela_id):
+    return _exportar_colunar(request, get_object_or_404(TabelaProcessos, id=tabela_id))
+
+@ler_da_replica
+@login_required(login_url='login')
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_etag_exportacao, last_modified_func=_ultima_alteracao_tabela)
+def exportar_todas_colunar(request):
+    return _exportar_colunar(request, None)
+
+def _exportar_colunar(request, tabela):
+    # Parquet por padrão; ?formato=arrow para Arrow IPC
+    formato = 'arrow' if request.GET.get('formato') == 'arrow' else 'parquet'
+    extensao, content_type = FORMATOS_COLUNARES[formato]
+    tabela_id = tabela.id if tabela is not None else None
+    
+    if not exportacao_colunar_disponivel():
+        messages.error(request, "A exportação em Parquet/Arrow não está disponível: o pacote pyarrow não está instalado.")
+        if tabela is not None:
+            return redirect('tabela_processos', tabela_id=tabela.id)
+        return redirect('visualizarTabelas')
     
-    # Adicionar dados
-    for processo in processos:
-        # Formatar as datas para exibição no formato DD/MM/AAAA
-        data_abertura = processo.data_abertura.strftime('%d/%m/%Y') if processo.data_abertura else ""
-        data_retorno = processo.data_retorno.strftime('%d/%m/%Y') if processo.data_retorno else ""
-        
-        writer.writerow([
-            processo.nome or "",
-            processo.matricula or "",
-            processo.numero_processo or "",
-            data_abertura,
-            data_retorno,
-            processo.get_setor_display() if processo.setor else "",
-            processo.get_bolsa_display() if processo.bolsa else "",
-            processo.get_status_display() if processo.status else "",
-            processo.assunto or "",
-            processo.observacoes or ""
-        ])
+    # A tabela inteira, ou todas, sem busca nem ordenação: o arquivo fica em
+    # disco até a próxima alteração, como as outras exportações
+    versao = _estado_tabela(request, tabela_id)[0]
+    caminho = buscar_artefato(tabela_id or 'todas', versao, [], extensao)
+    gerado = caminho is None
+    if gerado:
+        if tabela is not None:
+            tabelas = [tabela]
+            processos = Processo.objects.filter(tabela=tabela)
+        else:
+            tabelas = list(TabelaProcessos.objects.order_by('id').only('id', 'nome'))
+            processos = Processo.objects.all()
+        caminho = gravar_artefato(
+            tabela_id or 'todas', versao, [], extensao,
+            lambda arquivo: gerar_colunar(processos, tabelas, arquivo, formato)
+        )
     
-    return response
+    nome_arquivo = f'processos_{tabela.nome}.{extensao}' if tabela is not None else f'processos.{extensao}'
+    return resposta_arquivo(
+        request, caminho, nome_arquivo, content_type,
+        _validadores_exportacao(request, tabela_id), parcial=not gerado
+    )
 
 def importar_processos(request, tabela_id):
     if request.method == 'POST':
@@ -685,162 +727,17 @@ def importar_processos(request, tabela_id):
             messages.error(request, "Nenhum arquivo foi enviado.")
             return redirect('tabela_processos', tabela_id=tabela.id)
 
+        # Planilhas grandes são importadas em segundo plano
+        if tarefas.importacao_em_segundo_plano(excel_file):
+            tarefa = tarefas.enfileirar_importacao(tabela, _usuario_da_tarefa(request), excel_file)
+            messages.info(request, "A planilha foi recebida e a importação foi colocada na fila.")
+            return redirect('tarefa', tarefa_id=tarefa.id)
+
         try:
-            workbook = load_workbook(excel_file)
-            sheet = workbook.active
-            
-            processos_importados = 0
-            processos_ignorados = 0
-            erros_detalhados = []
-            
-            # Determinar cabeçalhos e suas posições
-            headers = None
-            for row in sheet.iter_rows(min_row=1, max_row=1, values_only=True):
-                headers = row
-                break
-            
-            # Definir índices padrão (baseados na ordem da planilha do contexto)
-            nome_idx = 0
-            matricula_idx = 1
-            numero_processo_idx = 2
-            data_abertura_idx = 3
-            data_retorno_idx = 4
-            setor_idx = 5
-            bolsa_idx = 6
-            status_idx = 7
-            assunto_idx = 8
-            observacoes_idx = 9
-            
-            # Se os cabeçalhos existirem, ajustar os índices
-            if headers:
-                # Mapear cabeçalhos para índices (caso a ordem da planilha seja diferente)
-                header_map = {h.lower().strip() if h else "": i for i, h in enumerate(headers)}
-                
-                # Atualizar índices com base nos cabeçalhos encontrados
-                nome_idx = header_map.get("nome", 0)
-                matricula_idx = header_map.get("matrícula", 1)
-                numero_processo_idx = header_map.get("nº processo", 2)
-                data_abertura_idx = header_map.get("data de abertura", 3)
-                data_retorno_idx = header_map.get("data de retorno", 4)
-                setor_idx = header_map.get("setor", 5)
-                bolsa_idx = header_map.get("bolsa", 6)
-                status_idx = header_map.get("status", 7)
-                assunto_idx = header_map.get("assunto", 8)
-                observacoes_idx = header_map.get("observações", 9)
-            
-            for row_num, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-                # Verificar se a linha tem dados suficientes
-                if not row or len(row) < 1 or not row[nome_idx]:  # Verificar se pelo menos o nome existe
-                    continue  # Pular linhas vazias ou sem nome
-                
-                # Extrair valores de forma segura com valores padrão para campos faltantes
-                nome = row[nome_idx] if len(row) > nome_idx and row[nome_idx] else ""
-                matricula = row[matricula_idx] if len(row) > matricula_idx and row[matricula_idx] else None
-                numero_processo = row[numero_processo_idx] if len(row) > numero_processo_idx and row[numero_processo_idx] else None
-                
-                # Processamento de datas - convertendo para formato adequado ao Django
-                data_abertura = None
-                data_retorno = None
-                
-                try:
-                    if len(row) > data_abertura_idx and row[data_abertura_idx]:
-                        # Se for um objeto datetime do Excel
-                        if hasattr(row[data_abertura_idx], 'date'):
-                            data_abertura = row[data_abertura_idx].date()
-                        # Se for uma string, tenta converter para data
-                        elif isinstance(row[data_abertura_idx], str):
-                            try:
-                                # Tenta vários formatos comuns de data
-                                for fmt in ['%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y', '%m/%d/%Y']:
-                                    try:
-                                        data_abertura = datetime.strptime(row[data_abertura_idx], fmt).date()
-                                        break
-                                    except ValueError:
-                                        continue
-                            except Exception:
-                                pass
-                except Exception as date_error:
-                    erros_detalhados.append(f"Linha {row_num}: Erro ao processar data de abertura: {date_error}")
-
-                try:
-                    if len(row) > data_retorno_idx and row[data_retorno_idx]:
-                        # Se for um objeto datetime do Excel
-                        if hasattr(row[data_retorno_idx], 'date'):
-                            data_retorno = row[data_retorno_idx].date()
-                        # Se for uma string, tenta converter para data
-                        elif isinstance(row[data_retorno_idx], str):
-                            try:
-                                # Tenta vários formatos comuns de data
-                                for fmt in ['%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y', '%m/%d/%Y']:
-                                    try:
-                                        data_retorno = datetime.strptime(row[data_retorno_idx], fmt).date()
-                                        break
-                                    except ValueError:
-                                        continue
-                            except Exception:
-                                pass
-                except Exception as date_error:
-                    erros_detalhados.append(f"Linha {row_num}: Erro ao processar data de retorno: {date_error}")
-                
-                setor = row[setor_idx] if len(row) > setor_idx and row[setor_idx] else None
-                bolsa = row[bolsa_idx] if len(row) > bolsa_idx and row[bolsa_idx] else None
-                status = row[status_idx] if len(row) > status_idx and row[status_idx] else None
-                assunto = row[assunto_idx] if len(row) > assunto_idx and row[assunto_idx] else None
-                observacoes = row[observacoes_idx] if len(row) > observacoes_idx and row[observacoes_idx] else None
-                
-                # Verificar se já existe um processo com o mesmo número
-                if numero_processo and Processo.objects.filter(numero_processo=numero_processo).exists():
-                    processos_ignorados += 1
-                    erros_detalhados.append(f"Linha {row_num}: Processo com número '{numero_processo}' já existe no sistema.")
-                    continue
-                
-                # Criar o processo com os valores extraídos na ordem correta
-                try:
-                    setor_value = None
-                    if setor:
-                        setor_upper = str(setor).upper()
-                        if setor_upper == 'CIC' or setor_upper == 'COORDENAÇÃO DE INICIAÇÃO CIENTÍFICA':
-                            setor_value = 'CIC'
-                        elif setor_upper == 'DPQ' or setor_upper == 'DEPARTAMENTO DE PESQUISA':
-                            setor_value = 'DPQ'
-                    
-                    # Ajuste para Bolsa
-                    bolsa_value = None
-                    if bolsa:
-                        bolsa_upper = str(bolsa).upper()
-                        if bolsa_upper == 'SIM' or bolsa_upper == 'S' or bolsa_upper == 'TRUE' or bolsa_upper == '1':
-                            bolsa_value = 'Sim'
-                        elif bolsa_upper == 'NÃO' or bolsa_upper == 'NAO' or bolsa_upper == 'N' or bolsa_upper == 'FALSE' or bolsa_upper == '0':
-                            bolsa_value = 'Não'
-                    
-                    # Ajuste para Status
-                    status_value = None
-                    if status:
-                        status_upper = str(status).upper()
-                        if 'CONCLU' in status_upper or status_upper == 'FINALIZADO':
-                            status_value = 'concluido'
-                        elif 'ANDAMENTO' in status_upper or 'EM PROCESSO' in status_upper or 'ABERTO' in status_upper:
-                            status_value = 'em_andamento'
-                    
-                    Processo.objects.create(
-                        tabela=tabela,
-                        nome=nome,
-                        matricula=matricula,
-                        numero_processo=numero_processo,
-                        data_abertura=data_abertura,
-                        data_retorno=data_retorno,
-                        setor=setor_value,
-                        bolsa=bolsa_value,
-                        status=status_value,
-                        assunto=assunto,
-                        observacoes=observacoes
-                    )
-                    processos_importados += 1
-                except Exception as inner_e:
-                    # Log detalhado do erro específico desta linha
-                    processos_ignorados += 1
-                    erros_detalhados.append(f"Linha {row_num}: Erro ao criar processo - {str(inner_e)}")
-                    continue
+            # Leitura da planilha, verificação de duplicados e gravação em lotes
+            processos_importados, processos_ignorados, erros_detalhados = importar_planilha(
+                excel_file, tabela, usuario=request.user
+            )
             
             if processos_importados > 0:
                 mensagem = f"Processos importados com sucesso! ({processos_importados} importados"
@@ -868,6 +765,61 @@ def importar_processos(request, tabela_id):
     return redirect('tabela_processos', tabela_id=tabela_id)
 
 
+def _usuario_da_tarefa(request):
+    return request.user if request.user.is_authenticated else None
+
+def _parametros_exportacao(request):
+    query = request.GET.get('q')
+    sort_by, sort_direction = normalizar_ordenacao(
+        request.GET.get('sort'), request.GET.get('direction'), query
+    )
+    parametros = {'sort': sort_by, 'direction': sort_direction}
+    if query:
+        parametros['q'] = query
+    if request.GET.get('gzip') == '1':
+        parametros['gzip'] = True
+    return parametros
+
+def _tarefa_do_usuario(request, tarefa_id):
+    tarefa = get_object_or_404(Tarefa.objects.select_related('tabela'), id=tarefa_id)
+    # Cada usuário só acompanha as próprias tarefas; administradores veem todas
+    if tarefa.usuario_id and tarefa.usuario_id != request.user.id and not request.user.is_superuser:
+        raise Http404
+    return tarefa
+
+@login_required(login_url='login')
+def tarefa(request, tarefa_id):
+    tarefa = _tarefa_do_usuario(request, tarefa_id)
+    return render(request, 'tarefa.html', {'tarefa': tarefa})
+
+@login_required(login_url='login')
+def status_tarefa(request, tarefa_id):
+    tarefa = _tarefa_do_usuario(request, tarefa_id)
+    dados = {
+        'id': tarefa.id,
+        'status': tarefa.status,
+        'status_display': tarefa.get_status_display(),
+        'finalizada': tarefa.finalizada,
+        'progresso': tarefa.progresso,
+        'itens_processados': tarefa.itens_processados,
+        'total_itens': tarefa.total_itens,
+        'mensagem_erro': tarefa.mensagem_erro,
+        'resultado': tarefa.resultado,
+        'url_download': None,
+    }
+    if tarefa.status == Tarefa.StatusTarefa.CONCLUIDA and tarefa.arquivo_resultado:
+        dados['url_download'] = reverse('baixar_tarefa', args=[tarefa.id])
+    return JsonResponse(dados)
+
+@login_required(login_url='login')
+def baixar_tarefa(request, tarefa_id):
+    tarefa = _tarefa_do_usuario(request, tarefa_id)
+    if tarefa.status != Tarefa.StatusTarefa.CONCLUIDA or not tarefa.arquivo_resultado:
+        raise Http404
+    nome_arquivo = (tarefa.resultado or {}).get('nome_arquivo')
+    return FileResponse(tarefa.arquivo_resultado.open('rb'), as_attachment=True, filename=nome_arquivo)
+
+
 def login_view(request):
     print(f"DEBUG - Login view - Usuário autenticado: {request.user.is_authenticated}")
     print(f"DEBUG - Login view - Usuário: {request.user}")
@@ -922,50 +874,91 @@ def alterar_senha_propeg(request):
     return render(request, 'alterar_senha_propeg.html', {'form': form})
 
 
+# Registros por página e limite da contagem exata na tela de auditoria
+AUDITORIAS_POR_PAGINA = 50
+LIMITE_CONTAGEM_AUDITORIA = 10000
+
+def _filtros_auditoria(request):
+    return {
+        'acao': request.GET.get('acao') or '',
+        'usuario': request.GET.get('usuario') or '',
+        'numero_processo': request.GET.get('numero_processo') or '',
+        'data_inicio': request.GET.get('data_inicio') or '',
+        'data_fim': request.GET.get('data_fim') or '',
+    }
+
+@ler_da_replica
 @login_required(login_url='login')
 def visualizar_auditoria(request):
-    acao_filtro = request.GET.get('acao')
-    usuario_filtro = request.GET.get('usuario')
-    data_inicio = request.GET.get('data_inicio')
-    data_fim = request.GET.get('data_fim')
-    
-    # Query base
-    auditorias = Auditoria.objects.all().select_related('usuario', 'processo', 'tabela')
-    
-    # Aplicar filtros se fornecidos
-    if acao_filtro:
-        auditorias = auditorias.filter(acao=acao_filtro)
-    
-    if usuario_filtro:
-        auditorias = auditorias.filter(usuario__username__icontains=usuario_filtro)
-    
-    if data_inicio:
-        auditorias = auditorias.filter(data_evento__date__gte=data_inicio)
-    
-    if data_fim:
-        auditorias = auditorias.filter(data_evento__date__lte=data_fim)
-    
-    # Ordenar por data mais recente
-    auditorias = auditorias.order_by('-data_evento')
-    
-    # Paginação (limitando a 50 registros por página)
-    from django.core.paginator import Paginator
-    paginator = Paginator(auditorias, 50)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    filtros = _filtros_auditoria(request)
+    auditorias = filtrar_auditorias(**filtros)
+    
+    # Paginação por cursor sobre (data_evento, id), do mais recente para o mais antigo
+    pagina = paginar_keyset(
+        auditorias.select_related('usuario', 'processo', 'tabela'), 'data_evento', 'desc',
+        depois=request.GET.get('depois'),
+        antes=request.GET.get('antes'),
+        tamanho=AUDITORIAS_POR_PAGINA
+    )
     
-    # Opções para os filtros
-    acoes_disponiveis = Auditoria.AcoesAuditoria.choices
-    usuarios_disponiveis = User.objects.filter(acoes_auditadas__isnull=False).distinct()
+    # Contagem exata só até o limite; acima dele, a estimativa do banco
+    total = contar_com_limite(auditorias, LIMITE_CONTAGEM_AUDITORIA)
+    total_estimado = None
+    if total > LIMITE_CONTAGEM_AUDITORIA:
+        total = None
+        total_estimado = estimar_total(auditorias)
+    
+    parametros = {campo: valor for campo, valor in filtros.items() if valor}
+    filtros_url = urlencode(parametros)
+    url_proxima = None
+    url_anterior = None
+    if pagina['tem_proxima']:
+        url_proxima = '?' + urlencode({**parametros, 'depois': pagina['cursor_proximo']})
+    if pagina['tem_anterior']:
+        url_anterior = '?' + urlencode({**parametros, 'antes': pagina['cursor_anterior']})
     
     context = {
-        'page_obj': page_obj,
-        'acoes_disponiveis': acoes_disponiveis,
-        'usuarios_disponiveis': usuarios_disponiveis,
-        'acao_filtro': acao_filtro,
-        'usuario_filtro': usuario_filtro,
-        'data_inicio': data_inicio,
-        'data_fim': data_fim,
+        'auditorias': pagina['itens'],
+        'total': total,
+        'total_estimado': total_estimado,
+        'limite_contagem': LIMITE_CONTAGEM_AUDITORIA,
+        'url_proxima': url_proxima,
+        'url_anterior': url_anterior,
+        'url_primeira': '?' + filtros_url,
+        'filtros_url': filtros_url,
+        'acoes_disponiveis': Auditoria.AcoesAuditoria.choices,
+        'usuarios_disponiveis': usuarios_auditados(),
+        'acao_filtro': filtros['acao'],
+        'usuario_filtro': filtros['usuario'],
+        'numero_processo_filtro': filtros['numero_processo'],
+        'data_inicio': filtros['data_inicio'],
+        'data_fim': filtros['data_fim'],
     }
     
     return render(request, 'auditoria.html', context)
+
+@ler_da_replica
+@login_required(login_url='login')
+def exportar_auditoria(request):
+    # Mesmos filtros da tela; o arquivo sai em ordem cronológica
+    auditorias = filtrar_auditorias(**_filtros_auditoria(request))
+    formato = request.GET.get('formato')
+    compactar = request.GET.get('gzip') == '1'
+    
+    # O arquivo é gerado e enviado aos poucos, lendo o banco em lotes
+    if formato == 'jsonl':
+        conteudo = gerar_jsonl_auditoria(auditorias)
+        content_type = 'application/x-ndjson'
+        nome_arquivo = 'auditoria.jsonl'
+    else:
+        conteudo = gerar_csv_auditoria(auditorias)
+        content_type = 'text/csv'
+        nome_arquivo = 'auditoria.csv'
+    
+    if compactar:
+        response = StreamingHttpResponse(compactar_gzip(conteudo), content_type='application/gzip')
+        nome_arquivo += '.gz'
+    else:
+        response = StreamingHttpResponse(conteudo, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{nome_arquivo}"'
+    return response